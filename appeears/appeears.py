@@ -1,21 +1,28 @@
 import argparse
+import bisect
+import codecs
+import csv
 import datetime
+import email.utils
 import getpass
+import hashlib
 import json
+import math
 import os
+import random
+import re
 import sys
+import threading
 import time
+from collections import namedtuple
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache, partial
 from itertools import groupby
-from operator import itemgetter
+from operator import attrgetter, itemgetter
 from os.path import expanduser
 
-import pkg_resources
-import pygeoj
-import requests
-from bs4 import BeautifulSoup
-from natsort import natsorted
-from tabulate import tabulate
-from tqdm import tqdm
+# third party imports are deferred to the functions using them so that
+# startup and --help stay fast
 
 
 class Solution:
@@ -34,19 +41,65 @@ class Solution:
 
 ob1 = Solution()
 
-# Get package version
+# local state such as the version check lives here
+state_dir = expanduser("~/.appeears")
+
+
+# installed package version without scanning every distribution
+def installed_version():
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:
+        from appeears import __version__
+
+        return __version__
+    try:
+        return version("appeears")
+    except PackageNotFoundError:
+        from appeears import __version__
+
+        return __version__
+
 
+# fetch latest release from pypi and record when we last checked
+def refresh_latest_version(state_file):
+    import requests
 
+    state = {"checked": time.time()}
+    try:
+        response = requests.get("https://pypi.org/pypi/appeears/json", timeout=5)
+        state["latest"] = response.json()["info"]["version"]
+    except Exception:
+        pass
+    try:
+        os.makedirs(state_dir, exist_ok=True)
+        write_json_atomic(state_file, state)
+    except OSError:
+        pass
+
+
+# Get package version
+# compare against the last known pypi release and refresh it in the
+# background at most once a day so no command waits on the network
 def appeears_version():
-    url = "https://pypi.org/project/appeears/"
-    source = requests.get(url)
-    html_content = source.text
-    soup = BeautifulSoup(html_content, "html.parser")
-    company = soup.find("h1")
-    vcheck = ob1.compareVersion(
-        company.string.strip().split(" ")[-1],
-        pkg_resources.get_distribution("appeears").version,
-    )
+    state_file = os.path.join(state_dir, "version.json")
+    try:
+        with open(state_file) as json_file:
+            state = json.load(json_file)
+    except (OSError, ValueError):
+        state = {}
+    if time.time() - state.get("checked", 0) > 24 * 3600:
+        threading.Thread(
+            target=refresh_latest_version, args=(state_file,), daemon=True
+        ).start()
+    latest = state.get("latest")
+    if latest is None:
+        return
+    current = installed_version()
+    try:
+        vcheck = ob1.compareVersion(latest, current)
+    except ValueError:
+        return
     if vcheck == 1:
         print(
             "\n"
@@ -54,8 +107,8 @@ def appeears_version():
         )
         print(
             "Current version of appeears is {} upgrade to lastest version: {}".format(
-                pkg_resources.get_distribution("appeears").version,
-                company.string.strip().split(" ")[-1],
+                current,
+                latest,
             )
         )
         print(
@@ -68,8 +121,8 @@ def appeears_version():
         )
         print(
             "Possibly running staging code {} compared to pypi release {}".format(
-                pkg_resources.get_distribution("appeears").version,
-                company.string.strip().split(" ")[-1],
+                current,
+                latest,
             )
         )
         print(
@@ -77,8 +130,6 @@ def appeears_version():
         )
 
 
-appeears_version()
-
 error_codes = {
     400: "Bad Request - The request could not be understood by the server due to malformed syntax.",
     401: "Unauthorized - Your API key is wrong.",
@@ -102,6 +153,13 @@ def humansize(nbytes):
     return "%s %s" % (f, suffixes[i])
 
 
+# token cache stored next to the credentials file
+token_cache = expanduser("~/appeears_token.json")
+
+# refresh the cached token this many seconds before it expires
+token_refresh_margin = 3600
+
+
 # set credentials
 def auth():
     home = expanduser("~/appeears.json")
@@ -110,6 +168,10 @@ def auth():
     data = {"username": usr, "password": pwd}
     with open(home, "w") as outfile:
         json.dump(data, outfile)
+    ## drop any token issued for the previous credentials ##
+    if os.path.exists(token_cache):
+        with file_lock(token_cache):
+            os.remove(token_cache)
     print('Authentication credentials saved')
 
 
@@ -117,69 +179,986 @@ def auth_from_parser(args):
     auth()
 
 
-# generate token since token expires every 48 hours
-def tokenizer():
+# exclusive lock on a sidecar lock file, shared by concurrent CLI processes
+@contextmanager
+def file_lock(path):
+    with open(path + ".lock", "a+") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+# write json to a temporary file and move it into place
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as outfile:
+        json.dump(data, outfile)
+    os.replace(tmp_path, path)
+
+
+def read_token_cache():
+    try:
+        with open(token_cache) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return {}
+
+
+# login and return token with expiry as epoch seconds, tokenizer asks
+# for missing credentials before it takes the token cache lock
+def login():
     home = expanduser("~/appeears.json")
-    if not os.path.exists(home):
+    with open(home) as json_file:
+        data = json.load(json_file)
+        username = data.get("username")
+        pwd = data.get("password")
+    token_response = get_client().json(
+        "post", "login", authorized=False, auth=(username, pwd))
+    try:
+        expires = datetime.datetime.strptime(
+            token_response["expiration"], "%Y-%m-%dT%H:%M:%SZ"
+        ).replace(tzinfo=datetime.timezone.utc).timestamp()
+    except (KeyError, TypeError, ValueError):
+        expires = time.time() + 48 * 3600
+    return token_response["token"], expires
+
+
+# get cached token or generate one since token expires every 48 hours
+# pass the rejected token as stale to force a refresh after a 401
+def tokenizer(stale=None):
+    def usable(cached):
+        return (
+            cached.get("token") is not None
+            and cached.get("token") != stale
+            and cached.get("expires", 0) - time.time() > token_refresh_margin
+        )
+
+    os.makedirs(os.path.dirname(token_cache), exist_ok=True)
+    # auth drops the token cache under its lock, so it must not run
+    # while this process holds that lock
+    if not os.path.exists(expanduser("~/appeears.json")) and not usable(read_token_cache()):
         auth()
-        with open(home) as json_file:
-            data = json.load(json_file)
-            username = data.get("username")
-            pwd = data.get("password")
+    with file_lock(token_cache):
+        cached = read_token_cache()
+        if usable(cached):
+            return cached["token"]
+        token, expires = login()
+        write_json_atomic(token_cache, {"token": token, "expires": expires})
+        if os.name != "nt":
+            os.chmod(token_cache, 0o600)
+        return token
+
+
+default_api_url = "https://appeears.earthdatacloud.nasa.gov/api"
+
+# base url of the api, set with --api-url or APPEEARS_API_URL to point the
+# client at another deployment or a local mock server
+api_url = default_api_url
+
+
+class AppEEARSError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+# raise AppEEARSError for error responses with the message from the api
+def check_response(response):
+    if response.status_code in error_codes.keys() or response.status_code >= 400:
+        try:
+            message = response.json()["message"]
+        except (ValueError, KeyError, TypeError):
+            message = response.text
+        raise AppEEARSError(response.status_code, message)
+    return response
+
+
+# raised when a downloaded file does not match its size or checksum
+class IntegrityError(AppEEARSError):
+    def __init__(self, filepath, message):
+        super().__init__(None, f"{os.path.basename(filepath)} {message}")
+        self.filepath = filepath
+
+    def __str__(self):
+        return self.message
+
+
+class CircuitOpenError(AppEEARSError):
+    def __init__(self, endpoint, retry_in):
+        super().__init__(
+            503, f"Circuit open for {endpoint}, retry in {retry_in:.0f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class RetryPolicy:
+    """When and how long to wait before retrying a request.
+
+    Throttled (429) and unavailable (503) responses are retried for every
+    method since the server did not act on them, other server errors and
+    connection errors only for idempotent methods. Waits follow the
+    Retry-After header when present and exponential backoff with full
+    jitter otherwise.
+    """
+
+    idempotent_methods = ["GET", "HEAD", "DELETE", "PUT", "OPTIONS"]
+
+    def __init__(self, retries=5, backoff=0.5, max_backoff=60,
+                 retry_statuses=(429, 503), idempotent_statuses=(500, 502, 504)):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = retry_statuses
+        self.idempotent_statuses = idempotent_statuses
+
+    def retry_status(self, method, status_code, attempt):
+        if attempt >= self.retries:
+            return False
+        if status_code in self.retry_statuses:
+            return True
+        return status_code in self.idempotent_statuses and method.upper() in self.idempotent_methods
+
+    def retry_error(self, method, attempt):
+        return attempt < self.retries and method.upper() in self.idempotent_methods
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                try:
+                    when = email.utils.parsedate_to_datetime(retry_after)
+                    return min(max(when.timestamp() - time.time(), 0), self.max_backoff)
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class TokenBucket:
+    """Token bucket whose rate adapts to throttling.
+
+    The rate halves on a 429, at most once a second so that a burst of
+    concurrent rejections counts once, and grows back by a twentieth on
+    every success so that callers settle just under the rate the server
+    accepts.
+    """
+
+    def __init__(self, rate=20.0, burst=40, min_rate=0.5, max_rate=None):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.decreased = 0.0
+        self.lock = threading.Lock()
+
+    # reserve tokens and return how long the caller has to wait for them
+    def reserve(self, tokens=1):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens = self.tokens - tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def throttled(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.decreased >= 1:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.decreased = now
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.rate / 20)
+
+
+class CircuitBreaker:
+    """Stops sending requests to an endpoint that keeps failing.
+
+    Opens after a run of consecutive failures, rejects calls until the
+    cooldown passes and then lets one trial request through.
+    """
+
+    def __init__(self, threshold=10, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    # seconds until the circuit accepts requests again, 0 when closed
+    def blocked_for(self):
+        with self.lock:
+            if self.opened is None:
+                return 0
+            remaining = self.opened + self.cooldown - time.monotonic()
+            if remaining > 0 or self.trial:
+                return max(remaining, 1)
+            self.trial = True
+            return 0
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failed(self):
+        with self.lock:
+            self.failures = self.failures + 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened = time.monotonic()
+                self.trial = False
+
+
+class RequestGovernor:
+    """Retry policy, rate limits and circuit breakers for one client.
+
+    Rate limits and breakers are kept per endpoint, the first path
+    segment such as task, status or bundle, so a failing download
+    endpoint does not block status polls. Counters are kept in stats.
+    """
+
+    def __init__(self, policy=None, rate=20.0, burst=40, threshold=10, cooldown=30):
+        self.policy = policy or RetryPolicy()
+        self.rate = rate
+        self.burst = burst
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.buckets = {}
+        self.breakers = {}
+        self.stats = {"requests": 0, "retries": 0,
+                      "throttled": 0, "circuit_open": 0}
+        self.lock = threading.Lock()
+
+    def endpoint(self, url):
+        path = url.split("://", 1)[-1].split("/", 1)[-1].split("?")[0]
+        parts = [part for part in path.split("/") if part]
+        if "api" in parts:
+            parts = parts[parts.index("api") + 1:]
+        return parts[0] if parts else ""
+
+    def limits(self, endpoint):
+        with self.lock:
+            if endpoint not in self.buckets:
+                self.buckets[endpoint] = TokenBucket(self.rate, self.burst)
+                self.breakers[endpoint] = CircuitBreaker(
+                    self.threshold, self.cooldown)
+            return self.buckets[endpoint], self.breakers[endpoint]
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] = self.stats[key] + 1
+
+    # raise if the circuit is open else return the rate limit wait
+    def before(self, endpoint):
+        bucket, breaker = self.limits(endpoint)
+        blocked = breaker.blocked_for()
+        if blocked > 0:
+            self.count("circuit_open")
+            raise CircuitOpenError(endpoint, blocked)
+        self.count("requests")
+        return bucket.reserve()
+
+    def after(self, endpoint, status_code=None):
+        bucket, breaker = self.limits(endpoint)
+        if status_code == 429:
+            self.count("throttled")
+            bucket.throttled()
+        elif status_code is None or status_code >= 500:
+            breaker.failed()
+        else:
+            bucket.succeeded()
+            breaker.succeeded()
+
+
+class AppEEARSClient:
+    """Synchronous AppEEARS API client.
+
+    Owns one pooled requests session, the base url, request timeouts,
+    the bearer token, which is refreshed once on a 401, and a
+    RequestGovernor which retries, rate limits and circuit breaks every
+    request.
+    """
+
+    def __init__(self, base_url=None, pool_size=32, timeout=(10, 300), governor=None):
+        import requests
+
+        from appeears import metrics
+
+        self.base_url = (base_url or api_url).rstrip("/")
+        self.timeout = timeout
+        self.governor = governor or RequestGovernor()
+        self.metrics = metrics.recorder
+        self.token = None
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        if self.metrics is not None:
+            adapter = metrics.timed_adapter(
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+            )
+        else:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+            )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path):
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    # pass the rejected token as stale to force a refresh
+    def auth_token(self, stale=None):
+        with self.lock:
+            if self.token is None or self.token == stale:
+                self.token = tokenizer(stale=stale)
+            return self.token
+
+    # send a request through the governor, retrying throttled, failed
+    # and unreachable requests as the retry policy allows
+    def send(self, method, url, **kwargs):
+        import requests
+
+        endpoint = self.governor.endpoint(url)
+        policy = self.governor.policy
+        attempt = 0
+        while True:
+            wait = self.governor.before(endpoint)
+            if wait > 0:
+                time.sleep(wait)
+            if self.metrics is not None:
+                self.metrics.start()
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.metrics is not None:
+                    self.metrics.failed(e, method, endpoint, url, attempt, started)
+                self.governor.after(endpoint)
+                if not policy.retry_error(method, attempt):
+                    raise
+            else:
+                if self.metrics is not None:
+                    self.metrics.observe(response, method, endpoint, url, attempt, started,
+                                         kwargs.get("stream", False))
+                self.governor.after(endpoint, response.status_code)
+                if not policy.retry_status(method, response.status_code, attempt):
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+                time.sleep(policy.delay(attempt, retry_after))
+                self.governor.count("retries")
+                attempt = attempt + 1
+                continue
+            time.sleep(policy.delay(attempt))
+            self.governor.count("retries")
+            attempt = attempt + 1
+
+    def request(self, method, path, authorized=True, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        headers = dict(kwargs.pop("headers", None) or {})
+        if not authorized:
+            return self.send(method, self.url(path), headers=headers, **kwargs)
+        token = self.auth_token()
+        headers["Authorization"] = f"Bearer {token}"
+        response = self.send(
+            method, self.url(path), headers=headers, **kwargs)
+        if response.status_code == 401:
+            headers["Authorization"] = f"Bearer {self.auth_token(stale=token)}"
+            response = self.send(
+                method, self.url(path), headers=headers, **kwargs)
+        return response
+
+    # session style get so download_file can stream through the governor
+    def get(self, url, **kwargs):
+        return self.request("get", url, authorized=False, **kwargs)
+
+    def json(self, method, path, authorized=True, **kwargs):
+        response = check_response(
+            self.request(method, path, authorized=authorized, **kwargs))
+        if response.status_code == 204 or len(response.content) == 0:
+            return None
+        return response.json()
+
+    def products(self):
+        return self.json("get", "product", authorized=False)
+
+    def layers(self, pid):
+        return self.json("get", f"product/{pid}", authorized=False)
+
+    def projections(self):
+        return self.json("get", "spatial/proj", authorized=False)
+
+    def tasks(self, **params):
+        return self.json("get", "task", params=params or None)
+
+    def task(self, tid):
+        return self.json("get", f"task/{tid}")
+
+    def status(self, tid):
+        return self.json("get", f"status/{tid}")
+
+    def bundle(self, tid):
+        return self.json("get", f"bundle/{tid}")
+
+    def submit(self, payload):
+        return self.json("post", "task", json=payload)
+
+    def delete(self, tid):
+        return self.json("delete", f"task/{tid}")
+
+    def file_url(self, tid, file_id):
+        return self.url(f"bundle/{tid}/{file_id}")
+
+
+class AsyncAppEEARSClient:
+    """Asyncio AppEEARS API client built on aiohttp.
+
+    Mirrors AppEEARSClient so that many calls can be fanned out from one
+    event loop, for example with asyncio.gather. Use it as an async
+    context manager so the connection pool is closed afterwards.
+    """
+
+    def __init__(self, base_url=None, limit=100, timeout=300, governor=None):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError(
+                "AsyncAppEEARSClient requires aiohttp: pip install appeears[async]")
+        from appeears import metrics
+
+        self.aiohttp = aiohttp
+        self.base_url = (base_url or api_url).rstrip("/")
+        self.limit = limit
+        self.timeout = timeout
+        self.governor = governor or RequestGovernor()
+        self.metrics = metrics.recorder
+        self.trace_configs = [metrics.aiohttp_trace(aiohttp)] if self.metrics is not None else []
+        self.token = None
+        self.lock = None
+        self.session = None
+
+    async def __aenter__(self):
+        import asyncio
+
+        self.lock = asyncio.Lock()
+        self.session = self.aiohttp.ClientSession(
+            connector=self.aiohttp.TCPConnector(limit=self.limit),
+            timeout=self.aiohttp.ClientTimeout(total=self.timeout),
+            trace_configs=self.trace_configs,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    def url(self, path):
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def auth_token(self, stale=None):
+        import asyncio
+
+        async with self.lock:
+            if self.token is None or self.token == stale:
+                self.token = await asyncio.get_running_loop().run_in_executor(
+                    None, tokenizer, stale)
+            return self.token
+
+    # open a response once retries and a token refresh on 401 are done,
+    # requests go through the same governor as the synchronous client
+    # and the caller reads the body
+    @asynccontextmanager
+    async def stream(self, method, path, authorized=True, **kwargs):
+        import asyncio
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        token = None
+        refreshed = False
+        if authorized:
+            token = await self.auth_token()
+            headers["Authorization"] = f"Bearer {token}"
+        url = self.url(path)
+        endpoint = self.governor.endpoint(url)
+        policy = self.governor.policy
+        attempt = 0
+        opened = False
+        while True:
+            wait = self.governor.before(endpoint)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            timings = {}
+            headers_at = None
+            started = time.perf_counter()
+            try:
+                async with self.session.request(method, url, headers=headers,
+                                                trace_request_ctx=timings, **kwargs) as response:
+                    headers_at = time.perf_counter() - started
+                    self.governor.after(endpoint, response.status)
+                    if response.status == 401 and token is not None and not refreshed:
+                        if self.metrics is not None:
+                            self.metrics.observe_async(
+                                timings, method, endpoint, url, attempt, started, headers_at, 401)
+                        token = await self.auth_token(stale=token)
+                        headers["Authorization"] = f"Bearer {token}"
+                        refreshed = True
+                        continue
+                    if policy.retry_status(method, response.status, attempt):
+                        delay = policy.delay(
+                            attempt, response.headers.get("Retry-After"))
+                        if self.metrics is not None:
+                            self.metrics.observe_async(
+                                timings, method, endpoint, url, attempt, started, headers_at,
+                                response.status)
+                    else:
+                        opened = True
+                        try:
+                            yield response
+                        finally:
+                            if self.metrics is not None:
+                                self.metrics.observe_async(
+                                    timings, method, endpoint, url, attempt, started, headers_at,
+                                    response.status, nbytes=response.content.total_bytes)
+                        return
+            except (self.aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                # errors while the caller reads the body are not retried
+                if opened:
+                    raise
+                if self.metrics is not None:
+                    self.metrics.observe_async(
+                        timings, method, endpoint, url, attempt, started, headers_at,
+                        error=type(e).__name__)
+                self.governor.after(endpoint)
+                if not policy.retry_error(method, attempt):
+                    raise
+                delay = policy.delay(attempt)
+            self.governor.count("retries")
+            await asyncio.sleep(delay)
+            attempt = attempt + 1
+
+    # returns status code, headers and decoded json body
+    async def request(self, method, path, authorized=True, **kwargs):
+        async with self.stream(method, path, authorized=authorized, **kwargs) as response:
+            body = await response.read()
+        try:
+            data = json.loads(body) if len(body) > 0 else None
+        except ValueError:
+            data = body.decode(errors="replace")
+        return response.status, response.headers, data
+
+    async def json(self, method, path, authorized=True, **kwargs):
+        status, headers, data = await self.request(
+            method, path, authorized=authorized, **kwargs)
+        if status in error_codes.keys() or status >= 400:
+            message = data.get("message") if isinstance(
+                data, dict) else data
+            raise AppEEARSError(status, message)
+        return data
+
+    async def products(self):
+        return await self.json("get", "product", authorized=False)
+
+    async def layers(self, pid):
+        return await self.json("get", f"product/{pid}", authorized=False)
+
+    async def projections(self):
+        return await self.json("get", "spatial/proj", authorized=False)
+
+    async def tasks(self, **params):
+        return await self.json("get", "task", params=params or None)
+
+    async def task(self, tid):
+        return await self.json("get", f"task/{tid}")
+
+    async def status(self, tid):
+        return await self.json("get", f"status/{tid}")
+
+    async def bundle(self, tid):
+        return await self.json("get", f"bundle/{tid}")
+
+    async def submit(self, payload):
+        return await self.json("post", "task", json=payload)
+
+    async def delete(self, tid):
+        return await self.json("delete", f"task/{tid}")
+
+    # stream one bundle file to a part file, resuming it with a range
+    # request, verify it against the size and checksum when given and
+    # move it into place, returns the bytes written and SHA-256 like
+    # download_file
+    async def download(self, tid, file_id, filepath, chunk_size=1024 * 1024, checksum=None,
+                       file_size=None):
+        partpath = filepath + ".part"
+        existing = os.path.getsize(partpath) if os.path.exists(partpath) else 0
+        if file_size is not None and existing > file_size:
+            existing = 0
+        digest = hashlib.sha256()
+        if existing > 0:
+            with open(partpath, "rb") as f:
+                for data in iter(lambda: f.read(MAX_CHUNK_SIZE), b""):
+                    digest.update(data)
+        written = 0
+        if file_size is None or existing < file_size:
+            headers = {"Range": f"bytes={existing}-"} if existing > 0 else {}
+            async with self.stream("get", f"bundle/{tid}/{file_id}", headers=headers) as response:
+                if response.status == 416 and existing > 0:
+                    # the part file is at least as long as the file, it
+                    # cannot be verified without a size so start over
+                    os.remove(partpath)
+                    return await self.download(tid, file_id, filepath, chunk_size=chunk_size,
+                                               checksum=checksum, file_size=file_size)
+                if response.status >= 400:
+                    raise AppEEARSError(response.status, await response.text())
+                if response.status == 206:
+                    mode = "ab"
+                else:
+                    # server ignored the range header, start the file over
+                    digest = hashlib.sha256()
+                    existing = 0
+                    mode = "wb"
+                if file_size is None and response.content_length is not None:
+                    file_size = existing + response.content_length
+                with open(partpath, mode) as f:
+                    async for data in response.content.iter_chunked(chunk_size):
+                        f.write(data)
+                        digest.update(data)
+                        written = written + len(data)
+        size = os.path.getsize(partpath) if os.path.exists(partpath) else 0
+        # a short part file is kept so the next call resumes it, anything
+        # else that fails verification is removed so it starts over
+        if file_size is not None and size != file_size:
+            if size > file_size:
+                os.remove(partpath)
+            raise IntegrityError(
+                filepath, f"expected {file_size} bytes, received {size}")
+        sha256 = digest.hexdigest()
+        if checksum is not None and sha256 != checksum.lower():
+            os.remove(partpath)
+            raise IntegrityError(filepath, "SHA-256 does not match the bundle")
+        os.replace(partpath, filepath)
+        return written, sha256
+
+
+shared_client = None
+shared_client_lock = threading.Lock()
+
+
+# client shared by every command in this process
+def get_client():
+    global shared_client
+    with shared_client_lock:
+        if shared_client is None:
+            shared_client = AppEEARSClient()
+        return shared_client
+
+
+# on disk cache for static metadata like the product catalog and layers
+cache_dir = os.path.join(state_dir, "cache")
+
+# revalidate cached metadata with the server once it is older than this
+metadata_ttl = 24 * 3600
+
+
+def cache_path(endpoint):
+    return os.path.join(cache_dir, endpoint.strip("/").replace("/", "_") + ".json")
+
+
+def read_cache(endpoint):
+    try:
+        with open(cache_path(endpoint)) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+# get metadata from the local cache, revalidating stale entries with
+# ETag and If-Modified-Since so unchanged metadata is not downloaded again
+def cached_metadata(endpoint, offline=False, refresh=False):
+    entry = read_cache(endpoint)
+    if entry is not None and (
+        offline or (not refresh and time.time() -
+                    entry["fetched"] < metadata_ttl)
+    ):
+        return entry["data"]
+    if offline:
+        sys.exit(
+            f"No cached metadata for {endpoint}: run once without --offline")
+    headers = {}
+    if entry is not None and entry.get("etag") is not None:
+        headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry.get("last_modified") is not None:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    response = get_client().request(
+        "get", endpoint, authorized=False, headers=headers)
+    if response.status_code == 304 and entry is not None:
+        entry["fetched"] = time.time()
+    else:
+        check_response(response)
+        entry = {
+            "endpoint": endpoint,
+            "fetched": time.time(),
+            "modified": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "data": response.json(),
+        }
+    os.makedirs(cache_dir, exist_ok=True)
+    write_json_atomic(cache_path(endpoint), entry)
+    return entry["data"]
+
+
+# product catalog as a list of product dicts
+def product_list(offline=False):
+    return cached_metadata("product", offline=offline)
+
+
+# layer dict for a product id
+def product_layers(pid, offline=False):
+    return cached_metadata(f"product/{pid}", offline=offline)
+
+
+# product fields covered by the search index and their ranking weight
+index_fields = {
+    "ProductAndVersion": 4,
+    "Platform": 3,
+    "Description": 1,
+    "TemporalGranularity": 2,
+    "Resolution": 2,
+}
+
+# short names usable in field qualified searches like platform:terra
+field_aliases = {
+    "product": "ProductAndVersion",
+    "pid": "ProductAndVersion",
+    "platform": "Platform",
+    "desc": "Description",
+    "description": "Description",
+    "temporal": "TemporalGranularity",
+    "granularity": "TemporalGranularity",
+    "res": "Resolution",
+    "resolution": "Resolution",
+}
+
+product_index_file = os.path.join(cache_dir, "product.index")
+
+
+# point the module at another api, tokens and cached metadata of other
+# servers are kept under ~/.appeears/hosts so they never mix with NASA's
+def set_api_url(url):
+    global api_url, token_cache, cache_dir, product_index_file, shared_client
+    api_url = url.rstrip("/")
+    if api_url == default_api_url:
+        token_cache = expanduser("~/appeears_token.json")
+        cache_dir = os.path.join(state_dir, "cache")
     else:
-        with open(home) as json_file:
-            data = json.load(json_file)
-            username = data.get("username")
-            pwd = data.get("password")
-    response = requests.post(
-        "https://appeears.earthdatacloud.nasa.gov/api/login", auth=(username, pwd)
+        host_dir = os.path.join(
+            state_dir, "hosts", re.sub(r"[^A-Za-z0-9.-]+", "_", api_url.split("://", 1)[-1]))
+        token_cache = os.path.join(host_dir, "token.json")
+        cache_dir = os.path.join(host_dir, "cache")
+    product_index_file = os.path.join(cache_dir, "product.index")
+    with shared_client_lock:
+        shared_client = None
+
+
+if os.environ.get("APPEEARS_API_URL"):
+    set_api_url(os.environ["APPEEARS_API_URL"])
+
+
+def tokenize(value):
+    value = str(value).lower()
+    tokens = re.findall(r"[a-z0-9]+", value)
+    if "." in value and " " not in value:
+        tokens.append(value)
+    return tokens
+
+
+# resolution in meters from values like 500m, 1km or 0.05 deg
+def resolution_meters(value):
+    match = re.match(
+        r"\s*([0-9]*\.?[0-9]+)\s*(km|m|deg|degree|degrees|°)?", str(value).lower())
+    if match is None:
+        return None
+    number = float(match.group(1))
+    unit = match.group(2) or "m"
+    if unit == "km":
+        return number * 1000
+    if unit != "m":
+        return number * 111320
+    return number
+
+
+# build an inverted index of token -> product positions for each field
+def build_product_index(product_response, modified=None):
+    products = [p["ProductAndVersion"] for p in product_response]
+    tokens = {field: {} for field in index_fields}
+    for position, product in enumerate(product_response):
+        for field in index_fields:
+            terms = set(tokenize(product.get(field, "")))
+            if field == "ProductAndVersion":
+                terms.add(product[field].lower())
+            for token in terms:
+                tokens[field].setdefault(token, []).append(position)
+    return {
+        "modified": modified,
+        "products": products,
+        "resolution": [resolution_meters(p.get("Resolution", "")) for p in product_response],
+        "tokens": tokens,
+        "vocabulary": {field: sorted(tokens[field]) for field in tokens},
+    }
+
+
+# load the search index stored next to the catalog cache, rebuilding it
+# whenever the cached catalog changed
+def product_index(offline=False):
+    product_response = product_list(offline=offline)
+    modified = (read_cache("product") or {}).get("modified")
+    try:
+        with open(product_index_file) as json_file:
+            index = json.load(json_file)
+        if index.get("modified") == modified and modified is not None:
+            return index, product_response
+    except (OSError, ValueError):
+        pass
+    index = build_product_index(product_response, modified)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_json_atomic(product_index_file, index)
+    return index, product_response
+
+
+# score products for one term, a dotted term equal to a whole indexed
+# value like MOD13Q1.061 only matches that value, anything else is scored
+# by exact token, prefix and substring matches of its pieces
+def match_term(index, term, fields):
+    whole = str(term).lower()
+    scores = {}
+    if len(tokenize(term)) > 1:
+        for field in fields:
+            for position in index["tokens"][field].get(whole, []):
+                scores[position] = scores.get(position, 0) + 4 * index_fields[field]
+        if scores:
+            return scores
+    for field in fields:
+        weight = index_fields[field]
+        vocabulary = index["vocabulary"][field]
+        postings = index["tokens"][field]
+        for query_token in tokenize(term):
+            matched = {}
+            for position in postings.get(query_token, []):
+                matched[position] = 3
+            start = bisect.bisect_left(vocabulary, query_token)
+            while start < len(vocabulary) and vocabulary[start].startswith(query_token):
+                for position in postings[vocabulary[start]]:
+                    matched.setdefault(position, 2)
+                start = start + 1
+            if len(query_token) > 2:
+                for token in vocabulary:
+                    if query_token in token:
+                        for position in postings[token]:
+                            matched.setdefault(position, 1)
+            for position, score in matched.items():
+                scores[position] = scores.get(position, 0) + score * weight
+    return scores
+
+
+# match a numeric resolution filter like <=500m against all products
+def match_resolution(index, term):
+    match = re.match(r"(<=|>=|<|>|=)?(.+)", term)
+    operator = match.group(1) or "="
+    target = resolution_meters(match.group(2))
+    if target is None:
+        return None
+    compare = {
+        "<=": lambda value: value <= target,
+        ">=": lambda value: value >= target,
+        "<": lambda value: value < target,
+        ">": lambda value: value > target,
+        "=": lambda value: abs(value - target) < 1e-6,
+    }[operator]
+    return {
+        position: 1
+        for position, value in enumerate(index["resolution"])
+        if value is not None and compare(value)
+    }
+
+
+# search products with free text and field qualified terms, all terms
+# must match and results are ranked by match quality
+def search_products(query, offline=False):
+    index, product_response = product_index(offline=offline)
+    scores = None
+    for term in query.split():
+        field = None
+        if ":" in term:
+            name, value = term.split(":", 1)
+            field = field_aliases.get(name.lower())
+        if field == "Resolution" and re.match(r"(<=|>=|<|>|=)", value):
+            term_scores = match_resolution(index, value)
+            if term_scores is None:
+                sys.exit(f"Could not parse resolution filter {term}")
+        elif field is not None:
+            term_scores = match_term(index, value, [field])
+        else:
+            term_scores = match_term(index, term, list(index_fields))
+        if scores is None:
+            scores = term_scores
+        else:
+            scores = {
+                position: scores[position] + score
+                for position, score in term_scores.items()
+                if position in scores
+            }
+    ranked = sorted(
+        (scores or {}).items(), key=lambda item: (-item[1], index["products"][item[0]])
     )
-    if response.status_code in error_codes.keys():
-        print(error_codes.get(response.status_code))
-        sys.exit(response.json()["message"])
-    token_response = response.json()
-    return token_response["token"]
+    return [product_response[position] for position, score in ranked]
 
 
 # get product list
-def products(keyword):
-    response = requests.get(
-        "https://appeears.earthdatacloud.nasa.gov/api/product")
-    if response.status_code in error_codes.keys():
-        print(error_codes.get(response.status_code))
-        sys.exit(response.json()["message"])
-    product_response = response.json()
-    products = {p["ProductAndVersion"]: p for p in product_response}
+def products(keyword, offline=False):
     if keyword is not None:
-        for product in products:
-            product_dict = products[product]
-            uniform_product_dict = dict(
-                (str(k).lower(), str(v).lower()) for k, v in product_dict.items()
-            )
-            if keyword.lower() in uniform_product_dict.values():
-                product_dict["product_id"] = product_dict.pop(
-                    "ProductAndVersion")
-                print(json.dumps(product_dict, indent=2))
+        product_response = search_products(keyword, offline=offline)
     else:
-        for product in products:
-            product_dict = products[product]
-            product_dict["product_id"] = product_dict.pop("ProductAndVersion")
-            print(json.dumps(product_dict, indent=2))
+        product_response = product_list(offline=offline)
+    for product_dict in product_response:
+        product_dict["product_id"] = product_dict.pop("ProductAndVersion")
+        print(json.dumps(product_dict, indent=2))
 
 
 def products_from_parser(args):
-    products(keyword=args.keyword)
+    products(keyword=args.keyword, offline=args.offline)
 
 
 # get layer info from product id
-def layers(pid):
-    response = requests.get(
-        f"https://appeears.earthdatacloud.nasa.gov/api/product/{pid}"
-    )
-    if response.status_code in error_codes.keys():
-        print(error_codes.get(response.status_code))
-        sys.exit(response.json()["message"])
-    layer_response = response.json()
+def layers(pid, offline=False):
+    from tabulate import tabulate
+
+    layer_response = product_layers(pid, offline=offline)
     print(f'Layers for product id {pid}'+'\n')
     layer_list = []
     i = 1
@@ -195,416 +1174,2540 @@ def layers(pid):
 
 
 def layers_from_parser(args):
-    layers(pid=args.pid)
+    layers(pid=args.pid, offline=args.offline)
 
 
 # get spatial projection info
-def spatial():
-    response = requests.get(
-        "https://appeears.earthdatacloud.nasa.gov/api/spatial/proj")
-    proj_response = response.json()
+def spatial(offline=False):
+    proj_response = cached_metadata("spatial/proj", offline=offline)
     print(json.dumps(proj_response, indent=2))
 
 
 def spatial_from_parser(args):
-    spatial()
-
-
-# submit a task task_payload
-payload = {
-    "task_type": "",
-    "task_name": "",
-    "params": {
-        "layers": "",
-        "output": {
-            "format": {
-                "type": "geotiff",
-            },
-            "projection": "geographic",
-        },
-        "dates": [
-            {
-                "startDate": "",
-                "endDate": "",
-                "recurring": False,
-                "yearRange": [
-                    1950,
-                    2050,
-                ],
-            },
-        ],
-        "coordinates": "",
-    },
-}
+    spatial(offline=args.offline)
 
 
-# submit a task
-def tasksubmit(**kwargs):
-    token = tokenizer()
-    for key, value in kwargs.items():
-        if key == "name":
-            payload["task_name"] = value
-        if key == "input":
-            testfile = pygeoj.load(value)
-            coordinates = []
-            for feature in testfile:
-                if feature.geometry.type == "Point":
-                    payload["task_type"] = "point"
-                    lat_long_dict = {
-                        "latitude": feature.geometry.coordinates[1],
-                        "longitude": feature.geometry.coordinates[0],
-                    }
-                    coordinates.append(lat_long_dict)
-                    payload["params"]["coordinates"] = coordinates
-                elif feature.geometry.type == "Polygon":
-                    payload["task_type"] = "area"
-                    geom = {
-                        "geo": {
-                            "type": "FeatureCollection",
-                            "features": [
-                                {
-                                    "type": "Feature",
-                                    "properties": {},
-                                    "geometry": {
-                                        "type": "Polygon",
-                                        "coordinates": feature.geometry.coordinates,
-                                    },
-                                },
-                            ],
-                        },
-                    }
-                    coordinates = feature.geometry.coordinates
-                    payload["params"].pop("coordinates")
-                    payload["params"].update(geom)
-                else:
-                    sys.exit("Unknown geometry type")
-
-        if key == "start":
-            value = datetime.datetime.strptime(
-                value, "%Y-%m-%d").strftime("%m-%d-%Y")
-            payload["params"]["dates"][0]["startDate"] = str(value)
-        if key == "end":
-            value = datetime.datetime.strptime(
-                value, "%Y-%m-%d").strftime("%m-%d-%Y")
-            payload["params"]["dates"][0]["endDate"] = str(value)
-        if key == "recurring":
-            payload["params"]["dates"][0]["recurring"] = bool(value)
-        if key == "projection":
-            payload["params"]["output"]["projection"] = str(value)
-        if key == "product":
-            response = requests.get(
-                f"https://appeears.earthdatacloud.nasa.gov/api/product/{value}"
+# list entries in the metadata cache
+def cache_entries():
+    entries = []
+    if os.path.isdir(cache_dir):
+        for name in sorted(os.listdir(cache_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(cache_dir, name)) as json_file:
+                    entries.append(json.load(json_file))
+            except (OSError, ValueError):
+                continue
+    return entries
+
+
+# manage the local metadata cache
+def cache(action):
+    from tabulate import tabulate
+
+    if action == "refresh":
+        endpoints = ["product", "spatial/proj"]
+        for entry in cache_entries():
+            if entry.get("endpoint") not in endpoints:
+                endpoints.append(entry["endpoint"])
+        for endpoint in endpoints:
+            cached_metadata(endpoint, refresh=True)
+        print(f"Refreshed {len(endpoints)} cached metadata entries")
+    elif action == "clear":
+        entries = cache_entries()
+        for entry in entries:
+            os.remove(cache_path(entry["endpoint"]))
+        for path in [product_index_file, task_cache_path()]:
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"Cleared {len(entries)} cached metadata entries")
+    elif action == "stats":
+        cache_list = []
+        for entry in cache_entries():
+            cache_list.append(
+                {
+                    "Endpoint": entry["endpoint"],
+                    "Size": humansize(os.path.getsize(cache_path(entry["endpoint"]))),
+                    "Age": str(
+                        datetime.timedelta(
+                            seconds=int(time.time() - entry["fetched"]))
+                    ),
+                    "Stale": time.time() - entry["fetched"] >= metadata_ttl,
+                    "ETag": entry.get("etag") or "",
+                }
             )
-            layer_response = response.json()
-            layer_list = []
-            for layer in layer_response:
-                layer_json = {"layer": layer, "product": value}
-                layer_list.append(layer_json)
-            payload["params"]["layers"] = layer_list
-        if key == 'index' and value is not None:
-            index_list = [x-1 for x in value]
-            l_index = []
-            for i in index_list:
-                l_index.append(payload["params"]["layers"][i])
-            if len(l_index) != 0:
-                payload["params"]["layers"] = l_index
+        if len(cache_list) == 0:
+            print(f"No cached metadata in {cache_dir}")
+        else:
+            print(f"Metadata cache in {cache_dir}" + "\n")
+            print(tabulate(cache_list, headers="keys", tablefmt="heavy_grid"))
 
-    #print(json.dumps(payload, indent=2))
 
-    response = requests.post(
-        "https://appeears.earthdatacloud.nasa.gov/api/task",
-        headers={"Authorization": f"Bearer {token}"},
-        json=payload,
-    )
-    if response.status_code in error_codes.keys():
-        print(error_codes.get(response.status_code))
-        sys.exit(response.json()["message"])
+def cache_from_parser(args):
+    cache(action=args.action)
+
+
+# parse geometry geojson file path or dict into task type and params
+def task_geometry(geometry):
+    import pygeoj
+
+    if isinstance(geometry, dict):
+        testfile = pygeoj.load(data=geometry)
     else:
-        print(f"Submitted task with task ID {response.json()['task_id']}")
+        testfile = pygeoj.load(geometry)
+    task_type = None
+    params = {}
+    coordinates = []
+    features = []
+    for feature in testfile:
+        if feature.geometry.type == "Point":
+            task_type = "point"
+            lat_long_dict = {
+                "latitude": feature.geometry.coordinates[1],
+                "longitude": feature.geometry.coordinates[0],
+            }
+            coordinates.append(lat_long_dict)
+            params["coordinates"] = coordinates
+        elif feature.geometry.type in ["Polygon", "MultiPolygon"]:
+            task_type = "area"
+            features.append(
+                {
+                    "type": "Feature",
+                    "properties": {},
+                    "geometry": {
+                        "type": feature.geometry.type,
+                        "coordinates": feature.geometry.coordinates,
+                    },
+                }
+            )
+            params["geo"] = {
+                "type": "FeatureCollection",
+                "features": features,
+            }
+        else:
+            raise ValueError("Unknown geometry type")
+    if task_type is None:
+        raise ValueError("No features found in geometry")
+    return task_type, params
 
 
-def tasksubmit_from_parser(args):
-    tasksubmit(
-        name=args.name,
-        product=args.product,
-        start=args.start,
-        end=args.end,
-        recurring=args.recurring,
-        projection=args.projection,
-        index=args.index,
-        input=args.geometry,
-    )
+# select layers by 1 based index or layer name
+def task_layers(product, index=None, offline=False):
+    layer_response = product_layers(product, offline=offline)
+    layer_list = []
+    for layer in layer_response:
+        layer_json = {"layer": layer, "product": product}
+        layer_list.append(layer_json)
+    if index is None or len(index) == 0:
+        return layer_list
+    l_index = []
+    for i in index:
+        if isinstance(i, int) or str(i).isdigit():
+            if int(i) < 1 or int(i) > len(layer_list):
+                raise ValueError(
+                    f"Layer index {i} out of range for product {product}")
+            l_index.append(layer_list[int(i) - 1])
+        elif i in layer_response:
+            l_index.append({"layer": i, "product": product})
+        else:
+            raise ValueError(f"Layer {i} not found for product {product}")
+    return l_index
 
 
-# delete task using task id
-def delete(tid):
-    token = tokenizer()
-    response = requests.delete(
-        f"https://appeears.earthdatacloud.nasa.gov/api/task/{tid}",
-        headers={"Authorization": f"Bearer {token}"},
-    )
-    if response.status_code in error_codes.keys():
-        print(error_codes.get(response.status_code))
-        sys.exit(response.json()["message"])
-    elif response.status_code == 204:
-        print(f"Task with task id {tid} deleted")
+def parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ["true", "1", "yes"]
+    return bool(value)
 
 
-def delete_from_parser(args):
-    delete(tid=args.tid)
+# output formats accepted for area tasks
+task_formats = ["geotiff", "netcdf4"]
 
 
-# get task status for all tasks and groupby status
-def task_all(status):
-    token = tokenizer()
-    response = requests.get(
-        "https://appeears.earthdatacloud.nasa.gov/api/task",
-        headers={"Authorization": f"Bearer {token}"},
-    )
-    if response.status_code in error_codes.keys():
-        print(error_codes.get(response.status_code))
-        sys.exit(response.json()["message"])
-    status_response = response.json()
-    if len(status_response) != 0:
-        task_list = []
-        for tasks in status_response:
-            if status is not None:
-                if tasks["status"] == status:
-                    task_id = tasks["task_id"]
-                    task_name = tasks["task_name"]
-                    task_status = tasks["status"]
-                    task_layers = []
-                    for layers in tasks["params"]["layers"]:
-                        task_layers.append(layers["layer"])
-                    task_info = {
-                        "task_id": task_id,
-                        "task_name": task_name,
-                        "task_status": task_status,
-                        "task_layers": task_layers,
-                    }
-                    task_list.append(task_info)
-            else:
-                task_id = tasks["task_id"]
-                task_name = tasks["task_name"]
-                task_status = tasks["status"]
-                task_layers = []
-                for layers in tasks["params"]["layers"]:
-                    task_layers.append(layers["layer"])
-                task_info = {
-                    "task_id": task_id,
-                    "task_name": task_name,
-                    "task_status": task_status,
-                    "task_layers": task_layers,
-                }
-                task_list.append(task_info)
-        if len(task_list) == 0 and status is not None:
-            sys.exit(
-                f"No tasks found with status {status} : try processing|done|pending"
-            )
-        task_list = sorted(task_list, key=itemgetter("task_status"))
-        for key, value in groupby(task_list, key=itemgetter("task_status")):
-            print("\n" + f"Task Status :{key.upper()}")
-            for k in value:
-                print(json.dumps(k, indent=2))
-    else:
-        print("No tasks found")
+class TaskSpec(namedtuple(
+        "TaskSpec", ["layers", "start", "end", "recurring", "year_range", "projection", "file_format"])):
+    """Immutable and hashable template of a task without name and geometry.
 
+    layers is a tuple of (product, layer) pairs and start and end are
+    YYYY-MM-DD dates. Build one with TaskSpec.create, which resolves
+    layer indexes and validates everything against the cached metadata,
+    then call payload for every task. A spec round trips through to_dict
+    and to_json so it can be saved once and reused.
+    """
 
-# get all or specific task information
-def task_status(tid, status):
-    token = tokenizer()
-    if tid is not None:
-        response = requests.get(
-            f"https://appeears.earthdatacloud.nasa.gov/api/status/{tid}",
-            headers={"Authorization": f"Bearer {token}"},
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, product, start, end, layers=None, recurring=False, projection="geographic",
+               file_format="geotiff", year_range=(1950, 2050), offline=False):
+        catalog = optional_metadata("product", offline=offline)
+        if catalog is not None and product not in [p["ProductAndVersion"] for p in catalog]:
+            raise ValueError(f"Product {product} not found in product catalog")
+        spec = cls(
+            tuple((product, item["layer"]) for item in task_layers(product, index=layers, offline=offline)),
+            str(start),
+            str(end),
+            parse_bool(recurring),
+            tuple(int(year) for year in year_range),
+            str(projection),
+            str(file_format),
         )
-        if response.status_code in error_codes.keys():
-            print(error_codes.get(response.status_code))
-            sys.exit(response.json()["message"])
-        if response.status_code == 200:
-            status_response = response.json()
-            if (
-                "status" in status_response.keys()
-                and status_response["status"] != "pending"
-            ):
-                print(f"Task status is {status_response['status']}")
-                ## fetch additional info like task name from task_id ##
-                response = requests.get(
-                    "https://appeears.earthdatacloud.nasa.gov/api/task",
-                    headers={"Authorization": f"Bearer {token}"},
-                )
-                if response.status_code in error_codes.keys():
-                    print(error_codes.get(response.status_code))
-                    sys.exit(response.json()["message"])
-                task_response = response.json()
-                if len(task_response) != 0:
-                    for task in task_response:
-                        if task["task_id"] == tid:
-                            task_id = task["task_id"]
-                            task_name = task["task_name"]
-                            task_status = task["status"]
-                            task_layers = []
-                            for layers in task["params"]["layers"]:
-                                task_layers.append(layers["layer"])
-                            task_info = {
-                                "task_id": task_id,
-                                "task_name": task_name,
-                                "task_status": task_status,
-                                "task_layers": task_layers,
-                            }
-                            print(json.dumps(task_info, indent=2))
-            elif "state" not in status_response.keys():
-                print(
-                    f"Task {tid} processing : creating progessbar for task completion"
-                )
-                task_json = status_response
-                for key, value in task_json.items():
-                    if key == "progress":
-                        cur_perc = value["summary"]
-                with tqdm(total=100) as pbar:
-                    while cur_perc < 100:
-                        time.sleep(30)
-                        response = requests.get(
-                            f"https://appeears.earthdatacloud.nasa.gov/api/status/{tid}",
-                            headers={"Authorization": f"Bearer {token}"},
-                        )
-                        if response.status_code in error_codes.keys():
-                            print(error_codes.get(response.status_code))
-                            sys.exit(response.json()["message"])
-                        task_json = response.json()
-                        for key, value in task_json.items():
-                            if key == "progress":
-                                cur_perc = value["summary"]
-                                pbar.update(cur_perc - pbar.n)
-                                if cur_perc == 100:
-                                    break
+        return spec.validate(offline=offline)
+
+    @classmethod
+    def from_dict(cls, data):
+        layers = []
+        for item in data["layers"]:
+            if isinstance(item, dict):
+                layers.append((item["product"], item["layer"]))
             else:
-                print(f"Task status {tid} is {status_response['status']}")
-    else:
-        task_all(status)
+                layers.append((item[0], item[1]))
+        return cls(
+            tuple(layers),
+            str(data["start"]),
+            str(data["end"]),
+            parse_bool(data.get("recurring", False)),
+            tuple(int(year) for year in data.get("year_range", (1950, 2050))),
+            str(data.get("projection", "geographic")),
+            str(data.get("file_format", "geotiff")),
+        )
 
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
 
-def taskinfo_from_parser(args):
-    task_status(tid=args.tid, status=args.status)
+    @classmethod
+    def load(cls, path):
+        with open(path) as json_file:
+            return cls.from_dict(json.load(json_file))
+
+    def to_dict(self):
+        return {
+            "layers": [{"product": product, "layer": layer} for product, layer in self.layers],
+            "start": self.start,
+            "end": self.end,
+            "recurring": self.recurring,
+            "year_range": list(self.year_range),
+            "projection": self.projection,
+            "file_format": self.file_format,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def save(self, path):
+        write_json_atomic(path, self.to_dict())
+
+    @property
+    def products(self):
+        return sorted(set(product for product, _ in self.layers))
+
+    def problems(self, offline=False):
+        """Everything the api would reject, checked against cached metadata."""
+        problems = []
+        try:
+            start = datetime.datetime.strptime(self.start, "%Y-%m-%d").date()
+            end = datetime.datetime.strptime(self.end, "%Y-%m-%d").date()
+        except ValueError:
+            problems.append(f"Dates {self.start} and {self.end} must be in format YYYY-MM-DD")
+            start = end = None
+        if start is not None and start > end:
+            problems.append(f"Start date {self.start} is after end date {self.end}")
+        if len(self.year_range) != 2 or self.year_range[0] > self.year_range[1]:
+            problems.append(f"Year range {list(self.year_range)} must be a first and a last year")
+        if self.file_format not in task_formats:
+            problems.append(
+                f"Output format {self.file_format} is not one of {', '.join(task_formats)}")
+        if not self.layers:
+            problems.append("No layers selected")
+        catalog = optional_metadata("product", offline=offline)
+        catalog = {p["ProductAndVersion"]: p for p in catalog} if catalog is not None else None
+        for product in self.products:
+            if catalog is not None and product not in catalog:
+                problems.append(f"Product {product} not found in product catalog")
+                continue
+            layers = product_layers(product, offline=offline)
+            for name in [layer for pid, layer in self.layers if pid == product]:
+                if name not in layers:
+                    problems.append(f"Layer {name} not found for product {product}")
+            if catalog is None:
+                continue
+            first = iso_date(catalog[product].get("TemporalExtentStart"))
+            last = iso_date(catalog[product].get("TemporalExtentEnd"))
+            if self.recurring:
+                if first is not None and self.year_range[1] < first.year:
+                    problems.append(f"Year range ends before {product} starts on {first}")
+                if last is not None and self.year_range[0] > last.year:
+                    problems.append(f"Year range starts after {product} ends on {last}")
+            elif start is not None:
+                if first is not None and end < first:
+                    problems.append(f"Dates end before {product} starts on {first}")
+                if last is not None and start > last:
+                    problems.append(f"Dates start after {product} ends on {last}")
+        names = [projection.get("Name") for projection in
+                 optional_metadata("spatial/proj", offline=offline) or []]
+        if names and self.projection not in names:
+            problems.append(
+                f"Projection {self.projection} is not one of {', '.join(names)}")
+        return problems
+
+    # the spec itself or ValueError listing every problem
+    def validate(self, offline=False):
+        problems = self.problems(offline=offline)
+        if problems:
+            raise ValueError("; ".join(problems))
+        return self
+
+    def payload(self, name, geometry):
+        """Request json of a task, geometry as accepted by task_payload.
+
+        Every call builds new dicts from the immutable fields, nothing is
+        shared between payloads.
+        """
+        if isinstance(geometry, tuple):
+            task_type, geometry_params = geometry
+        else:
+            task_type, geometry_params = task_geometry(geometry)
+        if self.recurring:
+            start, end = self.start[5:], self.end[5:]
+        else:
+            start = "{}-{}-{}".format(self.start[5:7], self.start[8:10], self.start[:4])
+            end = "{}-{}-{}".format(self.end[5:7], self.end[8:10], self.end[:4])
+        params = {
+            "layers": [{"layer": layer, "product": product} for product, layer in self.layers],
+            "output": {
+                "format": {
+                    "type": self.file_format,
+                },
+                "projection": self.projection,
+            },
+            "dates": [
+                {
+                    "startDate": start,
+                    "endDate": end,
+                    "recurring": self.recurring,
+                    "yearRange": list(self.year_range),
+                },
+            ],
+        }
+        params.update(geometry_params)
+        return {"task_type": task_type, "task_name": name, "params": params}
+
+
+# cached metadata, or None offline when it was never fetched, for checks
+# that are skipped rather than failing without it
+def optional_metadata(endpoint, offline=False):
+    if offline:
+        entry = read_cache(endpoint)
+        return entry["data"] if entry is not None else None
+    return cached_metadata(endpoint)
+
+
+# date of a YYYY-MM-DD string, None for open ends like Present
+def iso_date(value):
+    try:
+        return datetime.datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+# modification times of the cached metadata files, None when one is
+# missing or due for revalidation so the caller goes back to the API
+def metadata_stamp(endpoints, offline=False):
+    stamp = []
+    for endpoint in endpoints:
+        try:
+            modified = os.stat(cache_path(endpoint)).st_mtime
+        except OSError:
+            return None
+        if not offline and time.time() - modified >= metadata_ttl:
+            return None
+        stamp.append(modified)
+    return tuple(stamp)
+
+
+@lru_cache(maxsize=256)
+def stamped_task_spec(product, start, end, layers, recurring, projection, offline, stamp):
+    return TaskSpec.create(product, start, end, layers=layers, recurring=recurring,
+                           projection=projection, offline=offline)
+
+
+# validated specs are reused for rows and pieces sharing product, layers
+# and dates, so batches resolve and check them once; the metadata files
+# are part of the key, so a refetch or cache refresh in another process
+# drops specs built from the old metadata
+def task_spec(product, start, end, layers=None, recurring=False, projection="geographic",
+              offline=False):
+    stamp = metadata_stamp(["product", f"product/{product}", "spatial/proj"], offline)
+    if stamp is None:
+        return TaskSpec.create(product, start, end, layers=layers, recurring=recurring,
+                               projection=projection, offline=offline)
+    return stamped_task_spec(product, start, end, layers, recurring, projection, offline, stamp)
+
+
+# build a new task payload, nothing is shared between calls
+# geometry is a GeoJSON dict or path, or a (task_type, params) pair like
+# the parts of appeears.geometry.prepare_task
+def task_payload(name, product, geometry, start, end, recurring=False,
+                 projection="geographic", index=None, offline=False):
+    spec = task_spec(product, start, end, tuple(index) if index else None,
+                     parse_bool(recurring), str(projection), offline)
+    return spec.payload(name, geometry)
+
+
+# submit a task, with prepare=True the geometry is validated, simplified
+# and point sets over the per task limit are submitted as name-1, name-2, ...
+def tasksubmit(**kwargs):
+    geometries = [kwargs["input"]]
+    try:
+        if kwargs.get("prepare"):
+            from appeears.geometry import max_points, prepare_task
+
+            prepared = prepare_task(
+                kwargs["input"],
+                kwargs["product"],
+                tolerance=kwargs.get("tolerance"),
+                snap=kwargs.get("snap", True),
+                limit=kwargs.get("max_points") or max_points,
+                offline=kwargs.get("offline", False),
+            )
+            print(", ".join(f"{key}: {value}" for key, value in prepared.summary().items()))
+            geometries = prepared.parts
+        names = [kwargs["name"]] if len(geometries) == 1 else [
+            f"{kwargs['name']}-{n}" for n in range(1, len(geometries) + 1)]
+        payloads = [
+            task_payload(
+                name,
+                kwargs["product"],
+                geometry,
+                kwargs["start"],
+                kwargs["end"],
+                recurring=kwargs.get("recurring", False),
+                projection=kwargs.get("projection", "geographic"),
+                index=kwargs.get("index"),
+                offline=kwargs.get("offline", False),
+            )
+            for name, geometry in zip(names, geometries)
+        ]
+    except (ImportError, ValueError) as e:
+        sys.exit(str(e))
+
+    #print(json.dumps(payload, indent=2))
+
+    for payload in payloads:
+        task_response = get_client().submit(payload)
+        print(f"Submitted task with task ID {task_response['task_id']}")
+
+
+def tasksubmit_from_parser(args):
+    tasksubmit(
+        name=args.name,
+        product=args.product,
+        start=args.start,
+        end=args.end,
+        recurring=args.recurring,
+        projection=args.projection,
+        index=args.index,
+        input=args.geometry,
+        offline=args.offline,
+        prepare=args.prepare,
+        tolerance=args.tolerance,
+        snap=not args.no_snap,
+        max_points=args.max_points,
+    )
+
+
+def geometry_from_parser(args):
+    from appeears.geometry import geometry_report, max_points
+
+    geometry_report(
+        geometry=args.geometry,
+        product=args.product,
+        out=args.out,
+        tolerance=args.tolerance,
+        snap=not args.no_snap,
+        limit=args.max_points or max_points,
+        offline=args.offline,
+    )
+
+
+# read manifest rows from a csv or jsonl file
+def read_manifest(manifest):
+    rows = []
+    with open(manifest, newline="") as infile:
+        if manifest.lower().endswith((".jsonl", ".json")):
+            for line in infile:
+                if line.strip():
+                    rows.append(json.loads(line))
+        else:
+            for row in csv.DictReader(infile):
+                rows.append(row)
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    for row in rows:
+        geometry = row.get("geometry")
+        if isinstance(geometry, str) and geometry.strip().startswith("{"):
+            row["geometry"] = json.loads(geometry)
+        elif isinstance(geometry, str) and not os.path.isabs(geometry):
+            row["geometry"] = os.path.join(base_dir, geometry)
+        layers = row.get("layers")
+        if isinstance(layers, str):
+            row["layers"] = [
+                layer for layer in re.split(r"[\s;|]+", layers) if layer]
+    return rows
+
+
+# post a task payload, throttling is retried by the client governor
+def submit_payload(payload, client=None):
+    return (client or get_client()).submit(payload)["task_id"]
+
+
+# task payload of one manifest row, rows without a product take
+# everything but name and geometry from spec
+def manifest_payload(row, offline=False, spec=None):
+    if spec is not None and not row.get("product"):
+        return spec.payload(row["name"], row["geometry"])
+    return task_payload(
+        row["name"],
+        row["product"],
+        row["geometry"],
+        row["start"],
+        row["end"],
+        recurring=row.get("recurring") or False,
+        projection=row.get("projection") or "geographic",
+        index=row.get("layers"),
+        offline=offline,
+    )
+
+
+# build and submit one manifest row
+def submit_manifest_row(row, client=None, offline=False, spec=None):
+    return submit_payload(manifest_payload(row, offline, spec), client=client)
+
+
+# submit every task in a manifest through a bounded pool of workers and
+# record the task id for each row in a jsonl ledger
+def tasksubmit_batch(manifest, ledger=None, workers=4, offline=False, spec=None):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    if spec is not None and not isinstance(spec, TaskSpec):
+        try:
+            spec = TaskSpec.load(spec).validate(offline=offline)
+        except (OSError, KeyError, ValueError) as e:
+            sys.exit(f"Invalid task spec {spec}: {e}")
+    rows = read_manifest(manifest)
+    ledger = ledger or os.path.splitext(manifest)[0] + "_ledger.jsonl"
+    done = set()
+    if os.path.exists(ledger):
+        with open(ledger) as infile:
+            for line in infile:
+                if line.strip():
+                    record = json.loads(line)
+                    if record.get("task_id") is not None:
+                        done.add(record["row"])
+    pending = [(i, row) for i, row in enumerate(rows, start=1) if i not in done]
+    if len(done) > 0:
+        print(f"Skipping {len(rows) - len(pending)} rows already in {ledger}")
+    client = get_client()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor, open(ledger, "a") as outfile:
+        futures = {
+            executor.submit(submit_manifest_row, row, client, offline, spec): (i, row)
+            for i, row in pending
+        }
+        for future in as_completed(futures):
+            i, row = futures[future]
+            record = {"row": i, "name": row.get("name"),
+                      "product": row.get("product") or (
+                          " ".join(spec.products) if spec is not None else None)}
+            try:
+                record["task_id"] = future.result()
+                record["status"] = "submitted"
+                print(
+                    f"Submitted row {i} {record['name']} with task ID {record['task_id']}")
+            except Exception as e:
+                record["task_id"] = None
+                record["status"] = "failed"
+                record["error"] = str(e)
+                print(f"Failed to submit row {i} {record['name']}: {e}")
+            outfile.write(json.dumps(record) + "\n")
+            outfile.flush()
+            results.append(record)
+    failed = [record for record in results if record["status"] == "failed"]
+    print(
+        f"Submitted {len(results) - len(failed)} of {len(pending)} tasks, ledger written to {ledger}")
+    return sorted(results, key=itemgetter("row"))
+
+
+def tasksubmit_batch_from_parser(args):
+    tasksubmit_batch(
+        manifest=args.manifest,
+        ledger=args.ledger,
+        workers=args.workers,
+        offline=args.offline,
+        spec=args.spec,
+    )
+
+
+# validate a task spec locally, print it and optionally save it for reuse
+def taskspec(product, start, end, index=None, projection="geographic", recurring=False,
+             file_format="geotiff", out=None, offline=False):
+    try:
+        spec = TaskSpec.create(product, start, end, layers=index, recurring=recurring,
+                               projection=projection, file_format=file_format, offline=offline)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(json.dumps(spec.to_dict(), indent=2))
+    if out is not None:
+        spec.save(out)
+        print(f"Task spec written to {out}")
+    return spec
+
+
+def taskspec_from_parser(args):
+    taskspec(
+        product=args.product,
+        start=args.start,
+        end=args.end,
+        index=args.index,
+        projection=args.projection,
+        recurring=args.recurring,
+        file_format=args.format,
+        out=args.out,
+        offline=args.offline,
+    )
+
+
+# sizes like 500MB or 2GB in bytes
+def parse_size(value):
+    match = re.match(r"\s*([0-9]*\.?[0-9]+)\s*([kmgtp]?i?b?)\s*$",
+                     str(value).lower())
+    if match is None:
+        raise ValueError(f"Could not parse size {value}")
+    unit = match.group(2).rstrip("b").rstrip("i")
+    power = ["", "k", "m", "g", "t", "p"].index(unit)
+    return int(float(match.group(1)) * 1024 ** power)
+
+
+age_units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+# ages like 30d, 12h or 2w in seconds, a bare number is days
+def parse_age(value):
+    match = re.match(r"\s*([0-9]*\.?[0-9]+)\s*([smhdw]?)\s*$", str(value).lower())
+    if match is None:
+        raise ValueError(f"Could not parse age {value}: use for example 30d, 12h or 2w")
+    return float(match.group(1)) * age_units[match.group(2) or "d"]
+
+
+# days between observations from a temporal granularity like 16 day
+def granularity_days(value):
+    value = str(value).lower()
+    match = re.search(r"([0-9]+)\s*-?\s*day", value)
+    if match is not None:
+        return int(match.group(1))
+    for name, days in [("hour", 1), ("daily", 1), ("week", 7), ("month", 30), ("year", 365), ("annual", 365)]:
+        if name in value:
+            return days
+    return 1
+
+
+# assumed output size per pixel per layer and date for volume estimates
+bytes_per_pixel = 4
+
+
+# approximate area in square meters of a lon/lat polygon ring
+def ring_area(ring):
+    if len(ring) < 3:
+        return 0.0
+    mean_lat = sum(point[1] for point in ring) / len(ring)
+    scale_x = 111320 * math.cos(math.radians(mean_lat))
+    area = 0.0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        area = area + (x1 * scale_x) * (y2 * 111320) - \
+            (x2 * scale_x) * (y1 * 111320)
+    return abs(area) / 2
+
+
+def polygon_area(polygon):
+    return max(ring_area(polygon[0]) - sum(ring_area(ring) for ring in polygon[1:]), 0.0)
+
+
+# clip a ring to a lon/lat box using sutherland hodgman
+def clip_ring(ring, box):
+    xmin, ymin, xmax, ymax = box
+    edges = [
+        (lambda p: p[0] >= xmin, lambda p, q: (xmin, p[1] + (q[1] - p[1]) * (xmin - p[0]) / (q[0] - p[0]))),
+        (lambda p: p[0] <= xmax, lambda p, q: (xmax, p[1] + (q[1] - p[1]) * (xmax - p[0]) / (q[0] - p[0]))),
+        (lambda p: p[1] >= ymin, lambda p, q: (p[0] + (q[0] - p[0]) * (ymin - p[1]) / (q[1] - p[1]), ymin)),
+        (lambda p: p[1] <= ymax, lambda p, q: (p[0] + (q[0] - p[0]) * (ymax - p[1]) / (q[1] - p[1]), ymax)),
+    ]
+    points = [tuple(point[:2]) for point in ring]
+    if len(points) > 1 and points[0] == points[-1]:
+        points = points[:-1]
+    for inside, intersect in edges:
+        if len(points) == 0:
+            break
+        clipped = []
+        for i, current in enumerate(points):
+            previous = points[i - 1]
+            if inside(current):
+                if not inside(previous):
+                    clipped.append(intersect(previous, current))
+                clipped.append(current)
+            elif inside(previous):
+                clipped.append(intersect(previous, current))
+        points = clipped
+    if len(points) < 3:
+        return None
+    return [list(point) for point in points] + [list(points[0])]
+
+
+def clip_polygon(polygon, box):
+    exterior = clip_ring(polygon[0], box)
+    if exterior is None or ring_area(exterior) == 0:
+        return None
+    holes = [clip_ring(ring, box) for ring in polygon[1:]]
+    return [exterior] + [ring for ring in holes if ring is not None]
+
+
+# all polygons in a geojson file or dict, multipolygons are split up
+def geojson_polygons(geometry):
+    if not isinstance(geometry, dict):
+        with open(geometry) as json_file:
+            geometry = json.load(json_file)
+    if geometry.get("type") == "FeatureCollection":
+        geometries = [feature["geometry"]
+                      for feature in geometry["features"]]
+    elif geometry.get("type") == "Feature":
+        geometries = [geometry["geometry"]]
+    else:
+        geometries = [geometry]
+    polygons = []
+    for geom in geometries:
+        if geom["type"] == "Polygon":
+            polygons.append(geom["coordinates"])
+        elif geom["type"] == "MultiPolygon":
+            polygons.extend(geom["coordinates"])
+        else:
+            raise ValueError(
+                f"Only Polygon and MultiPolygon are supported for planning, found {geom['type']}")
+    return polygons
+
+
+# clip a polygon to a grid of about tiles boxes over its bounding box,
+# shaped so the boxes come out roughly square
+def grid_polygon(polygon, tiles):
+    if tiles <= 1:
+        return [polygon]
+    xs = [point[0] for point in polygon[0]]
+    ys = [point[1] for point in polygon[0]]
+    width = max(xs) - min(xs)
+    height = max(ys) - min(ys)
+    cols = min(tiles, max(1, math.ceil(math.sqrt(tiles * width / height)))
+               ) if height > 0 else tiles
+    rows = max(1, math.ceil(tiles / cols))
+    pieces = []
+    for row in range(rows):
+        for col in range(cols):
+            box = (
+                min(xs) + width * col / cols,
+                min(ys) + height * row / rows,
+                min(xs) + width * (col + 1) / cols,
+                min(ys) + height * (row + 1) / rows,
+            )
+            clipped = clip_polygon(polygon, box)
+            if clipped is not None:
+                pieces.append(clipped)
+    return pieces
+
+
+# split polygons into spatial tiles and the date range into windows so
+# that every piece stays under max_bytes of estimated output, tiles are
+# sized from the area they cover after clipping and split again while
+# one date of them is still over budget
+def plan_area_tasks(name, product, geometry, start, end, max_bytes, index=None,
+                    projection="geographic", offline=False):
+    catalog = {p["ProductAndVersion"]: p for p in product_list(
+        offline=offline)}
+    if product not in catalog:
+        raise ValueError(f"Product {product} not found in product catalog")
+    resolution = resolution_meters(
+        catalog[product].get("Resolution", "")) or 1000
+    interval = granularity_days(catalog[product].get("TemporalGranularity", ""))
+    layer_count = len(task_layers(product, index=index, offline=offline))
+    start_date = datetime.datetime.strptime(start, "%Y-%m-%d")
+    end_date = datetime.datetime.strptime(end, "%Y-%m-%d")
+    days = (end_date - start_date).days + 1
+    dates = max(1, math.ceil(days / interval))
+    pieces = []
+
+    def pixel_bytes(polygon):
+        return polygon_area(polygon) / resolution ** 2 * layer_count * bytes_per_pixel
+
+    for p, polygon in enumerate(geojson_polygons(geometry), start=1):
+        tile_polygons = []
+        pending = [(polygon, 0)]
+        while pending:
+            piece, depth = pending.pop(0)
+            per_date = pixel_bytes(piece)
+            tiles = max(1, math.ceil(per_date / max_bytes))
+            split = grid_polygon(piece, tiles) if tiles > 1 and depth < 8 else [piece]
+            if len(split) > 1:
+                pending.extend((part, depth + 1) for part in split)
+            else:
+                tile_polygons.append(piece)
+        for t, tile_polygon in enumerate(tile_polygons, start=1):
+            tile_bytes = pixel_bytes(tile_polygon)
+            if tile_bytes > 0:
+                dates_per_window = max(1, int(max_bytes // tile_bytes))
+            else:
+                dates_per_window = dates
+            window_days = dates_per_window * interval
+            window_start = start_date
+            w = 1
+            while window_start <= end_date:
+                window_end = min(
+                    window_start + datetime.timedelta(days=window_days - 1), end_date)
+                tile = f"polygon{p:03d}_tile{t:03d}"
+                pieces.append(
+                    {
+                        "name": f"{name}_{tile}_window{w:03d}",
+                        "tile": tile,
+                        "window": f"window{w:03d}",
+                        "product": product,
+                        "geometry": {
+                            "type": "FeatureCollection",
+                            "features": [
+                                {
+                                    "type": "Feature",
+                                    "properties": {},
+                                    "geometry": {"type": "Polygon", "coordinates": tile_polygon},
+                                }
+                            ],
+                        },
+                        "start": window_start.strftime("%Y-%m-%d"),
+                        "end": window_end.strftime("%Y-%m-%d"),
+                        "layers": index,
+                        "projection": projection,
+                        "estimated_size": int(
+                            tile_bytes * math.ceil(((window_end - window_start).days + 1) / interval)),
+                    }
+                )
+                window_start = window_end + datetime.timedelta(days=1)
+                w = w + 1
+    return pieces
+
+
+# task groups are stored locally so download can reassemble them
+group_dir = os.path.join(state_dir, "groups")
+
+
+def group_path(group):
+    return os.path.join(group_dir, f"{group}.json")
+
+
+def read_group(group):
+    try:
+        with open(group_path(group)) as json_file:
+            return json.load(json_file)
+    except OSError:
+        sys.exit(f"No task group named {group} found in {group_dir}")
+
+
+# plan and submit a large area request as a group of smaller tasks
+def tasksubmit_group(name, product, geometry, start, end, max_size="2GB", index=None,
+                     projection="geographic", workers=4, plan=False, offline=False):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    from tabulate import tabulate
+
+    try:
+        pieces = plan_area_tasks(
+            name, product, geometry, start, end, parse_size(max_size),
+            index=index, projection=projection, offline=offline,
+        )
+    except ValueError as e:
+        sys.exit(str(e))
+    print(
+        tabulate(
+            [
+                {
+                    "Task": piece["name"],
+                    "Start": piece["start"],
+                    "End": piece["end"],
+                    "Estimated Size": humansize(piece["estimated_size"]),
+                }
+                for piece in pieces
+            ],
+            headers="keys",
+            tablefmt="heavy_grid",
+        )
+    )
+    print(
+        "Planned {} tasks with estimated total size {}".format(
+            len(pieces), humansize(sum(piece["estimated_size"] for piece in pieces)))
+    )
+    if plan:
+        return pieces
+    client = get_client()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(submit_manifest_row, piece, client, offline): piece
+            for piece in pieces
+        }
+        for future in as_completed(futures):
+            piece = futures[future]
+            try:
+                piece["task_id"] = future.result()
+                print(
+                    f"Submitted {piece['name']} with task ID {piece['task_id']}")
+            except Exception as e:
+                piece["task_id"] = None
+                piece["error"] = str(e)
+                print(f"Failed to submit {piece['name']}: {e}")
+    os.makedirs(group_dir, exist_ok=True)
+    write_json_atomic(
+        group_path(name),
+        {
+            "group": name,
+            "created": datetime.datetime.now().isoformat(),
+            "tasks": [
+                {key: piece[key] for key in piece if key != "geometry"} for piece in pieces
+            ],
+        },
+    )
+    print(f"Task group {name} saved to {group_path(name)}")
+    return pieces
+
+
+def tasksubmit_group_from_parser(args):
+    tasksubmit_group(
+        name=args.name,
+        product=args.product,
+        geometry=args.geometry,
+        start=args.start,
+        end=args.end,
+        max_size=args.max_size,
+        index=args.index,
+        projection=args.projection,
+        workers=args.workers,
+        plan=args.plan,
+        offline=args.offline,
+    )
+
+
+# delete task using task id
+def delete(tid):
+    get_client().delete(tid)
+    update_task_cache(removed=[tid])
+    print(f"Task with task id {tid} deleted")
+
+
+# task ids from a file with one id per line, or jsonl records with a
+# task_id like the task-submit-batch ledger, # starts a comment
+def read_task_ids(path):
+    tids = []
+    with open(path) as infile:
+        for line in infile:
+            line = line.split("#", 1)[0].strip()
+            if line.startswith("{"):
+                line = json.loads(line).get("task_id") or ""
+            if line:
+                tids.append(line)
+    return tids
+
+
+# submission time of a task as epoch seconds, the api reports utc
+def task_created(task):
+    try:
+        created = datetime.datetime.strptime((task.get("created") or "")[:19], "%Y-%m-%dT%H:%M:%S")
+    except ValueError:
+        return None
+    return created.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+# tasks to delete from the listing, by id, status, name and age, without
+# a status only finished tasks are picked so running ones are never
+# deleted by accident
+def select_deletions(tasks, tids=None, status=None, name=None, older_than=None):
+    from fnmatch import fnmatch
+
+    wanted = None if tids is None else set(tids)
+    cutoff = None if older_than is None else time.time() - older_than
+    selected = []
+    for task in tasks:
+        if wanted is not None and task["task_id"] not in wanted:
+            continue
+        if status is not None and task["status"] != status:
+            continue
+        if status is None and wanted is None and task["status"] not in ["done", "error", "expired"]:
+            continue
+        if name is not None and not fnmatch(task.get("task_name") or "", name):
+            continue
+        if cutoff is not None:
+            created = task_created(task)
+            if created is None or created >= cutoff:
+                continue
+        selected.append(task)
+    return selected
+
+
+# delete one task, a task already gone counts as deleted
+def delete_task(tid, client):
+    try:
+        client.delete(tid)
+        return "deleted"
+    except AppEEARSError as e:
+        if e.status_code == 404:
+            return "not found"
+        raise
+
+
+# delete many tasks concurrently through the shared client, whose
+# governor rate limits the task endpoint, and print a result per task
+def delete_tasks(tids=None, from_file=None, status=None, name=None, older_than=None,
+                 workers=8, dry_run=False):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    import requests
+    from tabulate import tabulate
+
+    if from_file is not None:
+        try:
+            tids = list(tids or []) + read_task_ids(from_file)
+        except (OSError, ValueError) as e:
+            sys.exit(f"Could not read task IDs from {from_file}: {e}")
+    if tids is None and status is None and name is None and older_than is None:
+        sys.exit("Nothing selected: pass --tid, --from-file, --status, --name or --older-than")
+    if older_than is not None:
+        try:
+            older_than = parse_age(older_than)
+        except ValueError as e:
+            sys.exit(str(e))
+    client = get_client()
+    if tids is not None and status is None and name is None and older_than is None:
+        # explicit ids need no task listing
+        cached = read_task_cache()["tasks"]
+        tasks = [cached.get(tid) or {"task_id": tid, "task_name": None, "status": None}
+                 for tid in dict.fromkeys(tids)]
+    else:
+        tasks = select_deletions(list_tasks(client=client), tids, status, name, older_than)
+    if len(tasks) == 0:
+        print("No tasks match the filter")
+        return []
+    rows = [
+        {"task_id": task["task_id"], "task_name": task.get("task_name"),
+         "status": task.get("status"), "result": "would delete" if dry_run else None}
+        for task in tasks
+    ]
+    if not dry_run:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(delete_task, row["task_id"], client): row for row in rows}
+            for future in as_completed(futures):
+                row = futures[future]
+                try:
+                    row["result"] = future.result()
+                except (AppEEARSError, requests.RequestException) as e:
+                    row["result"] = f"failed: {e}"
+        update_task_cache(removed=[
+            row["task_id"] for row in rows if row["result"] in ["deleted", "not found"]])
+    print(tabulate(rows, headers="keys", tablefmt="heavy_grid"))
+    if dry_run:
+        print(f"{len(rows)} tasks would be deleted")
+        return rows
+    failed = [row for row in rows if row["result"].startswith("failed")]
+    gone = sum(1 for row in rows if row["result"] == "not found")
+    print(f"Deleted {len(rows) - len(failed) - gone} tasks, {gone} already gone, {len(failed)} failed")
+    if len(failed) > 0:
+        sys.exit(f"{len(failed)} tasks could not be deleted, rerun to retry them")
+    return rows
+
+
+def delete_from_parser(args):
+    delete_tasks(
+        tids=args.tid,
+        from_file=args.from_file,
+        status=args.status,
+        name=args.name,
+        older_than=args.older_than,
+        workers=args.workers,
+        dry_run=args.dry_run,
+    )
+
+
+# pages of the task listing fetched with limit and offset, filters such
+# as status="done" are passed to the api as query parameters
+def task_pages(client=None, page_size=100, **filters):
+    client = client or get_client()
+    offset = 0
+    while True:
+        page = client.tasks(limit=page_size, offset=offset, **filters) or []
+        yield [
+            task for task in page
+            if all(task.get(key) == value for key, value in filters.items())
+        ]
+        # a short page is the last one, a long one means paging is not supported
+        if len(page) != page_size:
+            return
+        offset = offset + page_size
+
+
+def iter_tasks(client=None, page_size=100, **filters):
+    for page in task_pages(client, page_size, **filters):
+        yield from page
+
+
+# local state of the tasks of the account keyed by task id, answers task
+# listings for task_cache_ttl seconds before it is refreshed
+def task_cache_path():
+    return os.path.join(cache_dir, "tasks.state")
+
+
+task_cache_ttl = 60
+
+
+# compact record of a task kept in the task cache
+def task_record(task):
+    return {
+        "task_id": task["task_id"],
+        "task_name": task.get("task_name"),
+        "task_type": task.get("task_type"),
+        "status": task.get("status"),
+        "created": task.get("created"),
+        "completed": task.get("completed"),
+        "layers": [layer["layer"] for layer in (task.get("params") or {}).get("layers", [])],
+    }
+
+
+def read_task_cache():
+    try:
+        with open(task_cache_path()) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return {"listed": 0, "updated": 0, "tasks": {}}
+
+
+# store task records and drop removed task ids under the cache lock
+def update_task_cache(records=(), removed=(), listed=None, replace=False):
+    os.makedirs(cache_dir, exist_ok=True)
+    with file_lock(task_cache_path()):
+        state = read_task_cache()
+        if replace:
+            state["tasks"] = {}
+        for record in records:
+            state["tasks"][record["task_id"]] = record
+        for tid in removed:
+            state["tasks"].pop(tid, None)
+        state["updated"] = time.time()
+        if listed is not None:
+            state["listed"] = listed
+        write_json_atomic(task_cache_path(), state)
+    return state
+
+
+# task record from task/{tid}, None once the task is gone
+def poll_task(tid, client=None):
+    try:
+        return task_record((client or get_client()).task(tid))
+    except AppEEARSError as e:
+        if e.status_code == 404:
+            return None
+        raise
+
+
+# bring the task cache up to date: list the newest tasks page by page
+# until a page holds no unknown task, then poll only the unfinished tasks
+# the listing did not return, the whole listing is read again once a day
+# or when full is set so expired and deleted tasks drop out
+def refresh_tasks(client=None, full=False, workers=8):
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = client or get_client()
+    state = read_task_cache()
+    known = state["tasks"]
+    full = full or time.time() - state["listed"] >= metadata_ttl
+    listed = {}
+    for page in task_pages(client):
+        fresh = [task for task in page if task["task_id"] not in known]
+        for task in page:
+            listed[task["task_id"]] = task_record(task)
+        if not full and len(fresh) == 0:
+            break
+    unfinished = [] if full else [
+        tid for tid, task in known.items()
+        if task["status"] not in terminal_status and tid not in listed
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        polled = list(executor.map(lambda tid: poll_task(tid, client), unfinished))
+    state = update_task_cache(
+        list(listed.values()) + [record for record in polled if record is not None],
+        removed=[tid for tid, record in zip(unfinished, polled) if record is None],
+        listed=time.time() if full else None,
+        replace=full,
+    )
+    return state["tasks"]
+
+
+# task records newest first, optionally with one status, from the task
+# cache while it is fresh and refreshed incrementally otherwise
+def list_tasks(status=None, client=None, refresh=False, offline=False):
+    state = read_task_cache()
+    if offline:
+        if state["updated"] == 0:
+            sys.exit("No cached tasks: run once without --offline")
+        tasks = state["tasks"]
+    elif refresh or time.time() - state["updated"] >= task_cache_ttl:
+        tasks = refresh_tasks(client, full=refresh)
+    else:
+        tasks = state["tasks"]
+    records = sorted(tasks.values(), key=lambda task: task.get("created") or "", reverse=True)
+    if status is not None:
+        records = [task for task in records if task["status"] == status]
+    return records
+
+
+# record of one task, finished tasks are answered from the task cache
+def task_info(tid, client=None, offline=False):
+    record = read_task_cache()["tasks"].get(tid)
+    if offline or (record is not None and record["status"] in terminal_status):
+        if record is None:
+            sys.exit(f"Task {tid} is not cached: run once without --offline")
+        return record
+    record = poll_task(tid, client)
+    if record is None:
+        update_task_cache(removed=[tid])
+        raise AppEEARSError(404, f"Task {tid} not found")
+    update_task_cache([record])
+    return record
+
+
+def task_summary(record):
+    return {
+        "task_id": record["task_id"],
+        "task_name": record["task_name"],
+        "task_status": record["status"],
+        "task_layers": record["layers"],
+    }
+
+
+# get task status for all tasks and groupby status
+def task_all(status, refresh=False, offline=False):
+    task_list = [task_summary(task) for task in list_tasks(refresh=refresh, offline=offline)]
+    if len(task_list) != 0:
+        if status is not None:
+            task_list = [task for task in task_list if task["task_status"] == status]
+        if len(task_list) == 0 and status is not None:
+            sys.exit(
+                f"No tasks found with status {status} : try processing|done|pending"
+            )
+        task_list = sorted(task_list, key=itemgetter("task_status"))
+        for key, value in groupby(task_list, key=itemgetter("task_status")):
+            print("\n" + f"Task Status :{key.upper()}")
+            for k in value:
+                print(json.dumps(k, indent=2))
+    else:
+        print("No tasks found")
+
+
+# get all or specific task information
+def task_status(tid, status, refresh=False, offline=False):
+    if tid is not None:
+        record = task_info(tid, offline=offline)
+        if record["status"] == "processing" and not offline:
+            print(
+                f"Task {tid} processing : creating progessbar for task completion"
+            )
+            watch(tids=[tid])
+        elif record["status"] in ["pending", "queued"]:
+            print(f"Task status {tid} is {record['status']}")
+        else:
+            print(f"Task status is {record['status']}")
+            print(json.dumps(task_summary(record), indent=2))
+    else:
+        task_all(status, refresh=refresh, offline=offline)
+
+
+def taskinfo_from_parser(args):
+    task_status(tid=args.tid, status=args.status, refresh=args.refresh, offline=args.offline)
+
+
+# compact record of one file in a task bundle
+BundleFile = namedtuple(
+    "BundleFile", ["file_id", "file_name", "file_size", "file_type", "sha256"])
+
+
+# yield the objects of the array stored under key in a json document
+# which arrives in chunks, without holding the whole document
+def iter_json_array(chunks, key):
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    chunks = iter(chunks)
+    buffer = ""
+    pos = None
+    done = False
+    while True:
+        if pos is None:
+            match = array_start.search(buffer)
+            if match is not None:
+                pos = match.end()
+        if pos is not None:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos = pos + 1
+            if pos < len(buffer):
+                if buffer[pos] == "]":
+                    return
+                try:
+                    item, pos = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    if done:
+                        raise
+                else:
+                    yield item
+                    continue
+            buffer = buffer[pos:]
+            pos = 0
+        if done:
+            if pos is None:
+                return
+            raise ValueError(f"Incomplete {key} array")
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer = buffer + text.decode(b"", final=True)
+            done = True
+        else:
+            buffer = buffer + text.decode(chunk)
+
+
+# area outputs are named product_layer_doyYYYYJJJ_aidNNNN.ext, for
+# example MOD13Q1.061__250m_16_days_NDVI_doy2018161_aid0001.tif
+bundle_name = re.compile(
+    r"^(?P<product>[A-Za-z0-9]+\.[0-9]{3})_(?P<layer>.+)_doy(?P<date>[0-9]{7})(_aid(?P<aid>[0-9]+))?\.[A-Za-z0-9]+$"
+)
+
+
+# product, layer and acquisition date of a bundle file or None for files
+# like csv statistics and xml metadata which do not follow the scheme
+def parse_bundle_name(file_name):
+    match = bundle_name.match(os.path.basename(file_name))
+    if match is None:
+        return None
+    try:
+        date = datetime.datetime.strptime(match.group("date"), "%Y%j").date()
+    except ValueError:
+        return None
+    return match.group("product"), match.group("layer"), date
+
+
+# predicate keeping bundle files which pass every given filter, name
+# globs, layer globs, extensions and an acquisition date range, layer
+# and date filters drop files that are not named after a layer and date
+def file_filter(include=None, exclude=None, layers=None, extensions=None, start=None, end=None):
+    from fnmatch import fnmatch
+
+    dates = []
+    for date in [start, end]:
+        try:
+            dates.append(datetime.datetime.strptime(date, "%Y-%m-%d").date()
+                         if date is not None else None)
+        except ValueError:
+            sys.exit(f"Invalid date {date}: use YYYY-MM-DD")
+    start, end = dates
+    extensions = [extension.lower().lstrip(".")
+                  for extension in extensions or []]
+
+    def select(file):
+        name = file.file_name
+        if include and not any(fnmatch(name, pattern) for pattern in include):
+            return False
+        if exclude and any(fnmatch(name, pattern) for pattern in exclude):
+            return False
+        if extensions and name.rsplit(".", 1)[-1].lower() not in extensions:
+            return False
+        if layers or start is not None or end is not None:
+            parsed = parse_bundle_name(name)
+            if parsed is None:
+                return False
+            product, layer, date = parsed
+            if layers and not any(fnmatch(layer, pattern) for pattern in layers):
+                return False
+            if start is not None and date < start:
+                return False
+            if end is not None and date > end:
+                return False
+        return True
+
+    return select
+
+
+# stream file records of a task bundle as the listing arrives, keeping
+# only file names matching one of the include glob patterns and files
+# passing the select predicate
+def iter_bundle(tid, client=None, include=None, sort=False, select=None):
+    client = client or get_client()
+    response = check_response(
+        client.request("get", f"bundle/{tid}", stream=True))
+    with response:
+        files = (
+            BundleFile(item["file_id"], item["file_name"], item["file_size"],
+                       item.get("file_type"), item.get("sha256"))
+            for item in iter_json_array(response.iter_content(chunk_size=MIN_CHUNK_SIZE), "files")
+        )
+        if include:
+            files = filter(file_filter(include=include), files)
+        if select is not None:
+            files = filter(select, files)
+        if not sort:
+            yield from files
+            return
+        from natsort import natsorted
+
+        files = natsorted(files, key=attrgetter("file_name"))
+    yield from files
+
+
+# sorted file records of a task bundle
+def bundle_files(tid, client=None, include=None):
+    return list(iter_bundle(tid, client, include, sort=True))
 
 
 # get file bundle information used by download tools
 def file_bundle(tid):
-    token = tokenizer()
-    response = requests.get(
-        f"https://appeears.earthdatacloud.nasa.gov/api/bundle/{tid}",
-        headers={"Authorization": f"Bearer {token}"},
-    )
-    if response.status_code in error_codes.keys():
-        print(error_codes.get(response.status_code))
-        sys.exit(response.json()["message"])
-    bundle_response = response.json()
-    file_size_total = []
-    file_id_list = []
-    for file in bundle_response["files"]:
-        file_id_list.append({file["file_id"]: file["file_name"]})
-        file_size_total.append(file["file_size"])
+    files = bundle_files(tid)
     print(
         "Estimated Download Size for order: {}".format(
-            humansize(sum(file_size_total)))
+            humansize(sum(file.file_size for file in files)))
+    )
+    return [{file.file_id: file.file_name} for file in files]
+
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+# pick a chunk size that grows with the file so large GeoTIFFs stream in
+# fewer, bigger reads while small csv/xml files still finish in one read
+def chunk_size_for(file_size):
+    if not file_size:
+        return MIN_CHUNK_SIZE
+    return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, file_size // 16))
+
+
+# download a single file and resume a partial file with an HTTP range request
+def download_file(session, url, filepath, file_size=None, headers=None, progress=None,
+                  timeout=(10, 300), checksum=None, throttle=None):
+    """Download url to filepath and return bytes written and SHA-256.
+
+    Data goes to filepath.part, resuming it with a range request, and is
+    only renamed into place once its size and, when given, checksum
+    match. A corrupt part file is removed so the next run starts over.
+    throttle is called with the size of every chunk received and may
+    block to cap the bandwidth.
+    """
+    headers = dict(headers or {})
+    partpath = filepath + ".part"
+    existing = os.path.getsize(partpath) if os.path.exists(partpath) else 0
+    if file_size is not None and existing > file_size:
+        existing = 0
+    digest = hashlib.sha256()
+    if existing > 0:
+        with open(partpath, "rb") as f:
+            for data in iter(lambda: f.read(MAX_CHUNK_SIZE), b""):
+                digest.update(data)
+    written = 0
+    if file_size is None or existing < file_size:
+        if existing > 0:
+            headers["Range"] = f"bytes={existing}-"
+        response = session.get(url, headers=headers,
+                               allow_redirects=True, stream=True, timeout=timeout)
+        with response:
+            if response.status_code == 416 and file_size is None:
+                pass
+            else:
+                check_response(response)
+                if response.status_code == 206:
+                    mode = "ab"
+                else:
+                    # server ignored the range header, start the file over
+                    if progress is not None and existing > 0:
+                        progress.update(-existing)
+                    digest = hashlib.sha256()
+                    mode = "wb"
+                with open(partpath, mode) as f:
+                    for data in response.iter_content(chunk_size=chunk_size_for(file_size)):
+                        f.write(data)
+                        digest.update(data)
+                        written = written + len(data)
+                        if progress is not None:
+                            progress.update(len(data))
+                        if throttle is not None:
+                            throttle(len(data))
+    size = os.path.getsize(partpath) if os.path.exists(partpath) else 0
+    if file_size is not None and size != file_size:
+        raise IntegrityError(
+            filepath, f"expected {file_size} bytes, received {size}")
+    sha256 = digest.hexdigest()
+    if checksum is not None and sha256 != checksum.lower():
+        os.remove(partpath)
+        raise IntegrityError(filepath, "SHA-256 does not match the bundle")
+    os.replace(partpath, filepath)
+    return written, sha256
+
+
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for data in iter(lambda: f.read(MAX_CHUNK_SIZE), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+# every download destination keeps a manifest of the files it holds so
+# reruns can skip finished files without touching the file system
+manifest_name = ".appeears-manifest.sqlite"
+
+
+# path overrides the manifest file, sinks keep theirs outside the
+# destination or in memory
+def open_manifest(dest_dir, path=None):
+    import sqlite3
+
+    db = sqlite3.connect(path or os.path.join(dest_dir, manifest_name))
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(
+        """CREATE TABLE IF NOT EXISTS files (
+            file_id TEXT PRIMARY KEY,
+            task_id TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            mtime REAL NOT NULL
+        )"""
+    )
+    return db
+
+
+# manifest rows of a task keyed by file id
+def manifest_files(db, tid):
+    rows = db.execute(
+        "SELECT file_id, file_name, file_size, sha256, mtime FROM files WHERE task_id = ?",
+        (tid,),
+    )
+    return {
+        row[0]: {"file_name": row[1], "file_size": row[2], "sha256": row[3], "mtime": row[4]}
+        for row in rows
+    }
+
+
+def record_file(db, tid, file, filepath, sha256, mtime=None):
+    db.execute(
+        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+        (file.file_id, tid, os.path.basename(file.file_name),
+         file.file_size, sha256, mtime if mtime is not None else os.path.getmtime(filepath)),
+    )
+    db.commit()
+
+
+# a manifest entry is trusted when it matches the bundle, with verify
+# the file on disk must also still have the recorded size and mtime
+def manifest_current(entry, file, dest_dir, verify=False):
+    if entry is None or entry["file_size"] != file.file_size:
+        return False
+    if entry["file_name"] != os.path.basename(file.file_name):
+        return False
+    if file.sha256 and file.sha256.lower() != entry["sha256"]:
+        return False
+    if not verify:
+        return True
+    try:
+        stat = os.stat(os.path.join(dest_dir, entry["file_name"]))
+    except OSError:
+        return False
+    return stat.st_size == entry["file_size"] and stat.st_mtime == entry["mtime"]
+
+
+# bundle files missing from the manifest or changed since they were
+# recorded
+def pending_files(db, tid, files, dest_dir, verify=False):
+    known = manifest_files(db, tid)
+    return [
+        file for file in files
+        if not manifest_current(known.get(file.file_id), file, dest_dir, verify)
+    ]
+
+
+# bytes of a pending file already on disk, either a complete file
+# written before the manifest existed or a part file left by an
+# interrupted run
+def bytes_on_disk(file, dest_dir):
+    filepath = os.path.join(dest_dir, os.path.basename(file.file_name))
+    partpath = filepath + ".part"
+    if os.path.exists(filepath) and os.path.getsize(filepath) == file.file_size:
+        return file.file_size
+    if os.path.exists(partpath) and os.path.getsize(partpath) <= file.file_size:
+        return os.path.getsize(partpath)
+    return 0
+
+
+# download one file through the client governor, refresh a token
+# rejected mid-run and resume after a dropped connection
+def fetch_file(client, tid, file, filepath, progress=None, scheduler=None):
+    import requests
+
+    checksum = file.sha256
+    # adopt complete files written before the manifest existed
+    if os.path.exists(filepath) and os.path.getsize(filepath) == file.file_size:
+        sha256 = file_sha256(filepath)
+        if checksum is None or sha256 == checksum.lower():
+            return 0, sha256
+        if progress is not None:
+            progress.update(-file.file_size)
+    url = client.file_url(tid, file.file_id)
+    policy = client.governor.policy
+    token = client.auth_token()
+    throttle = None
+    if scheduler is not None:
+        throttle = partial(scheduler.throttle, tid)
+    refreshed = False
+    attempt = 0
+    while True:
+        try:
+            return download_file(
+                client, url, filepath, file.file_size,
+                {"Authorization": f"Bearer {token}"}, progress, client.timeout,
+                checksum, throttle,
+            )
+        except IntegrityError:
+            raise
+        except AppEEARSError as e:
+            if e.status_code != 401 or refreshed:
+                raise
+            token = client.auth_token(stale=token)
+            refreshed = True
+        except requests.RequestException:
+            if not policy.retry_error("get", attempt):
+                raise
+            time.sleep(policy.delay(attempt))
+            attempt = attempt + 1
+
+
+# download (task id, file, destination) jobs from one worker pool and
+# record each finished file in the manifest of its destination, jobs
+# may be a generator and are started as they arrive, in order, returns
+# the bytes transferred and the names of the files that failed, a
+# destination is a local folder or a sink from appeears.sinks
+def transfer_files(jobs, client, manifests, workers=4, scheduler=None):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    import requests
+    from tqdm import tqdm
+
+    failed = []
+    transferred = 0
+    start = time.time()
+    pbar = None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for tid, file, dest_dir in jobs:
+                if pbar is None:
+                    pbar = tqdm(total=0, unit="B", unit_scale=True,
+                                unit_divisor=1024)
+                pbar.total = pbar.total + file.file_size
+                if isinstance(dest_dir, str):
+                    pbar.update(bytes_on_disk(file, dest_dir))
+                    filepath = os.path.join(
+                        dest_dir, os.path.basename(file.file_name))
+                    future = executor.submit(
+                        fetch_file, client, tid, file, filepath, pbar, scheduler)
+                else:
+                    from appeears.sinks import sink_file
+
+                    filepath = None
+                    future = executor.submit(
+                        sink_file, client, tid, file, dest_dir, pbar, scheduler)
+                futures[future] = (tid, file, dest_dir, filepath)
+            for future in as_completed(futures):
+                tid, file, dest_dir, filepath = futures[future]
+                try:
+                    written, sha256 = future.result()
+                except (requests.RequestException, AppEEARSError, OSError) as e:
+                    failed.append(file.file_name)
+                    tqdm.write(f"Failed to download {file.file_name}: {e}")
+                    continue
+                transferred = transferred + written
+                record_file(manifests[dest_dir], tid, file, filepath, sha256,
+                            None if filepath is not None else time.time())
+    finally:
+        if pbar is not None:
+            pbar.close()
+    if pbar is None:
+        return 0, []
+    elapsed = max(time.time() - start, 1e-6)
+    print(
+        "Transferred {} in {:.1f}s ({}/s)".format(
+            humansize(transferred), elapsed, humansize(transferred / elapsed)
+        )
     )
-    return natsorted(file_id_list)
+    return transferred, failed
+
+
+# bandwidth shares of the appeears processes downloading on this host
+bandwidth_file = os.path.join(state_dir, "bandwidth.json")
+
+
+class DownloadScheduler:
+    """Bandwidth caps for downloads, for this host and per task.
+
+    max_rate caps the bytes per second of the host. Every process that
+    downloads with a host cap registers in a shared state file under a
+    file lock and takes an equal share of the cap, rebalanced every
+    refresh seconds as processes start and finish, so concurrent
+    downloads share the link instead of fighting over it. task_rate
+    caps every task on its own. Rates are bytes per second.
+    """
+
+    def __init__(self, max_rate=None, task_rate=None, shared=True, refresh=1.0):
+        self.max_rate = max_rate
+        self.task_rate = task_rate
+        self.shared = shared and max_rate is not None
+        self.refresh = refresh
+        # a quarter second of burst keeps the caps tight
+        self.host = TokenBucket(max_rate, max_rate / 4) if max_rate else None
+        self.tasks = {}
+        self.peers = 1
+        self.refreshed = 0.0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def task_bucket(self, tid):
+        with self.lock:
+            if tid not in self.tasks:
+                self.tasks[tid] = TokenBucket(self.task_rate, self.task_rate / 4)
+            return self.tasks[tid]
+
+    # register this process and take its share of the host cap
+    def rebalance(self, leave=False):
+        with self.lock:
+            if not leave and time.monotonic() - self.refreshed < self.refresh:
+                return
+            self.refreshed = time.monotonic()
+            os.makedirs(state_dir, exist_ok=True)
+            with file_lock(bandwidth_file):
+                try:
+                    with open(bandwidth_file) as json_file:
+                        peers = json.load(json_file)
+                except (OSError, ValueError):
+                    peers = {}
+                now = time.time()
+                peers = {
+                    pid: seen for pid, seen in peers.items()
+                    if now - seen < max(10, 3 * self.refresh)
+                }
+                if leave:
+                    peers.pop(str(os.getpid()), None)
+                else:
+                    peers[str(os.getpid())] = now
+                write_json_atomic(bandwidth_file, peers)
+            self.peers = max(1, len(peers))
+            with self.host.lock:
+                self.host.rate = self.max_rate / self.peers
+                self.host.burst = self.host.rate / 4
+                self.host.tokens = min(self.host.tokens, self.host.burst)
+
+    # block until the caps allow nbytes more for task tid
+    def throttle(self, tid, nbytes):
+        if self.shared and time.monotonic() - self.refreshed >= self.refresh:
+            self.rebalance()
+        wait = 0.0
+        if self.host is not None:
+            wait = self.host.reserve(nbytes)
+        if self.task_rate:
+            wait = max(wait, self.task_bucket(tid).reserve(nbytes))
+        if wait > 0:
+            time.sleep(wait)
+
+    def close(self):
+        if self.shared and self.refreshed > 0:
+            self.rebalance(leave=True)
+
+
+# rank of a file type when downloading by priority, metadata and
+# tables come first, rasters last and anything else in between
+file_priority = {
+    "csv": 0, "json": 0, "xml": 0, "txt": 0, "yaml": 0, "yml": 0, "md": 0,
+    "tif": 2, "tiff": 2, "nc": 2, "nc4": 2, "hdf": 2, "h5": 2, "he5": 2,
+}
+
+download_orders = ["bundle", "priority", "smallest", "largest"]
+
+
+# sort key for a download order, None keeps the bundle order
+def download_order_key(order):
+    def file_type(file):
+        return (file.file_type or os.path.splitext(file.file_name)[1].lstrip(".")).lower()
 
+    if order == "bundle":
+        return None
+    if order == "priority":
+        return lambda file: (file_priority.get(file_type(file), 1), file.file_size)
+    if order == "smallest":
+        return attrgetter("file_size")
+    if order == "largest":
+        return lambda file: -file.file_size
+    raise ValueError(f"Unknown download order {order}: use {', '.join(download_orders)}")
 
-# simple download tool
-def download_task(tid, dest_dir):
-    token = tokenizer()
+
+# files in download order, any order but bundle reads the whole listing
+def order_files(files, order="bundle"):
+    key = download_order_key(order)
+    if key is None:
+        return files
+    return iter(sorted(files, key=key))
+
+
+# pending files from a stream of bundle files until the byte budget is
+# used up, counting files listed, already downloaded and over budget,
+# callers sort the stream by name when there is a budget so the same
+# files are picked on every run
+def budgeted_files(files, known, dest_dir, verify=False, max_bytes=None, tally=None):
+    tally = {} if tally is None else tally
+    for key in ["files", "size", "current", "queued", "over"]:
+        tally.setdefault(key, 0)
+    for file in files:
+        tally["files"] = tally["files"] + 1
+        tally["size"] = tally["size"] + file.file_size
+        if manifest_current(known.get(file.file_id), file, dest_dir, verify):
+            tally["current"] = tally["current"] + 1
+            continue
+        if tally["over"] > 0 or (max_bytes is not None and tally["queued"] + file.file_size > max_bytes):
+            tally["over"] = tally["over"] + 1
+            continue
+        tally["queued"] = tally["queued"] + file.file_size
+        yield file
+
+
+# print what a download would fetch per layer without fetching it
+def download_plan(tid, dest_dir, client, verify=False, include=None, select=None, max_bytes=None,
+                  known=None):
+    from tabulate import tabulate
+
+    if known is not None:
+        dest_dir, verify = "", False
+    elif os.path.exists(os.path.join(dest_dir, manifest_name)):
+        manifest = open_manifest(dest_dir)
+        known = manifest_files(manifest, tid)
+        manifest.close()
+    else:
+        known = {}
+    tally = {}
+    layers = {}
+    for file in budgeted_files(iter_bundle(tid, client, include, max_bytes is not None, select),
+                               known, dest_dir, verify, max_bytes, tally):
+        parsed = parse_bundle_name(file.file_name)
+        layer = parsed[1] if parsed is not None else "other"
+        if layer not in layers:
+            layers[layer] = {"layer": layer, "files": 0, "size": 0,
+                             "first_date": None, "last_date": None}
+        row = layers[layer]
+        row["files"] = row["files"] + 1
+        row["size"] = row["size"] + file.file_size
+        if parsed is not None:
+            row["first_date"] = min(row["first_date"] or parsed[2], parsed[2])
+            row["last_date"] = max(row["last_date"] or parsed[2], parsed[2])
+    if len(layers) > 0:
+        rows = sorted(layers.values(), key=itemgetter("layer"))
+        for row in rows:
+            row["size"] = humansize(row["size"])
+        print(tabulate(rows, headers="keys", tablefmt="heavy_grid"))
+    print(f"Selected {tally['files']} files ({humansize(tally['size'])}), "
+          f"{tally['current']} already downloaded and verified")
+    if tally["over"] > 0:
+        print(f"{tally['over']} files left out by the {humansize(max_bytes)} budget")
+    print(
+        f"{tally['files'] - tally['current'] - tally['over']} files, {humansize(tally['queued'])} to transfer")
+    return tally
+
+
+# destinations which are not a local folder, like s3://bucket/prefix or
+# an archive path, are streamed into a sink from appeears.sinks
+def is_sink(dest):
+    if not isinstance(dest, str):
+        return True
+    return "://" in dest or dest.lower().endswith(
+        (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".zip"))
+
+
+# parallel download tool, files are queued while the bundle listing
+# streams in so the first transfer starts with the first record
+def download_task(tid, dest_dir, workers=4, client=None, verify=False, include=None,
+                  select=None, max_bytes=None, plan=False, order="bundle", scheduler=None):
+    client = client or get_client()
     ## check if task has been completed ##
-    response = requests.get(
-        f"https://appeears.earthdatacloud.nasa.gov/api/status/{tid}",
-        headers={"Authorization": f"Bearer {token}"},
-    )
-    if response.status_code in error_codes.keys():
-        print(error_codes.get(response.status_code))
-        sys.exit(response.json()["message"])
-    if response.status_code == 200:
-        if "status" in response.json().keys():
-            file_id_list = file_bundle(tid)
-            if len(file_id_list) > 0:
-                i = 1
-                for file in file_id_list:
-                    for file_id, file_name in file.items():
-                        filename = os.path.basename(file_name)
-                        response = requests.get(
-                            f"https://appeears.earthdatacloud.nasa.gov/api/bundle/{tid}/{file_id}",
-                            headers={"Authorization": f"Bearer {token}"},
-                            allow_redirects=True,
-                            stream=True,
-                        )
-
-                        filepath = os.path.join(dest_dir, filename)
-                        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-
-                        if not os.path.exists(filepath):
-                            print(
-                                f"Downloading {i} of {len(file_id_list)}: {filename}")
-                            with open(filepath, "wb") as f:
-                                for data in response.iter_content(chunk_size=8192):
-                                    f.write(data)
-                            i = i + 1
-                        else:
-                            print(
-                                f"File {filename} already exists. Skipping download")
-                            i = i + 1
+    status_response = client.status(tid)
+    if status_response is not None:
+        if "status" in status_response.keys():
+            sink = None
+            if is_sink(dest_dir):
+                from appeears.sinks import open_sink
+
+                try:
+                    sink = open_sink(dest_dir)
+                except (ImportError, ValueError) as e:
+                    sys.exit(str(e))
+            if plan:
+                known = None
+                if sink is not None:
+                    manifest = sink.manifest()
+                    known = manifest_files(manifest, tid)
+                    manifest.close()
+                download_plan(tid, dest_dir, client, verify,
+                              include, select, max_bytes, known)
+                if sink is not None:
+                    sink.close(ok=False)
+                return
+            if sink is None:
+                os.makedirs(dest_dir, exist_ok=True)
+                manifest = open_manifest(dest_dir)
+                known = manifest_files(manifest, tid)
+                dest = dest_dir
+            else:
+                manifest = sink.manifest()
+                known = {
+                    file_id: entry for file_id, entry in manifest_files(manifest, tid).items()
+                    if not verify or sink.exists(entry["file_name"], entry["file_size"])
+                }
+                # files already in the sink are checked above, not on disk
+                dest, dest_dir, verify = sink, "", False
+                if not sink.concurrent:
+                    workers = 1
+            tally = {}
+            jobs = (
+                (tid, file, dest)
+                for file in order_files(
+                    budgeted_files(iter_bundle(tid, client, include, max_bytes is not None, select),
+                                   known, dest_dir, verify, max_bytes, tally),
+                    order)
+            )
+            print(f"Downloading with {workers} workers")
+            complete = False
+            try:
+                transferred, failed = transfer_files(
+                    jobs, client, {dest: manifest}, workers, scheduler)
+                complete = len(failed) == 0
+            finally:
+                manifest.close()
+                if sink is not None:
+                    sink.close(ok=complete)
+            print(
+                "Download Size for order: {} in {} files, {} already downloaded and verified".format(
+                    humansize(tally["size"]), tally["files"], tally["current"])
+            )
+            if tally["over"] > 0:
+                print(
+                    f"{tally['over']} files left out by the {humansize(max_bytes)} budget")
+            if len(failed) > 0:
+                sys.exit(
+                    f"{len(failed)} files failed to download, rerun to resume")
         else:
             print(f"Task {tid} has not completed processing. Skipping download")
 
 
+# download every task in a group into one destination tree with one
+# folder per spatial tile and a subfolder per date window, since files
+# without a date like the statistics and lookup tables repeat their
+# name in every window
+def download_group(group, dest_dir, workers=4, verify=False, include=None,
+                   select=None, max_bytes=None, plan=False, order="bundle", scheduler=None):
+    s3 = str(dest_dir).startswith("s3://")
+    if is_sink(dest_dir) and not s3:
+        sys.exit("Task groups are downloaded into a folder per tile and window, use a local folder or s3:// destination")
+    tasks = read_group(group)["tasks"]
+    for task in tasks:
+        if task.get("task_id") is None:
+            print(f"Task {task['name']} was not submitted. Skipping download")
+            continue
+        print(f"Downloading {task['name']} ({task['task_id']})")
+        # groups saved before windows were recorded end their names in it
+        window = task.get("window") or task["name"].rsplit("_", 1)[-1]
+        if s3:
+            task_dest = "/".join([dest_dir.rstrip("/"), task["tile"], window])
+        else:
+            task_dest = os.path.join(dest_dir, task["tile"], window)
+        download_task(
+            task["task_id"], task_dest, workers=workers,
+            verify=verify, include=include, select=select, max_bytes=max_bytes, plan=plan,
+            order=order, scheduler=scheduler,
+        )
+
+
 def download_from_parser(args):
-    download_task(tid=args.tid, dest_dir=args.dest)
+    select = file_filter(
+        exclude=args.exclude,
+        layers=args.layer,
+        extensions=args.ext,
+        start=args.start,
+        end=args.end,
+    )
+    max_bytes = None
+    if args.max_bytes is not None:
+        try:
+            max_bytes = parse_size(args.max_bytes)
+        except ValueError as e:
+            sys.exit(str(e))
+    with scheduler_from_parser(args) as scheduler:
+        if args.group is not None:
+            download_group(group=args.group, dest_dir=args.dest, workers=args.workers,
+                           verify=args.verify, include=args.include, select=select,
+                           max_bytes=max_bytes, plan=args.plan, order=args.order,
+                           scheduler=scheduler)
+        else:
+            download_task(tid=args.tid, dest_dir=args.dest, workers=args.workers,
+                          verify=args.verify, include=args.include, select=select,
+                          max_bytes=max_bytes, plan=args.plan, order=args.order,
+                          scheduler=scheduler)
+
+
+# bandwidth caps like 20MB or 20MB/s from --max-rate and --task-rate
+def scheduler_from_parser(args):
+    rates = []
+    for value in [args.max_rate, args.task_rate]:
+        try:
+            rates.append(parse_size(value[:-2] if value.lower().endswith("/s") else value)
+                         if value is not None else None)
+        except ValueError as e:
+            sys.exit(str(e))
+    return DownloadScheduler(max_rate=rates[0], task_rate=rates[1])
+
+
+def results_from_parser(args):
+    from appeears.results import results
+
+    results(
+        dest_dir=args.dest,
+        tid=args.tid,
+        filepath=args.file,
+        file_format=args.format,
+        decode=not args.raw,
+        offline=args.offline,
+    )
+
+
+def stack_from_parser(args):
+    from appeears.stack import stack
+
+    if args.out is not None and args.format is None:
+        args.format = "netcdf" if args.out.lower().endswith((".nc", ".nc4")) else "zarr"
+    stack(
+        directory=args.dir,
+        layers=args.layer,
+        out=args.out,
+        file_format=args.format,
+        chunk=args.chunk,
+        time_chunk=args.time_chunk,
+    )
+
+
+# tasks from the task listing with a status, a task name matching a
+# glob and submitted between two YYYY-MM-DD dates
+def select_tasks(tasks, status="done", name=None, since=None, until=None):
+    from fnmatch import fnmatch
+
+    for date in [since, until]:
+        if date is not None:
+            try:
+                datetime.datetime.strptime(date, "%Y-%m-%d")
+            except ValueError:
+                sys.exit(f"Invalid date {date}: use YYYY-MM-DD")
+    selected = []
+    for task in tasks:
+        created = (task.get("created") or "")[:10]
+        if status is not None and task["status"] != status:
+            continue
+        if name is not None and not fnmatch(task["task_name"], name):
+            continue
+        if since is not None and created < since:
+            continue
+        if until is not None and created > until:
+            continue
+        selected.append(task)
+    return selected
+
+
+# mirror the bundles of many tasks into one folder per task id, only
+# new or changed files are fetched from one queue shared by all tasks
+def sync(dest_dir, status="done", name=None, since=None, until=None, workers=4,
+         dry_run=False, verify=False, order="bundle", scheduler=None):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from tabulate import tabulate
+
+    client = get_client()
+    tasks = select_tasks(list_tasks(client=client), status, name, since, until)
+    if len(tasks) == 0:
+        print("No tasks match the filter")
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        bundles = list(executor.map(
+            lambda task: bundle_files(task["task_id"], client), tasks))
+    manifests = {}
+    jobs = []
+    plan = []
+    total_size = 0
+    already = 0
+    try:
+        for task, files in zip(tasks, bundles):
+            task_dir = os.path.join(dest_dir, task["task_id"])
+            if os.path.exists(os.path.join(task_dir, manifest_name)) or not dry_run:
+                os.makedirs(task_dir, exist_ok=True)
+                manifests[task_dir] = open_manifest(task_dir)
+                pending = pending_files(
+                    manifests[task_dir], task["task_id"], files, task_dir, verify)
+            else:
+                pending = files
+            pending_size = sum(file.file_size for file in pending)
+            total_size = total_size + pending_size
+            already = already + sum(bytes_on_disk(file, task_dir) for file in pending)
+            jobs.extend((task["task_id"], file, task_dir) for file in pending)
+            plan.append({
+                "task_name": task["task_name"],
+                "task_id": task["task_id"],
+                "files": len(files),
+                "to_transfer": len(pending),
+                "size": humansize(pending_size),
+            })
+        print(tabulate(plan, headers="keys", tablefmt="heavy_grid"))
+        print(
+            f"{len(jobs)} files, {humansize(total_size - already)} to transfer from {len(tasks)} tasks")
+        if dry_run or len(jobs) == 0:
+            return
+        key = download_order_key(order)
+        if key is not None:
+            jobs.sort(key=lambda job: key(job[1]))
+        print(f"Downloading {len(jobs)} files with {workers} workers")
+        transferred, failed = transfer_files(jobs, client, manifests, workers, scheduler)
+    finally:
+        for manifest in manifests.values():
+            manifest.close()
+    if len(failed) > 0:
+        sys.exit(f"{len(failed)} files failed to download, rerun to resume")
+
+
+def sync_from_parser(args):
+    with scheduler_from_parser(args) as scheduler:
+        sync(
+            dest_dir=args.dest,
+            status=args.status,
+            name=args.name,
+            since=args.since,
+            until=args.until,
+            workers=args.workers,
+            dry_run=args.dry_run,
+            verify=args.verify,
+            order=args.order,
+            scheduler=scheduler,
+        )
+
+
+# statuses after which a task is no longer watched
+terminal_status = ["done", "error", "expired", "deleted"]
+
+
+# current status and progress percentage of a task, a task that is gone
+# is deleted and one that could not be polled after the client's retries
+# is unreachable with no progress, which is polled again later
+def task_state(tid, client=None):
+    import requests
+
+    try:
+        status_response = (client or get_client()).status(tid) or {}
+    except AppEEARSError as e:
+        if e.status_code == 404:
+            return "deleted", 0
+        return "unreachable", None
+    except requests.RequestException:
+        return "unreachable", None
+    return response_state(status_response)
+
+
+# status and progress percentage from a status response
+def response_state(status_response):
+    if "progress" in status_response:
+        progress = status_response["progress"].get("summary", 0)
+        if progress >= 100:
+            return "done", 100
+        return status_response.get("status", "processing"), progress
+    if "files" in status_response:
+        return "done", 100
+    status = status_response.get("status", "pending")
+    return status, 100 if status == "done" else 0
+
+
+# next poll delay, backing off for queued and unreachable tasks and
+# tightening as the observed progress rate says a processing task is
+# close to done
+def next_interval(task, min_interval, max_interval):
+    if task["status"] in ["pending", "queued", "unreachable"]:
+        return min(task["interval"] * 2, max_interval)
+    if len(task["history"]) >= 2:
+        (t0, p0), (t1, p1) = task["history"][-2:]
+        if p1 > p0:
+            remaining = (100 - p1) * (t1 - t0) / (p1 - p0)
+            return max(min_interval, min(remaining / 3, max_interval))
+    return min(task["interval"] * 1.5, max_interval)
+
+
+# watch many tasks in one loop, polling each with an adaptive interval and
+# optionally downloading each task as soon as it is done
+def watch(tids=None, status=None, dest_dir=None, workers=4, min_interval=5, max_interval=300):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from tqdm import tqdm
+
+    names = {}
+    if tids is None or len(tids) == 0:
+        wanted = [status] if status is not None else ["pending", "processing"]
+        tids = []
+        for task in list_tasks():
+            if task["status"] in wanted:
+                tids.append(task["task_id"])
+                names[task["task_id"]] = task["task_name"]
+        if len(tids) == 0:
+            print(f"No tasks found with status {'|'.join(wanted)}")
+            return {}
+    client = get_client()
+    now = time.time()
+    tasks = {
+        tid: {"status": "pending", "interval": min_interval,
+              "next": now, "history": []}
+        for tid in tids
+    }
+    bars = {
+        tid: tqdm(total=100, position=i, desc=f"{names.get(tid, tid)[:36]:<36} {'pending':<10}",
+                  bar_format="{desc} {percentage:3.0f}%|{bar}|")
+        for i, tid in enumerate(tids)
+    }
+    downloads = {}
+    poller = ThreadPoolExecutor(max_workers=workers)
+    downloader = ThreadPoolExecutor(max_workers=1) if dest_dir else None
+    try:
+        while True:
+            active = [tid for tid in tids if tasks[tid]
+                      ["status"] not in terminal_status]
+            if len(active) == 0:
+                break
+            wait = min(tasks[tid]["next"] for tid in active) - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            due = [tid for tid in active if tasks[tid]["next"] <= time.time()]
+            for tid, state in zip(due, poller.map(lambda tid: task_state(tid, client), due)):
+                task = tasks[tid]
+                task["status"], progress = state
+                if progress is not None:
+                    task["history"] = (task["history"] +
+                                       [(time.time(), progress)])[-5:]
+                task["interval"] = next_interval(
+                    task, min_interval, max_interval)
+                task["next"] = time.time() + task["interval"]
+                if progress is not None:
+                    bars[tid].update(progress - bars[tid].n)
+                bars[tid].set_description_str(
+                    f"{names.get(tid, tid)[:36]:<36} {task['status']:<10}")
+                if task["status"] == "done" and downloader is not None:
+                    downloads[tid] = downloader.submit(
+                        download_task, tid, os.path.join(dest_dir, tid), workers, client)
+    finally:
+        poller.shutdown()
+        for bar in bars.values():
+            bar.close()
+    if downloader is not None:
+        downloader.shutdown(wait=True)
+        for tid, future in downloads.items():
+            try:
+                future.result()
+            except (Exception, SystemExit) as e:
+                print(f"Download failed for task {tid}: {e}")
+    return {tid: tasks[tid]["status"] for tid in tids}
+
+
+def watch_from_parser(args):
+    watch(
+        tids=args.tid,
+        status=args.status,
+        dest_dir=args.dest,
+        workers=args.workers,
+        min_interval=args.min_interval,
+        max_interval=args.max_interval,
+    )
+
+
+def daemon_from_parser(args):
+    from appeears.daemon import default_db, run_daemon
+
+    with scheduler_from_parser(args) as scheduler:
+        run_daemon(
+            dest_dir=args.dest,
+            db=args.db or default_db,
+            host=args.host,
+            port=args.port,
+            socket_path=args.socket,
+            scheduler=scheduler,
+            submit_workers=args.submit_workers,
+            poll_workers=args.poll_workers,
+            download_workers=args.download_workers,
+            verify_workers=args.verify_workers,
+            workers=args.workers,
+            min_interval=args.min_interval,
+            max_interval=args.max_interval,
+            max_attempts=args.max_attempts,
+            offline=args.offline,
+        )
+
+
+def daemon_enqueue_from_parser(args):
+    from appeears.daemon import enqueue_jobs
+
+    enqueue_jobs(manifest=args.manifest, tids=args.tid, spec=args.spec, dest=args.dest,
+                 url=args.url)
+
+
+def daemon_status_from_parser(args):
+    from appeears.daemon import daemon_report
+
+    daemon_report(job_id=args.job, state=args.state, limit=args.limit, cancel=args.cancel,
+                  retry=args.retry, url=args.url)
 
 
 def main(args=None):
     parser = argparse.ArgumentParser(
         description="Simple CLI for NASA AppEEARS API")
+    parser.add_argument(
+        "--no-version-check",
+        help="Skip the daily check for a newer release on PyPI",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--api-url",
+        help="Base URL of the AppEEARS API, default $APPEEARS_API_URL or the NASA service",
+        default=None,
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Record timing of every API request to this JSONL trace file and print a summary, default $APPEEARS_METRICS",
+        nargs="?",
+        const="appeears-metrics.jsonl",
+        default=os.environ.get("APPEEARS_METRICS") or None,
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        help="Also write request metrics to this Prometheus textfile, OpenMetrics if it ends in .om, default $APPEEARS_METRICS_TEXTFILE",
+        default=os.environ.get("APPEEARS_METRICS_TEXTFILE") or None,
+    )
+    parser.add_argument(
+        "--offline",
+        help="Use cached product, layer and projection metadata without network access",
+        action="store_true",
+    )
     subparsers = parser.add_subparsers()
 
     parser_auth = subparsers.add_parser(
         "auth", help="Set username and password for authentication"
     )
-    parser_auth.set_defaults(func=auth_from_parser)
+    parser_auth.set_defaults(func=auth_from_parser)
+
+    parser_products = subparsers.add_parser(
+        "products", help="Print product list for all products or keyword match"
+    )
+    optional_named = parser_products.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--keyword",
+        help="Search terms for example ecostress or 'ndvi platform:terra res:<=500m'",
+        default=None,
+    )
+    parser_products.set_defaults(func=products_from_parser)
+
+    parser_layers = subparsers.add_parser(
+        "layers", help="Print layer list for product with Product ID"
+    )
+    required_named = parser_layers.add_argument_group(
+        "Required named arguments.")
+    required_named.add_argument(
+        "--pid", help="Product ID from products tool", required=True
+    )
+    parser_layers.set_defaults(func=layers_from_parser)
+
+    parser_spatial = subparsers.add_parser(
+        "spatial", help="List all supported spatial projections"
+    )
+    parser_spatial.set_defaults(func=spatial_from_parser)
+
+    parser_cache = subparsers.add_parser(
+        "cache", help="Refresh, clear or show stats for the local metadata cache"
+    )
+    required_named = parser_cache.add_argument_group(
+        "Required named arguments.")
+    required_named.add_argument(
+        "action", help="Cache action refresh|clear|stats", choices=["refresh", "clear", "stats"]
+    )
+    parser_cache.set_defaults(func=cache_from_parser)
+
+    parser_tasksubmit = subparsers.add_parser(
+        "task-submit", help="Submit your task")
+    required_named = parser_tasksubmit.add_argument_group(
+        "Required named arguments.")
+    required_named.add_argument("--name", help="Task name", required=True)
+    required_named.add_argument(
+        "--product", help="Product ID returned from product tool", required=True
+    )
+    required_named.add_argument(
+        "--geometry",
+        help="Full path to geometry.geojson file point or single polygon, or a csv of points with --prepare",
+        required=True,
+    )
+    required_named.add_argument(
+        "--start", help="Start date in format YYYY-MM-DD", required=True
+    )
+    required_named.add_argument(
+        "--end", help="End date in format YYYY-MM-DD", required=True
+    )
+    optional_named = parser_tasksubmit.add_argument_group(
+        "Optional named arguments")
+
+    nargs = '+'
+    optional_named.add_argument(
+        "--index", help="space separated index of layers for task", nargs='+', type=int, default=None
+    )
+    optional_named.add_argument(
+        "--projection", help="Spatial projection", default="geographic"
+    )
+    optional_named.add_argument(
+        "--recurring", help="Date range recurring True|False", default=False
+    )
+    optional_named.add_argument(
+        "--prepare",
+        action="store_true",
+        help="Validate, repair and simplify polygons, snap and dedupe points and split large point sets, needs numpy",
+    )
+    optional_named.add_argument(
+        "--tolerance", help="Simplification tolerance in meters with --prepare, default half a pixel, 0 to keep every vertex",
+        type=float, default=None
+    )
+    optional_named.add_argument(
+        "--no-snap", help="Keep point coordinates instead of snapping them to the pixel grid with --prepare",
+        action="store_true"
+    )
+    optional_named.add_argument(
+        "--max-points", help="Points per task with --prepare, default 1000", type=int, default=None
+    )
+    parser_tasksubmit.set_defaults(func=tasksubmit_from_parser)
 
-    parser_products = subparsers.add_parser(
-        "products", help="Print product list for all products or keyword match"
+    parser_geometry = subparsers.add_parser(
+        "geometry", help="Show how a geometry is validated, simplified and split for a product"
     )
-    optional_named = parser_products.add_argument_group(
+    required_named = parser_geometry.add_argument_group(
+        "Required named arguments.")
+    required_named.add_argument(
+        "--geometry", help="Full path to a GeoJSON file or a csv file of points with latitude and longitude columns",
+        required=True
+    )
+    required_named.add_argument(
+        "--product", help="Product ID whose pixel size and grid are used", required=True
+    )
+    optional_named = parser_geometry.add_argument_group(
         "Optional named arguments")
     optional_named.add_argument(
-        "--keyword", help="Pass product keyword for example ecostress", default=None
+        "--out", help="Write the prepared geometry to this GeoJSON file", default=None
     )
-    parser_products.set_defaults(func=products_from_parser)
+    optional_named.add_argument(
+        "--tolerance", help="Simplification tolerance in meters, default half a pixel, 0 to keep every vertex",
+        type=float, default=None
+    )
+    optional_named.add_argument(
+        "--no-snap", help="Keep point coordinates instead of snapping them to the pixel grid",
+        action="store_true"
+    )
+    optional_named.add_argument(
+        "--max-points", help="Points per task, default 1000", type=int, default=None
+    )
+    parser_geometry.set_defaults(func=geometry_from_parser)
 
-    parser_layers = subparsers.add_parser(
-        "layers", help="Print layer list for product with Product ID"
+    parser_tasksubmit_batch = subparsers.add_parser(
+        "task-submit-batch", help="Submit many tasks from a csv or jsonl manifest"
     )
-    required_named = parser_layers.add_argument_group(
+    required_named = parser_tasksubmit_batch.add_argument_group(
         "Required named arguments.")
     required_named.add_argument(
-        "--pid", help="Product ID from products tool", required=True
+        "--manifest",
+        help="Full path to csv or jsonl manifest with name, product, geometry, start, end and optional layers, projection, recurring",
+        required=True,
     )
-    parser_layers.set_defaults(func=layers_from_parser)
+    optional_named = parser_tasksubmit_batch.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--ledger", help="Full path to jsonl results ledger, defaults to manifest name with _ledger.jsonl", default=None
+    )
+    optional_named.add_argument(
+        "--workers", help="Number of concurrent submissions", type=int, default=4
+    )
+    optional_named.add_argument(
+        "--spec", help="Full path to a task spec json from task-spec used for rows without a product", default=None
+    )
+    parser_tasksubmit_batch.set_defaults(func=tasksubmit_batch_from_parser)
 
-    parser_spatial = subparsers.add_parser(
-        "spatial", help="List all supported spatial projections"
+    parser_taskspec = subparsers.add_parser(
+        "task-spec", help="Validate product, layers, dates and projection locally and save them as a reusable task spec"
     )
-    parser_spatial.set_defaults(func=spatial_from_parser)
+    required_named = parser_taskspec.add_argument_group(
+        "Required named arguments.")
+    required_named.add_argument(
+        "--product", help="Product ID returned from product tool", required=True
+    )
+    required_named.add_argument(
+        "--start", help="Start date in format YYYY-MM-DD", required=True
+    )
+    required_named.add_argument(
+        "--end", help="End date in format YYYY-MM-DD", required=True
+    )
+    optional_named = parser_taskspec.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--index", help="space separated index or names of layers for task", nargs='+', default=None
+    )
+    optional_named.add_argument(
+        "--projection", help="Spatial projection", default="geographic"
+    )
+    optional_named.add_argument(
+        "--recurring", help="Date range recurring True|False", default=False
+    )
+    optional_named.add_argument(
+        "--format", help="Output format of area tasks", choices=task_formats, default="geotiff"
+    )
+    optional_named.add_argument(
+        "--out", help="Write the task spec to this json file", default=None
+    )
+    parser_taskspec.set_defaults(func=taskspec_from_parser)
 
-    parser_tasksubmit = subparsers.add_parser(
-        "task-submit", help="Submit your task")
-    required_named = parser_tasksubmit.add_argument_group(
+    parser_tasksubmit_group = subparsers.add_parser(
+        "task-submit-group", help="Split a large area request into a group of smaller tasks and submit them"
+    )
+    required_named = parser_tasksubmit_group.add_argument_group(
         "Required named arguments.")
-    required_named.add_argument("--name", help="Task name", required=True)
+    required_named.add_argument(
+        "--name", help="Task group name", required=True)
     required_named.add_argument(
         "--product", help="Product ID returned from product tool", required=True
     )
     required_named.add_argument(
         "--geometry",
-        help="Full path to geometry.geojson file point or single polygon",
+        help="Full path to geometry.geojson file with Polygon or MultiPolygon features",
         required=True,
     )
     required_named.add_argument(
@@ -613,10 +3716,11 @@ def main(args=None):
     required_named.add_argument(
         "--end", help="End date in format YYYY-MM-DD", required=True
     )
-    optional_named = parser_tasksubmit.add_argument_group(
+    optional_named = parser_tasksubmit_group.add_argument_group(
         "Optional named arguments")
-
-    nargs = '+'
+    optional_named.add_argument(
+        "--max-size", help="Maximum estimated output size per task for example 2GB", default="2GB"
+    )
     optional_named.add_argument(
         "--index", help="space separated index of layers for task", nargs='+', type=int, default=None
     )
@@ -624,9 +3728,12 @@ def main(args=None):
         "--projection", help="Spatial projection", default="geographic"
     )
     optional_named.add_argument(
-        "--recurring", help="Date range recurring True|False", default=False
+        "--workers", help="Number of concurrent submissions", type=int, default=4
     )
-    parser_tasksubmit.set_defaults(func=tasksubmit_from_parser)
+    optional_named.add_argument(
+        "--plan", help="Only print the planned tasks without submitting", action="store_true"
+    )
+    parser_tasksubmit_group.set_defaults(func=tasksubmit_group_from_parser)
 
     parser_taskinfo = subparsers.add_parser(
         "task-info",
@@ -638,15 +3745,170 @@ def main(args=None):
     optional_named.add_argument(
         "--status", help="Task status processing|done|pending", default=None
     )
+    optional_named.add_argument(
+        "--refresh",
+        help="Read the whole task listing again instead of updating the local task cache",
+        action="store_true",
+    )
     parser_taskinfo.set_defaults(func=taskinfo_from_parser)
 
-    parser_delete = subparsers.add_parser(
-        "delete", help="Delete a specific task with task ID"
+    parser_watch = subparsers.add_parser(
+        "watch", help="Watch many tasks with progress bars and optionally download them when done"
+    )
+    optional_named = parser_watch.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--tid", help="space separated task IDs, defaults to all pending and processing tasks", nargs="+", default=None
+    )
+    optional_named.add_argument(
+        "--status", help="Watch all tasks with status processing|pending", default=None
+    )
+    optional_named.add_argument(
+        "--dest", help="Download each task into this directory once done", default=None
+    )
+    optional_named.add_argument(
+        "--workers", help="Number of parallel status polls and download workers", type=int, default=4
+    )
+    optional_named.add_argument(
+        "--min-interval", help="Shortest poll interval in seconds", type=float, default=5
+    )
+    optional_named.add_argument(
+        "--max-interval", help="Longest poll interval in seconds", type=float, default=300
+    )
+    parser_watch.set_defaults(func=watch_from_parser)
+
+    parser_daemon = subparsers.add_parser(
+        "daemon", help="Run a job queue that submits, watches, downloads and verifies tasks in one process"
     )
-    required_named = parser_delete.add_argument_group(
+    required_named = parser_daemon.add_argument_group(
         "Required named arguments.")
     required_named.add_argument(
-        "--tid", help="Task ID to delete", required=True)
+        "--dest", help="Destination directory or s3://bucket/prefix, one folder is kept per task", required=True
+    )
+    optional_named = parser_daemon.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--db", help="Job database, default ~/.appeears/daemon.sqlite", default=None
+    )
+    optional_named.add_argument(
+        "--host", help="Address of the job API, default 127.0.0.1", default="127.0.0.1"
+    )
+    optional_named.add_argument(
+        "--port", help="Port of the job API, default 8765", type=int, default=8765
+    )
+    optional_named.add_argument(
+        "--socket", help="Serve the job API on this Unix socket instead of a port", default=None
+    )
+    optional_named.add_argument(
+        "--submit-workers", help="Tasks submitted at once", type=int, default=2
+    )
+    optional_named.add_argument(
+        "--poll-workers", help="Status polls at once", type=int, default=4
+    )
+    optional_named.add_argument(
+        "--download-workers", help="Tasks downloaded at once", type=int, default=2
+    )
+    optional_named.add_argument(
+        "--verify-workers", help="Downloads verified at once", type=int, default=1
+    )
+    optional_named.add_argument(
+        "--workers", help="Parallel file downloads of every task", type=int, default=4
+    )
+    optional_named.add_argument(
+        "--min-interval", help="Shortest poll interval and first retry delay in seconds", type=float, default=5
+    )
+    optional_named.add_argument(
+        "--max-interval", help="Longest poll interval and retry delay in seconds", type=float, default=300
+    )
+    optional_named.add_argument(
+        "--max-attempts", help="Attempts of a submit, download or verify before a job fails", type=int, default=3
+    )
+    optional_named.add_argument(
+        "--max-rate",
+        help="Bandwidth cap of this host, for example 20MB/s, shared fairly with other appeears downloads running on it",
+        default=None,
+    )
+    optional_named.add_argument(
+        "--task-rate",
+        help="Bandwidth cap of every task, for example 5MB/s",
+        default=None,
+    )
+    parser_daemon.set_defaults(func=daemon_from_parser)
+
+    parser_daemon_enqueue = subparsers.add_parser(
+        "daemon-enqueue", help="Add jobs from a manifest or task IDs to a running daemon"
+    )
+    optional_named = parser_daemon_enqueue.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--manifest", help="csv or jsonl manifest like task-submit-batch takes", default=None
+    )
+    optional_named.add_argument(
+        "--spec", help="Task spec JSON file from task-spec for rows without a product", default=None
+    )
+    optional_named.add_argument(
+        "--tid", help="space separated IDs of submitted tasks to watch and download", nargs="+", default=None
+    )
+    optional_named.add_argument(
+        "--dest", help="Download these jobs here instead of a folder per task under the daemon's --dest", default=None
+    )
+    optional_named.add_argument(
+        "--url", help="Daemon API, http://host:port or a socket path, default $APPEEARS_DAEMON_URL or http://127.0.0.1:8765", default=None
+    )
+    parser_daemon_enqueue.set_defaults(func=daemon_enqueue_from_parser)
+
+    parser_daemon_status = subparsers.add_parser(
+        "daemon-status", help="Show, cancel or retry the jobs of a running daemon"
+    )
+    optional_named = parser_daemon_status.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--job", help="Print one job", type=int, default=None
+    )
+    optional_named.add_argument(
+        "--state", help="Only jobs in this state, for example failed", default=None
+    )
+    optional_named.add_argument(
+        "--limit", help="Newest jobs to list, default 50", type=int, default=50
+    )
+    optional_named.add_argument(
+        "--cancel", help="Cancel this job", type=int, default=None
+    )
+    optional_named.add_argument(
+        "--retry", help="Queue this failed or cancelled job again", type=int, default=None
+    )
+    optional_named.add_argument(
+        "--url", help="Daemon API, http://host:port or a socket path, default $APPEEARS_DAEMON_URL or http://127.0.0.1:8765", default=None
+    )
+    parser_daemon_status.set_defaults(func=daemon_status_from_parser)
+
+    parser_delete = subparsers.add_parser(
+        "delete", help="Delete tasks by task ID, from a file of IDs or by status, name and age"
+    )
+    optional_named = parser_delete.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--tid", help="space separated task IDs to delete", nargs="+", default=None)
+    optional_named.add_argument(
+        "--from-file", help="File with one task ID per line or a task-submit-batch ledger", default=None
+    )
+    optional_named.add_argument(
+        "--status", help="Delete tasks with this status, without it only done, error and expired tasks are selected", default=None
+    )
+    optional_named.add_argument(
+        "--name", help="Task name glob pattern, for example 'ndvi-*'", default=None
+    )
+    optional_named.add_argument(
+        "--older-than", help="Only tasks submitted longer ago than this, for example 30d, 12h or 2w", default=None
+    )
+    optional_named.add_argument(
+        "--workers", help="Number of parallel deletes", type=int, default=8
+    )
+    optional_named.add_argument(
+        "--dry-run",
+        help="Print the tasks that would be deleted without deleting them",
+        action="store_true",
+    )
     parser_delete.set_defaults(func=delete_from_parser)
 
     parser_download = subparsers.add_parser(
@@ -654,12 +3916,208 @@ def main(args=None):
     )
     required_named = parser_download.add_argument_group(
         "Required named arguments.")
+    task_source = required_named.add_mutually_exclusive_group(required=True)
+    task_source.add_argument(
+        "--tid", help="Task ID to download")
+    task_source.add_argument(
+        "--group", help="Task group name from task-submit-group to download")
     required_named.add_argument(
-        "--tid", help="Task ID to download", required=True)
+        "--dest", help="Full path to destination directory, or s3://bucket/prefix, or a .tar, .tar.gz or .zip archive to stream into",
+        required=True
+    )
+    optional_named = parser_download.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--workers", help="Number of parallel download workers", type=int, default=4
+    )
+    optional_named.add_argument(
+        "--verify",
+        help="Check files recorded in the download manifest against their size and modification time",
+        action="store_true",
+    )
+    optional_named.add_argument(
+        "--include",
+        help="Only download files whose name matches this glob pattern, for example '*NDVI*', can be repeated",
+        action="append",
+        default=None,
+    )
+    optional_named.add_argument(
+        "--exclude",
+        help="Skip files whose name matches this glob pattern, for example '*QA*', can be repeated",
+        action="append",
+        default=None,
+    )
+    optional_named.add_argument(
+        "--layer",
+        help="Only download files of layers matching this glob pattern, for example '*NDVI', can be repeated",
+        action="append",
+        default=None,
+    )
+    optional_named.add_argument(
+        "--ext",
+        help="Only download files with this extension, for example tif or csv, can be repeated",
+        action="append",
+        default=None,
+    )
+    optional_named.add_argument(
+        "--start", help="Only download files acquired on or after this date YYYY-MM-DD", default=None
+    )
+    optional_named.add_argument(
+        "--end", help="Only download files acquired on or before this date YYYY-MM-DD", default=None
+    )
+    optional_named.add_argument(
+        "--max-bytes",
+        help="Select files in name order until this many bytes are queued, for example 20GB",
+        default=None,
+    )
+    optional_named.add_argument(
+        "--plan",
+        help="Print the selected files and bytes per layer without downloading",
+        action="store_true",
+    )
+    optional_named.add_argument(
+        "--order",
+        help="Download order: bundle listing, priority for metadata and tables before rasters, smallest or largest first",
+        choices=download_orders,
+        default="bundle",
+    )
+    optional_named.add_argument(
+        "--max-rate",
+        help="Bandwidth cap of this host, for example 20MB/s, shared fairly with other appeears downloads running on it",
+        default=None,
+    )
+    optional_named.add_argument(
+        "--task-rate",
+        help="Bandwidth cap of every task, for example 5MB/s",
+        default=None,
+    )
+    parser_download.set_defaults(func=download_from_parser)
+
+    parser_results = subparsers.add_parser(
+        "results", help="Convert point task results csv files to Parquet or NumPy arrays"
+    )
+    required_named = parser_results.add_argument_group(
+        "Required named arguments.")
+    results_source = required_named.add_mutually_exclusive_group(required=True)
+    results_source.add_argument(
+        "--tid", help="Point task ID whose results csv files are streamed from the bundle")
+    results_source.add_argument(
+        "--file", help="Full path to a downloaded point results csv")
     required_named.add_argument(
         "--dest", help="Full path to destination directory", required=True
     )
-    parser_download.set_defaults(func=download_from_parser)
+    optional_named = parser_results.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--format",
+        help="Output format parquet (needs pyarrow) or npz, default parquet",
+        choices=["parquet", "npz"],
+        default="parquet",
+    )
+    optional_named.add_argument(
+        "--raw",
+        help="Keep layer values as stored instead of masking fill values and applying scale factors",
+        action="store_true",
+    )
+    parser_results.set_defaults(func=results_from_parser)
+
+    parser_stack = subparsers.add_parser(
+        "stack", help="Index downloaded area task GeoTIFFs by layer and date and stack them into cubes"
+    )
+    required_named = parser_stack.add_argument_group(
+        "Required named arguments.")
+    required_named.add_argument(
+        "--dir", help="Full path to the folder with the downloaded GeoTIFFs", required=True
+    )
+    optional_named = parser_stack.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--layer",
+        help="Only stack layers matching this glob pattern, for example '*NDVI', can be repeated",
+        action="append",
+        default=None,
+    )
+    optional_named.add_argument(
+        "--out", help="Write the stacks to this Zarr store, NetCDF file or npy folder", default=None
+    )
+    optional_named.add_argument(
+        "--format",
+        help="Output format zarr, netcdf or npy, default from the --out extension or zarr",
+        choices=["zarr", "netcdf", "npy"],
+        default=None,
+    )
+    optional_named.add_argument(
+        "--chunk", help="Spatial chunk size in pixels, default 256", type=int, default=256
+    )
+    optional_named.add_argument(
+        "--time-chunk", help="Dates per chunk, default 64", type=int, default=64
+    )
+    parser_stack.set_defaults(func=stack_from_parser)
+
+    parser_sync = subparsers.add_parser(
+        "sync", help="Mirror bundles of all matching tasks, fetching only new or changed files"
+    )
+    required_named = parser_sync.add_argument_group(
+        "Required named arguments.")
+    required_named.add_argument(
+        "--dest", help="Full path to destination directory, one folder is kept per task", required=True
+    )
+    optional_named = parser_sync.add_argument_group(
+        "Optional named arguments")
+    optional_named.add_argument(
+        "--status", help="Task status to sync, default done", default="done"
+    )
+    optional_named.add_argument(
+        "--name", help="Task name glob pattern, for example 'ndvi-*'", default=None
+    )
+    optional_named.add_argument(
+        "--since", help="Only tasks submitted on or after this date YYYY-MM-DD", default=None
+    )
+    optional_named.add_argument(
+        "--until", help="Only tasks submitted on or before this date YYYY-MM-DD", default=None
+    )
+    optional_named.add_argument(
+        "--workers", help="Number of parallel download workers", type=int, default=4
+    )
+    optional_named.add_argument(
+        "--dry-run",
+        help="Print the files and bytes to transfer per task without downloading",
+        action="store_true",
+    )
+    optional_named.add_argument(
+        "--verify",
+        help="Check files recorded in the download manifest against their size and modification time",
+        action="store_true",
+    )
+    optional_named.add_argument(
+        "--order",
+        help="Download order: bundle listing, priority for metadata and tables before rasters, smallest or largest first",
+        choices=download_orders,
+        default="bundle",
+    )
+    optional_named.add_argument(
+        "--max-rate",
+        help="Bandwidth cap of this host, for example 20MB/s, shared fairly with other appeears downloads running on it",
+        default=None,
+    )
+    optional_named.add_argument(
+        "--task-rate",
+        help="Bandwidth cap of every task, for example 5MB/s",
+        default=None,
+    )
+    parser_sync.set_defaults(func=sync_from_parser)
+
+    # --offline is also accepted after the tools reading metadata, a
+    # subcommand only overrides the global flag when it is given
+    for name in ["products", "layers", "spatial", "task-submit", "geometry",
+                 "task-submit-batch", "task-spec", "task-submit-group", "task-info",
+                 "results", "daemon"]:
+        subparsers.choices[name].add_argument(
+            "--offline",
+            help="Use cached product, layer and projection metadata without network access",
+            action="store_true",
+            default=argparse.SUPPRESS,
+        )
 
     args = parser.parse_args()
 
@@ -667,7 +4125,25 @@ def main(args=None):
         func = args.func
     except AttributeError:
         parser.error("too few arguments")
-    func(args)
+    if args.api_url is not None:
+        set_api_url(args.api_url)
+    if args.metrics in ["1", "true", "yes"]:
+        args.metrics = "appeears-metrics.jsonl"
+    if args.metrics is not None or args.metrics_textfile is not None:
+        from appeears import metrics
+
+        metrics.enable(trace=args.metrics, textfile=args.metrics_textfile)
+    if not args.no_version_check:
+        appeears_version()
+    try:
+        func(args)
+    except AppEEARSError as e:
+        print(error_codes.get(e.status_code, f"Request failed with status {e.status_code}"))
+        sys.exit(e.message)
+    finally:
+        if args.metrics is not None or args.metrics_textfile is not None:
+            metrics.finish()
+
 
-    if __name__ == "__main__":
-        main()
+if __name__ == "__main__":
+    main()
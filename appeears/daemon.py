@@ -0,0 +1,752 @@
+"""Long running pipeline that submits, watches and downloads tasks.
+
+appeears daemon keeps one process, one pooled session and one token
+for a queue of jobs. Every job goes through four stages, each with its
+own number of workers:
+
+    submit      queued -> submitting -> processing
+    poll        processing -> ready, polled with an adaptive interval
+    download    ready -> downloading -> downloaded
+    verify      downloaded -> verifying -> complete
+
+Jobs live in a SQLite database, ~/.appeears/daemon.sqlite by default,
+and every state change is one committed transaction. Jobs a worker held
+when the daemon stopped are handed back when it starts again: downloads
+resume from the download manifest and a submission that may have
+reached the server is matched to the task it created by name instead of
+being submitted twice. Failed stages are retried with backoff, a job
+fails for good after max_attempts or when its task ends in error.
+
+Clients enqueue jobs and query them over a small JSON API on
+127.0.0.1:8765 or a Unix socket:
+
+    POST   /jobs              a manifest row or a list of them
+    GET    /jobs?state=ready  jobs, newest first
+    GET    /jobs/<id>         one job
+    DELETE /jobs/<id>         cancel a job no worker holds
+    POST   /jobs/<id>/retry   queue a failed or cancelled job again
+    GET    /status            jobs per state and busy workers per stage
+
+A row is a task-submit-batch manifest row, name, product, geometry,
+start and end, or name and geometry with a task spec under "spec", or
+just a task_id to watch and download a task submitted elsewhere. dest
+overrides the download destination, by default a folder per task id.
+Geometry paths are read by the daemon, so send them absolute.
+
+    from appeears.daemon import daemon_request
+
+    daemon_request("POST", "/jobs", {"task_id": tid})
+    print(daemon_request("GET", "/status"))
+"""
+
+import http.client
+import http.server
+import json
+import os
+import re
+import signal
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from appeears.appeears import (AppEEARSError, TaskSpec, download_task, get_client, is_sink,
+                               iter_bundle, iter_tasks, manifest_current, manifest_files,
+                               manifest_name, manifest_payload, next_interval, open_manifest,
+                               response_state, state_dir, submit_payload)
+
+default_db = os.path.join(state_dir, "daemon.sqlite")
+default_url = "http://127.0.0.1:8765"
+
+job_states = ["queued", "submitting", "processing", "ready", "downloading", "downloaded",
+              "verifying", "complete", "failed", "cancelled"]
+
+# states held by a worker, handed back to the state before them on restart
+held_states = {"submitting": "queued", "downloading": "ready", "verifying": "downloaded"}
+
+# a stage takes due jobs in state, holds them in held while it works and
+# puts them back in retry when it fails
+Stage = namedtuple("Stage", ["name", "state", "held", "retry", "workers"])
+
+job_fields = ["job_id", "name", "state", "task_id", "dest", "progress", "attempts", "error",
+              "submitted", "next_at", "created", "updated"]
+
+
+# failures retrying cannot fix, like a task that ended in error
+class JobError(AppEEARSError):
+    def __init__(self, message):
+        super().__init__(None, message)
+
+    def __str__(self):
+        return self.message
+
+
+class JobQueue:
+    """SQLite backed jobs shared by the daemon's workers and its API.
+
+    One connection is shared under a lock and every change is committed
+    on its own, so after a crash a job is either where it was or where
+    it moved to. move only applies when the job is still in the state
+    the caller saw, so a job cancelled meanwhile stays cancelled.
+    """
+
+    def __init__(self, path=default_db):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                state TEXT NOT NULL,
+                task_id TEXT,
+                dest TEXT,
+                progress REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                submitted REAL,
+                next_at REAL NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                payload TEXT
+            )"""
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, next_at)")
+        self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def select(self, where="", params=(), payload=False):
+        fields = job_fields + (["payload"] if payload else [])
+        rows = self.db.execute(f"SELECT {', '.join(fields)} FROM jobs {where}", params)
+        jobs = [dict(zip(fields, row)) for row in rows]
+        for job in jobs:
+            if job.get("payload") is not None:
+                job["payload"] = json.loads(job["payload"])
+        return jobs
+
+    # add jobs in one transaction, rows with a payload are submitted and
+    # rows with a task id go straight to polling
+    def add(self, jobs):
+        now = time.time()
+        with self.lock:
+            ids = []
+            for job in jobs:
+                payload = job.get("payload")
+                cursor = self.db.execute(
+                    "INSERT INTO jobs (name, state, task_id, dest, next_at, created, updated, payload)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job.get("name"), "queued" if payload is not None else "processing",
+                     job.get("task_id"), job.get("dest"), now, now, now,
+                     json.dumps(payload) if payload is not None else None),
+                )
+                ids.append(cursor.lastrowid)
+            self.db.commit()
+        return ids
+
+    def get(self, job_id, payload=False):
+        with self.lock:
+            jobs = self.select("WHERE job_id = ?", (job_id,), payload)
+        return jobs[0] if jobs else None
+
+    def jobs(self, state=None, limit=None):
+        where, params = "", []
+        if state is not None:
+            where, params = "WHERE state = ?", [state]
+        where = where + " ORDER BY job_id DESC"
+        if limit is not None:
+            where, params = where + " LIMIT ?", params + [int(limit)]
+        with self.lock:
+            return self.select(where, params)
+
+    def counts(self):
+        with self.lock:
+            rows = self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+            return {state: count for state, count in rows}
+
+    def task_ids(self):
+        with self.lock:
+            rows = self.db.execute("SELECT task_id FROM jobs WHERE task_id IS NOT NULL")
+            return {row[0] for row in rows}
+
+    # due jobs in state, moved to held when given, oldest first
+    def claim(self, state, held=None, limit=1, exclude=()):
+        now = time.time()
+        with self.lock:
+            jobs = [
+                job for job in self.select(
+                    "WHERE state = ? AND next_at <= ? ORDER BY next_at, job_id LIMIT ?",
+                    (state, now, limit + len(exclude)), payload=state == "queued")
+                if job["job_id"] not in exclude
+            ][:limit]
+            if held is not None and len(jobs) > 0:
+                self.db.executemany(
+                    "UPDATE jobs SET state = ?, updated = ? WHERE job_id = ?",
+                    [(held, now, job["job_id"]) for job in jobs],
+                )
+                self.db.commit()
+                for job in jobs:
+                    job["state"] = held
+        return jobs
+
+    # update a job still in the expected state, returns whether it was
+    def move(self, job_id, expected, **fields):
+        fields["updated"] = time.time()
+        names = sorted(fields)
+        with self.lock:
+            cursor = self.db.execute(
+                f"UPDATE jobs SET {', '.join(name + ' = ?' for name in names)}"
+                " WHERE job_id = ? AND state = ?",
+                [fields[name] for name in names] + [job_id, expected],
+            )
+            self.db.commit()
+        return cursor.rowcount == 1
+
+    # hand jobs held by workers of a stopped daemon back to the state
+    # before, returns the submissions that may have reached the server
+    def recover(self):
+        with self.lock:
+            pending = self.select("WHERE state = 'submitting'", payload=True)
+            for held, state in held_states.items():
+                self.db.execute(
+                    "UPDATE jobs SET state = ?, updated = ? WHERE state = ?",
+                    (state, time.time(), held),
+                )
+            self.db.commit()
+        return pending
+
+
+# default destination of a task below the daemon's destination
+def task_dest(dest_dir, tid):
+    if str(dest_dir).startswith("s3://"):
+        return dest_dir.rstrip("/") + "/" + tid
+    return os.path.join(dest_dir, tid)
+
+
+# bundle files of a task which are not in its destination with their
+# bundle size, from the download manifest and the files on disk for a
+# folder, the sink manifest and the objects for s3 and the members for
+# an archive
+def missing_files(tid, dest, client=None):
+    files = list(iter_bundle(tid, client))
+    lowered = dest.lower()
+    if lowered.startswith("s3://"):
+        from appeears.sinks import S3Sink
+
+        sink = S3Sink(dest)
+        manifest = sink.manifest()
+        known = manifest_files(manifest, tid)
+        manifest.close()
+        return [
+            file for file in files
+            if not manifest_current(known.get(file.file_id), file, "")
+            or not sink.exists(os.path.basename(file.file_name), file.file_size)
+        ]
+    if is_sink(dest):
+        import tarfile
+        import zipfile
+
+        if not os.path.exists(dest):
+            return files
+        if lowered.endswith(".zip"):
+            with zipfile.ZipFile(dest) as archive:
+                stored = {info.filename: info.file_size for info in archive.infolist()}
+        else:
+            with tarfile.open(dest, "r:*") as archive:
+                stored = {info.name: info.size for info in archive.getmembers()}
+        return [
+            file for file in files
+            if stored.get(os.path.basename(file.file_name)) != file.file_size
+        ]
+    if not os.path.exists(os.path.join(dest, manifest_name)):
+        return files
+    manifest = open_manifest(dest)
+    known = manifest_files(manifest, tid)
+    manifest.close()
+    return [
+        file for file in files
+        if not manifest_current(known.get(file.file_id), file, dest, verify=True)
+    ]
+
+
+# task payload of an enqueued row, checked before the job is accepted
+def job_payload(row, offline=False):
+    spec = row.get("spec")
+    if spec is not None and not row.get("product"):
+        spec = TaskSpec.from_dict(spec) if isinstance(spec, dict) else TaskSpec.load(spec)
+        spec = spec.validate(offline=offline)
+    if not row.get("name"):
+        raise ValueError("Every job needs a name, or a task_id to download")
+    if row.get("geometry") is None:
+        raise ValueError(f"Job {row['name']} has no geometry")
+    return manifest_payload(row, offline, spec)
+
+
+# layers and dates of task params, the parts of a request that make two
+# tasks of one name deliver different data
+def request_key(params):
+    layers = sorted((item.get("product"), item.get("layer")) for item in params.get("layers") or [])
+    dates = [(item.get("startDate"), item.get("endDate"), bool(item.get("recurring")))
+             for item in params.get("dates") or []]
+    return layers, dates
+
+
+class Daemon:
+    """Moves jobs of a JobQueue through submit, poll, download and verify.
+
+    A dispatcher takes due jobs for every stage with free workers and
+    hands them to the stage's pool, the pools share one client so the
+    session, the token and the request governor are shared too. A
+    stage that raises sends its job back to retry after min_interval
+    doubling per attempt, JobError and max_attempts fail it, only
+    polling retries without limit.
+    """
+
+    def __init__(self, queue, dest_dir, client=None, submit_workers=2, poll_workers=4,
+                 download_workers=2, verify_workers=1, workers=4, min_interval=5,
+                 max_interval=300, max_attempts=3, scheduler=None, offline=False):
+        self.queue = queue
+        self.dest_dir = dest_dir
+        self.client = client or get_client()
+        self.workers = workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_attempts = max_attempts
+        self.scheduler = scheduler
+        self.offline = offline
+        self.stages = [
+            Stage("submit", "queued", "submitting", "queued", submit_workers),
+            Stage("poll", "processing", None, "processing", poll_workers),
+            Stage("download", "ready", "downloading", "ready", download_workers),
+            Stage("verify", "downloaded", "verifying", "ready", verify_workers),
+        ]
+        self.pools = {
+            stage.name: ThreadPoolExecutor(max_workers=stage.workers,
+                                           thread_name_prefix=f"appeears-{stage.name}")
+            for stage in self.stages
+        }
+        self.running = {stage.name: set() for stage in self.stages}
+        self.polls = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.server = None
+        self.socket_path = None
+        self.started = time.time()
+
+    def log(self, job, message):
+        print(f"Job {job['job_id']} {job['name'] or job['task_id']}: {message}", flush=True)
+
+    # validate rows and add them as jobs, all of them or none
+    def enqueue(self, rows):
+        if isinstance(rows, dict):
+            rows = [rows]
+        jobs = []
+        for row in rows:
+            if not isinstance(row, dict):
+                raise ValueError("A job is a JSON object")
+            if row.get("task_id"):
+                jobs.append({"name": row.get("name"), "task_id": row["task_id"],
+                             "dest": row.get("dest")})
+            else:
+                jobs.append({"name": row.get("name"), "dest": row.get("dest"),
+                             "payload": job_payload(row, self.offline)})
+        ids = self.queue.add(jobs)
+        self.wake.set()
+        return ids
+
+    def cancel(self, job_id):
+        job = self.queue.get(job_id)
+        if job is None:
+            return None
+        busy = job_id in self.running["poll"] or job["state"] in held_states
+        if busy or job["state"] in ["complete", "cancelled"]:
+            raise JobError(f"Job {job_id} is {job['state']} and cannot be cancelled")
+        self.queue.move(job_id, job["state"], state="cancelled")
+        return self.queue.get(job_id)
+
+    def retry(self, job_id):
+        job = self.queue.get(job_id)
+        if job is None:
+            return None
+        if job["state"] not in ["failed", "cancelled"]:
+            raise JobError(f"Job {job_id} is {job['state']}, only failed or cancelled jobs are retried")
+        state = "queued" if job["task_id"] is None else "processing"
+        self.queue.move(job_id, job["state"], state=state, attempts=0, error=None,
+                        next_at=time.time())
+        self.wake.set()
+        return self.queue.get(job_id)
+
+    def status(self):
+        return {
+            "jobs": self.queue.counts(),
+            "stages": {
+                stage.name: {"workers": stage.workers, "running": len(self.running[stage.name])}
+                for stage in self.stages
+            },
+            "started": self.started,
+        }
+
+    # task created by a submission that may have reached the server: the
+    # task with the job's name, layers and dates, created since the day
+    # before the job and not held by another job. Several such tasks are
+    # ambiguous and none of them is adopted
+    def submitted_task(self, job):
+        since = time.strftime("%Y-%m-%d", time.gmtime(job["created"] - 24 * 3600))
+        taken = self.queue.task_ids()
+        wanted = request_key(job["payload"]["params"])
+        matches = []
+        for task in iter_tasks(self.client, task_name=job["payload"]["task_name"]):
+            if task["task_id"] in taken or (task.get("created") or "")[:10] < since:
+                continue
+            params = task.get("params") or (self.client.task(task["task_id"]) or {}).get("params")
+            if request_key(params or {}) == wanted:
+                matches.append(task["task_id"])
+        if len(matches) > 1:
+            self.log(job, f"{len(matches)} tasks match an earlier submission, submitting again")
+            return None
+        return matches[0] if matches else None
+
+    def submit(self, job):
+        tid = None
+        if job["submitted"] is not None:
+            tid = self.submitted_task(job)
+            if tid is not None:
+                self.log(job, f"adopted task {tid} from an earlier submission")
+        if tid is None:
+            self.queue.move(job["job_id"], job["state"], submitted=time.time())
+            tid = submit_payload(job["payload"], client=self.client)
+            self.log(job, f"submitted as task {tid}")
+        return {"state": "processing", "task_id": tid, "attempts": 0, "error": None,
+                "next_at": time.time() + self.min_interval}
+
+    def poll(self, job):
+        try:
+            status_response = self.client.status(job["task_id"]) or {}
+        except AppEEARSError as e:
+            if e.status_code == 404:
+                raise JobError(f"Task {job['task_id']} not found")
+            raise
+        status, progress = response_state(status_response)
+        if status in ["error", "expired", "deleted"]:
+            raise JobError(f"Task {job['task_id']} is {status}")
+        if status == "done":
+            self.polls.pop(job["job_id"], None)
+            self.log(job, "task done")
+            return {"state": "ready", "progress": 100, "attempts": 0, "error": None,
+                    "next_at": time.time()}
+        task = self.polls.setdefault(
+            job["job_id"], {"interval": self.min_interval, "history": []})
+        task["status"] = status
+        task["history"] = (task["history"] + [(time.time(), progress)])[-5:]
+        task["interval"] = next_interval(task, self.min_interval, self.max_interval)
+        return {"state": "processing", "progress": progress, "attempts": 0, "error": None,
+                "next_at": time.time() + task["interval"]}
+
+    def download(self, job):
+        dest = job["dest"] or task_dest(self.dest_dir, job["task_id"])
+        self.queue.move(job["job_id"], job["state"], dest=dest)
+        self.log(job, f"downloading into {dest}")
+        # after a failed verify the manifest is checked against the files
+        download_task(job["task_id"], dest, workers=self.workers, client=self.client,
+                      verify=job["attempts"] > 0, scheduler=self.scheduler)
+        return {"state": "downloaded", "dest": dest, "next_at": time.time()}
+
+    def verify(self, job):
+        missing = missing_files(job["task_id"], job["dest"], self.client)
+        if len(missing) > 0:
+            raise OSError(f"{len(missing)} files missing from {job['dest']}")
+        self.log(job, "complete")
+        return {"state": "complete", "attempts": 0, "error": None}
+
+    # run one stage of a job and record where it went
+    def run_stage(self, stage, job):
+        try:
+            fields = getattr(self, stage.name)(job)
+            self.queue.move(job["job_id"], job["state"], **fields)
+        except (Exception, SystemExit) as e:
+            attempts = job["attempts"] + 1
+            limited = stage.name != "poll" or isinstance(e, JobError)
+            if isinstance(e, JobError) or (limited and attempts >= self.max_attempts):
+                fields = {"state": "failed"}
+                self.log(job, f"failed: {e}")
+            else:
+                delay = min(self.max_interval, self.min_interval * 2 ** attempts)
+                fields = {"state": stage.retry, "next_at": time.time() + delay}
+                self.log(job, f"{stage.name} failed, retrying in {delay:.0f}s: {e}")
+            self.queue.move(job["job_id"], job["state"], attempts=attempts, error=str(e), **fields)
+        finally:
+            with self.lock:
+                self.running[stage.name].discard(job["job_id"])
+            self.wake.set()
+
+    # hand due jobs to every stage with free workers
+    def dispatch(self):
+        for stage in self.stages:
+            with self.lock:
+                running = set(self.running[stage.name])
+            free = stage.workers - len(running)
+            if free <= 0:
+                continue
+            for job in self.queue.claim(stage.state, stage.held, free, running):
+                with self.lock:
+                    self.running[stage.name].add(job["job_id"])
+                self.pools[stage.name].submit(self.run_stage, stage, job)
+
+    def serve(self, host="127.0.0.1", port=8765, socket_path=None):
+        if socket_path is not None:
+            if not hasattr(socketserver, "UnixStreamServer"):
+                raise ValueError("Unix sockets are not available on this platform, use --port")
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.server = UnixHTTPServer(socket_path, api_handler(self))
+            self.socket_path = socket_path
+            os.chmod(socket_path, 0o600)
+        else:
+            self.server = http.server.ThreadingHTTPServer((host, port), api_handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def run(self, tick=1.0):
+        for job in self.queue.recover():
+            if job["submitted"] is not None:
+                # the submission is matched to a task it created before posting again
+                self.log(job, "resuming an interrupted submission")
+        while not self.stopped.is_set():
+            self.dispatch()
+            self.wake.wait(tick)
+            self.wake.clear()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+    def close(self, wait=True):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            if self.socket_path is not None and os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        for pool in self.pools.values():
+            pool.shutdown(wait=wait)
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:
+    UnixHTTPServer = None
+
+
+def api_handler(daemon):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, data):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def dispatch(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length > 0 else b""
+            url = urllib.parse.urlsplit(self.path)
+            path = url.path.rstrip("/")
+            query = dict(urllib.parse.parse_qsl(url.query))
+            match = re.match(r"/jobs/(\d+)(/retry)?$", path)
+            try:
+                if method == "GET" and path == "/status":
+                    return self.send_json(200, daemon.status())
+                if method == "GET" and path == "/jobs":
+                    if query.get("state") is not None and query["state"] not in job_states:
+                        raise ValueError(f"Unknown state {query['state']}: use {', '.join(job_states)}")
+                    return self.send_json(200, daemon.queue.jobs(query.get("state"), query.get("limit")))
+                if method == "POST" and path == "/jobs":
+                    ids = daemon.enqueue(json.loads(body or b"null"))
+                    return self.send_json(201, {"jobs": ids})
+                if match is not None:
+                    job_id = int(match.group(1))
+                    if method == "GET" and match.group(2) is None:
+                        job = daemon.queue.get(job_id)
+                    elif method == "DELETE" and match.group(2) is None:
+                        job = daemon.cancel(job_id)
+                    elif method == "POST" and match.group(2) is not None:
+                        job = daemon.retry(job_id)
+                    else:
+                        return self.send_json(405, {"message": "Method not allowed"})
+                    if job is None:
+                        return self.send_json(404, {"message": f"Job {job_id} not found"})
+                    return self.send_json(200, job)
+                return self.send_json(404, {"message": "Not found"})
+            except JobError as e:
+                return self.send_json(409, {"message": str(e)})
+            except AppEEARSError as e:
+                return self.send_json(400, {"message": e.message})
+            except (KeyError, OSError, TypeError, ValueError) as e:
+                message = f"Missing field {e}" if isinstance(e, KeyError) else str(e)
+                return self.send_json(400, {"message": message})
+
+        def do_GET(self):
+            self.dispatch("GET")
+
+        def do_POST(self):
+            self.dispatch("POST")
+
+        def do_DELETE(self):
+            self.dispatch("DELETE")
+
+    return Handler
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=30):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+# call the API of a running daemon at url, http://host:port or the path
+# of its Unix socket, default $APPEEARS_DAEMON_URL or 127.0.0.1:8765
+def daemon_request(method, path, data=None, url=None, timeout=30):
+    url = url or os.environ.get("APPEEARS_DAEMON_URL") or default_url
+    if url.startswith("http://"):
+        parts = urllib.parse.urlsplit(url)
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+    else:
+        connection = UnixHTTPConnection(url[len("unix://"):] if url.startswith("unix://") else url,
+                                        timeout=timeout)
+    body = json.dumps(data).encode() if data is not None else None
+    try:
+        connection.request(method, path, body, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        result = json.loads(response.read() or b"null")
+    finally:
+        connection.close()
+    if response.status >= 400:
+        raise AppEEARSError(response.status, (result or {}).get("message"))
+    return result
+
+
+# run the daemon until interrupted, jobs held by workers at that point
+# are handed back when it starts again
+def run_daemon(dest_dir, db=default_db, host="127.0.0.1", port=8765, socket_path=None,
+               scheduler=None, **options):
+    client = get_client()
+    # log in before serving so a missing password is asked for up front
+    client.auth_token()
+    queue = JobQueue(db)
+    daemon = Daemon(queue, dest_dir, client=client, scheduler=scheduler, **options)
+    try:
+        daemon.serve(host, port, socket_path)
+    except (OSError, ValueError) as e:
+        queue.close()
+        sys.exit(f"Could not listen on {socket_path or f'{host}:{port}'}: {e}")
+    print(f"appeears daemon on {socket_path or f'http://{host}:{port}'}, jobs in {db}", flush=True)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *args: daemon.stop())
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+    busy = sum(len(running) for running in daemon.running.values())
+    if busy > 0:
+        print(f"Stopping, waiting for {busy} running jobs, interrupt again to stop now", flush=True)
+    try:
+        daemon.close(wait=True)
+    except KeyboardInterrupt:
+        pass
+    queue.close()
+    return daemon
+
+
+def connection_error(url, e):
+    sys.exit(f"No appeears daemon at {url or os.environ.get('APPEEARS_DAEMON_URL') or default_url}: {e}")
+
+
+# send jobs from a manifest, a task spec and task ids to a running daemon
+def enqueue_jobs(manifest=None, tids=None, spec=None, dest=None, url=None):
+    from appeears.appeears import read_manifest
+
+    rows = read_manifest(manifest) if manifest is not None else []
+    if spec is not None:
+        try:
+            spec = TaskSpec.load(spec).to_dict()
+        except (OSError, KeyError, ValueError) as e:
+            sys.exit(f"Invalid task spec {spec}: {e}")
+        for row in rows:
+            row["spec"] = spec
+    rows = rows + [{"task_id": tid} for tid in tids or []]
+    if len(rows) == 0:
+        sys.exit("Nothing to enqueue: pass --manifest or --tid")
+    for row in rows:
+        if dest is not None and not row.get("dest"):
+            row["dest"] = dest
+        if isinstance(row.get("dest"), str) and not is_sink(row["dest"]):
+            row["dest"] = os.path.abspath(row["dest"])
+    try:
+        ids = daemon_request("POST", "/jobs", rows, url)["jobs"]
+    except OSError as e:
+        connection_error(url, e)
+    print(f"Enqueued {len(ids)} jobs: {', '.join(str(job_id) for job_id in ids)}")
+    return ids
+
+
+# print jobs of a running daemon and how many are in every state, or
+# cancel or retry one job
+def daemon_report(job_id=None, state=None, limit=50, cancel=None, retry=None, url=None):
+    from tabulate import tabulate
+
+    try:
+        if cancel is not None:
+            job = daemon_request("DELETE", f"/jobs/{cancel}", url=url)
+            print(f"Job {cancel} cancelled")
+            return job
+        if retry is not None:
+            job = daemon_request("POST", f"/jobs/{retry}/retry", url=url)
+            print(f"Job {retry} {job['state']} again")
+            return job
+        if job_id is not None:
+            job = daemon_request("GET", f"/jobs/{job_id}", url=url)
+            print(json.dumps(job, indent=2))
+            return job
+        status = daemon_request("GET", "/status", url=url)
+        query = urllib.parse.urlencode(
+            {key: value for key, value in [("state", state), ("limit", limit)] if value is not None})
+        jobs = daemon_request("GET", f"/jobs?{query}", url=url)
+    except OSError as e:
+        connection_error(url, e)
+    print(", ".join(f"{name}: {count}" for name, count in sorted(status["jobs"].items())) or "No jobs")
+    print(", ".join(f"{name} {stage['running']}/{stage['workers']}"
+                    for name, stage in status["stages"].items()))
+    if len(jobs) > 0:
+        rows = [
+            {"job": job["job_id"], "name": job["name"], "state": job["state"],
+             "task_id": job["task_id"], "progress": f"{job['progress']:.0f}%",
+             "updated": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job["updated"])),
+             "error": (job["error"] or "")[:60]}
+            for job in jobs
+        ]
+        print(tabulate(rows, headers="keys", tablefmt="heavy_grid"))
+    return jobs
@@ -0,0 +1,722 @@
+"""Validate, repair and simplify task geometries before submission.
+
+Geometries are read from GeoJSON files or dicts, or from csv files of
+points with latitude and longitude columns, into NumPy arrays and run
+through one pipeline:
+
+    polygons    rings are closed, duplicate vertices and spikes removed,
+                degenerate rings dropped and exteriors and holes oriented
+                as in RFC 7946, then simplified with Douglas-Peucker to a
+                tolerance of half the product's pixel size. A ring whose
+                simplified form crosses itself, the exterior or another
+                hole is simplified again with a smaller tolerance, and
+                holes smaller than a pixel are dropped
+    points      missing coordinates are dropped, points are snapped to
+                the centre of their pixel on the MODIS and VIIRS
+                sinusoidal grid and deduplicated, and sets larger than
+                the per task limit are split into spatially compact parts
+
+Every part is a (task_type, params) pair as returned by task_geometry
+and can be passed to task_payload in its place.
+
+    from appeears.geometry import prepare_task
+
+    prepared = prepare_task("fields.geojson", "MOD13Q1.061")
+    print(prepared.summary())
+    for task_type, params in prepared.parts:
+        ...
+
+NumPy is required, pip install appeears[geometry].
+"""
+
+import csv
+import gc
+import json
+import math
+import os
+import sys
+from contextlib import contextmanager
+
+from appeears.appeears import product_list, resolution_meters
+
+# points accepted by the AppEEARS api in a single point task
+max_points = 1000
+
+meters_per_degree = 111320
+
+# sphere, tile width and upper left corner of the MODIS sinusoidal grid,
+# which VIIRS land products share, tiles hold 1200 pixels of 1 km
+earth_radius = 6371007.181
+tile_width = 1111950.5197665
+grid_origin = (-20015109.355798, 10007554.677899)
+
+# candidate names of point csv columns, compared in lower case
+latitude_columns = ["latitude", "lat", "y"]
+longitude_columns = ["longitude", "lon", "lng", "long", "x"]
+id_columns = ["id"]
+category_columns = ["category"]
+
+
+def require_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "appeears.geometry requires numpy: pip install appeears[geometry]")
+    return numpy
+
+
+class Points:
+    """Point coordinates as arrays with optional ids and categories."""
+
+    def __init__(self, lon, lat, ids=None, categories=None):
+        np = require_numpy()
+        self.lon = np.asarray(lon, dtype="float64")
+        self.lat = np.asarray(lat, dtype="float64")
+        self.ids = ids
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.lon)
+
+    def take(self, index):
+        return Points(
+            self.lon[index],
+            self.lat[index],
+            None if self.ids is None else [self.ids[i] for i in index],
+            None if self.categories is None else [self.categories[i] for i in index],
+        )
+
+
+# first column of a csv header matching one of the candidate names
+def find_column(names, candidates):
+    lowered = [name.strip().lower() for name in names]
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered.index(candidate)
+    return None
+
+
+def read_points_csv(path):
+    np = require_numpy()
+    with open(path, newline="", encoding="utf-8-sig") as infile:
+        reader = csv.reader(infile)
+        names = next(reader, [])
+        lat_column = find_column(names, latitude_columns)
+        lon_column = find_column(names, longitude_columns)
+        if lat_column is None or lon_column is None:
+            raise ValueError(
+                f"{path} needs latitude and longitude columns, found {', '.join(names)}")
+        rows = [row for row in reader if row]
+    id_column = find_column(names, id_columns)
+    category_column = find_column(names, category_columns)
+
+    def column(i):
+        return [row[i] if i < len(row) else "" for row in rows]
+
+    def coordinates(i):
+        try:
+            return np.array(column(i), dtype="float64")
+        except ValueError:
+            # empty cells become NaN and are dropped with a note
+            return np.array([value.strip() or "nan" for value in column(i)], dtype="float64")
+
+    return Points(
+        coordinates(lon_column),
+        coordinates(lat_column),
+        column(id_column) if id_column is not None else None,
+        column(category_column) if category_column is not None else None,
+    )
+
+
+# (geometry, properties) pairs of any GeoJSON object, features of a
+# collection are unpacked in one pass since point files can hold many
+def geometries(data, properties=None):
+    kind = data.get("type")
+    if kind == "FeatureCollection":
+        pairs = [
+            (feature["geometry"], feature.get("properties") or {})
+            for feature in data.get("features") or [] if feature.get("geometry") is not None
+        ]
+    elif kind == "Feature":
+        pairs = [(data["geometry"], data.get("properties") or {})
+                 ] if data.get("geometry") is not None else []
+    else:
+        pairs = [(data, properties or {})]
+    if any(geometry.get("type") == "GeometryCollection" for geometry, _ in pairs):
+        pairs = [
+            pair for geometry, properties in pairs
+            for pair in (
+                [(member, properties) for member in geometry.get("geometries") or []]
+                if geometry.get("type") == "GeometryCollection" else [(geometry, properties)]
+            )
+        ]
+    return pairs
+
+
+def as_ring(coordinates):
+    np = require_numpy()
+    try:
+        ring = np.array(coordinates, dtype="float64")
+    except ValueError:
+        ring = np.array([position[:2] for position in coordinates], dtype="float64")
+    if ring.ndim != 2 or ring.shape[0] == 0 or ring.shape[1] < 2:
+        raise ValueError("Polygon rings must be lists of [longitude, latitude] positions")
+    return ring[:, :2]
+
+
+def read_geojson(data):
+    np = require_numpy()
+    pairs = geometries(data)
+    points = [(geometry, properties) for geometry, properties in pairs
+              if geometry.get("type") == "Point"]
+    if len(points) < len(pairs):
+        # multipoints are rare, unpack them into single points
+        points = []
+        polygons = []
+        for geometry, properties in pairs:
+            kind = geometry.get("type")
+            coordinates = geometry.get("coordinates")
+            if kind == "Point":
+                points.append((geometry, properties))
+            elif kind == "MultiPoint":
+                points.extend(
+                    ({"coordinates": position}, properties) for position in coordinates)
+            elif kind == "Polygon":
+                polygons.append([as_ring(ring) for ring in coordinates])
+            elif kind == "MultiPolygon":
+                polygons.extend([as_ring(ring) for ring in polygon] for polygon in coordinates)
+            else:
+                raise ValueError(f"Unknown geometry type {kind}")
+        if points and polygons:
+            raise ValueError("Geometry mixes points and polygons, submit them as separate tasks")
+        if polygons:
+            return polygons
+    if not points:
+        raise ValueError("No features found in geometry")
+    try:
+        positions = np.array([geometry["coordinates"][:2] for geometry, _ in points], dtype="float64")
+    except (TypeError, ValueError):
+        raise ValueError("Point coordinates must be [longitude, latitude] positions")
+    ids = [properties.get("id", properties.get("ID")) for _, properties in points]
+    categories = [properties.get("category") for _, properties in points]
+    return Points(
+        positions[:, 0],
+        positions[:, 1],
+        ids if any(value is not None for value in ids) else None,
+        categories if any(value is not None for value in categories) else None,
+    )
+
+
+# the cyclic garbage collector rescans every parsed feature dict each
+# time it runs, which for large point files takes longer than the parsing
+@contextmanager
+def paused_gc():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def read_geometry(source):
+    """Points or a list of polygons, each a list of (n, 2) ring arrays.
+
+    source is a GeoJSON dict or the path of a GeoJSON file or of a csv
+    file of points with latitude and longitude columns and optional id
+    and category columns.
+    """
+    with paused_gc():
+        if isinstance(source, dict):
+            return read_geojson(source)
+        if os.fspath(source).lower().endswith(".csv"):
+            return read_points_csv(source)
+        with open(source) as infile:
+            return read_geojson(json.load(infile))
+
+
+# raise on coordinates that can not be longitude and latitude
+def check_range(lon, lat):
+    np = require_numpy()
+    outside = int(np.count_nonzero((np.abs(lon) > 180) | (np.abs(lat) > 90)))
+    if outside:
+        raise ValueError(
+            f"{outside} coordinates are outside longitude -180 to 180 and latitude -90 to 90, "
+            "are latitude and longitude swapped?")
+
+
+def signed_area(xy):
+    return 0.5 * float((xy[:-1, 0] * xy[1:, 1] - xy[1:, 0] * xy[:-1, 1]).sum())
+
+
+# ring in meters on a plane tangent at latitude lat0
+def to_meters(ring, lat0):
+    np = require_numpy()
+    return np.column_stack((
+        ring[:, 0] * math.cos(math.radians(lat0)) * meters_per_degree,
+        ring[:, 1] * meters_per_degree,
+    ))
+
+
+def count(repairs, name, amount=1):
+    if amount:
+        repairs[name] = repairs.get(name, 0) + amount
+
+
+def repair_ring(ring, repairs):
+    """Closed ring without missing coordinates, repeated vertices or spikes.
+
+    Returns None for rings with fewer than three distinct vertices.
+    """
+    np = require_numpy()
+    finite = np.isfinite(ring).all(axis=1)
+    if not finite.all():
+        count(repairs, "missing coordinates dropped", int((~finite).sum()))
+        ring = ring[finite]
+    if len(ring) == 0:
+        return None
+    check_range(ring[:, 0], ring[:, 1])
+    if not (ring[0] == ring[-1]).all():
+        count(repairs, "rings closed")
+        ring = np.vstack((ring, ring[:1]))
+    while True:
+        moved = np.concatenate(([True], (ring[1:] != ring[:-1]).any(axis=1)))
+        count(repairs, "duplicate vertices removed", int((~moved).sum()))
+        ring = ring[moved]
+        if len(ring) < 4:
+            return None
+        # a vertex whose neighbours coincide is a spike of zero width
+        open_ring = ring[:-1]
+        spike = (np.roll(open_ring, 1, axis=0) == np.roll(open_ring, -1, axis=0)).all(axis=1)
+        if not spike.any():
+            return ring
+        count(repairs, "spikes removed", int(spike.sum()))
+        open_ring = open_ring[~spike]
+        if len(open_ring) == 0:
+            return None
+        ring = np.vstack((open_ring, open_ring[:1]))
+
+
+def douglas_peucker(xy, tolerance):
+    """Mask of the vertices of a line kept by Douglas-Peucker.
+
+    Runs on an explicit stack of ranges with the distances of each range
+    computed in one vectorised step, so long rings need no recursion.
+    """
+    np = require_numpy()
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(xy) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start = xy[first]
+        dx, dy = xy[last] - start
+        between = xy[first + 1:last] - start
+        length = math.hypot(dx, dy)
+        if length == 0:
+            distance = np.hypot(between[:, 0], between[:, 1])
+        else:
+            distance = np.abs(dy * between[:, 0] - dx * between[:, 1]) / length
+        i = int(np.argmax(distance))
+        if distance[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def cross(u, v):
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+
+# pairs (i, j) with lo_b[j] between lo_a[i] and hi_a[i], found by
+# binary search in the sorted lo_b instead of comparing every pair
+def overlapping(lo_a, hi_a, lo_b):
+    np = require_numpy()
+    order = np.argsort(lo_b, kind="stable")
+    start = np.searchsorted(lo_b[order], lo_a, "left")
+    stop = np.searchsorted(lo_b[order], hi_a, "right")
+    counts = stop - start
+    i = np.repeat(np.arange(len(lo_a)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return i, order[np.repeat(start, counts) + offsets]
+
+
+def rings_cross(a, b):
+    """Whether a segment of ring a properly crosses a segment of ring b.
+
+    Segments meeting at a vertex do not count, so a ring can be tested
+    against itself. Only pairs of segments whose x ranges overlap are
+    compared.
+    """
+    np = require_numpy()
+    p1, p2 = a[:-1], a[1:]
+    q1, q2 = b[:-1], b[1:]
+    a_lo, a_hi = np.minimum(p1, p2), np.maximum(p1, p2)
+    b_lo, b_hi = np.minimum(q1, q2), np.maximum(q1, q2)
+    i1, j1 = overlapping(a_lo[:, 0], a_hi[:, 0], b_lo[:, 0])
+    j2, i2 = overlapping(b_lo[:, 0], b_hi[:, 0], a_lo[:, 0])
+    i = np.concatenate((i1, i2))
+    j = np.concatenate((j1, j2))
+    y = (a_lo[i, 1] <= b_hi[j, 1]) & (b_lo[j, 1] <= a_hi[i, 1])
+    i, j = i[y], j[y]
+    r = p2[i] - p1[i]
+    d = q2[j] - q1[j]
+    crossing = (cross(r, q1[j] - p1[i]) * cross(r, q2[j] - p1[i]) < 0) & \
+        (cross(d, p1[i] - q1[j]) * cross(d, p2[i] - q1[j]) < 0)
+    return bool(crossing.any())
+
+
+def simplify_ring(xy, tolerance, others, attempts=4):
+    """Mask of the vertices of a ring kept by a topology preserving simplification.
+
+    The tolerance is halved until the simplified ring neither crosses
+    itself nor any of others, keeping every vertex when no attempt works.
+    """
+    np = require_numpy()
+    for _ in range(attempts):
+        keep = douglas_peucker(xy, tolerance)
+        if keep.sum() >= 4:
+            simple = xy[keep]
+            if not rings_cross(simple, simple) and not any(rings_cross(simple, other) for other in others):
+                return keep
+        tolerance = tolerance / 2
+    return np.ones(len(xy), dtype=bool)
+
+
+def prepare_polygon(polygon, tolerance, pixel_area, repairs):
+    """Repaired and simplified rings of a polygon and its area in square meters."""
+    rings = []
+    for ring in polygon:
+        repaired = repair_ring(ring, repairs)
+        if repaired is None:
+            count(repairs, "degenerate rings dropped")
+            if not rings:
+                # without an exterior the holes mean nothing
+                return [], 0.0
+            continue
+        rings.append(repaired)
+    if not rings:
+        return [], 0.0
+    lat0 = float(rings[0][:, 1].mean())
+    area = 0.0
+    kept = []
+    kept_xy = []
+    for i, ring in enumerate(rings):
+        xy = to_meters(ring, lat0)
+        ring_area = signed_area(xy)
+        if ring_area == 0:
+            count(repairs, "degenerate rings dropped")
+            if i == 0:
+                return [], 0.0
+            continue
+        # exteriors run counterclockwise and holes clockwise
+        if (ring_area < 0) == (i == 0):
+            count(repairs, "rings reoriented")
+            ring = ring[::-1]
+            xy = xy[::-1]
+        if i > 0 and abs(ring_area) < pixel_area:
+            count(repairs, "holes smaller than a pixel dropped")
+            continue
+        if tolerance:
+            keep = simplify_ring(xy, tolerance, kept_xy)
+            ring = ring[keep]
+            xy = xy[keep]
+        kept.append(ring)
+        kept_xy.append(xy)
+        area = area + abs(ring_area) if i == 0 else area - abs(ring_area)
+    return kept, max(area, 0.0)
+
+
+def sinusoidal_cells(lon, lat, cell):
+    """Row and column of the cell of size cell meters holding each point."""
+    np = require_numpy()
+    y = np.radians(lat) * earth_radius
+    x = np.radians(lon) * earth_radius * np.cos(np.radians(lat))
+    col = np.floor((x - grid_origin[0]) / cell).astype("int64")
+    row = np.floor((grid_origin[1] - y) / cell).astype("int64")
+    return row, col
+
+
+def cell_centres(row, col, cell):
+    np = require_numpy()
+    y = grid_origin[1] - (row + 0.5) * cell
+    x = grid_origin[0] + (col + 0.5) * cell
+    lat = np.degrees(y / earth_radius)
+    lon = np.degrees(x / (earth_radius * np.cos(np.radians(lat))))
+    return lon, lat
+
+
+def snap_points(points, cell):
+    """Points snapped to the centres of their grid cells.
+
+    Returns the snapped points and the cell key of every point.
+    """
+    np = require_numpy()
+    row, col = sinusoidal_cells(points.lon, points.lat, cell)
+    lon, lat = cell_centres(row, col, cell)
+    columns = int(math.ceil(-2 * grid_origin[0] / cell)) + 1
+    snapped = Points(np.round(lon, 7), np.round(lat, 7), points.ids, points.categories)
+    return snapped, row * columns + col
+
+
+def dedupe(keys):
+    """Indices of the first point of every key in input order and, for
+    every point, the position of its kept point."""
+    np = require_numpy()
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.reshape(-1)]
+
+
+def split_points(points, limit):
+    """Parts of at most limit points grouped by sinusoidal tile.
+
+    Returns the index of the points of every part.
+    """
+    np = require_numpy()
+    if len(points) <= limit:
+        return [np.arange(len(points))]
+    row, col = sinusoidal_cells(points.lon, points.lat, tile_width)
+    order = np.lexsort((col, row))
+    return [order[start:start + limit] for start in range(0, len(points), limit)]
+
+
+def point_params(points):
+    coordinates = [
+        {"latitude": lat, "longitude": lon}
+        for lon, lat in zip(points.lon.tolist(), points.lat.tolist())
+    ]
+    for key, values in [("id", points.ids), ("category", points.categories)]:
+        if values is None:
+            continue
+        for coordinate, value in zip(coordinates, values):
+            if value not in [None, ""]:
+                coordinate[key] = str(value)
+    return {"coordinates": coordinates}
+
+
+def polygon_params(polygons):
+    return {
+        "geo": {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {},
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [ring.tolist() for ring in polygon],
+                    },
+                }
+                for polygon in polygons
+            ],
+        }
+    }
+
+
+class PreparedGeometry:
+    """Result of the geometry pipeline.
+
+    parts are (task_type, params) pairs, one per task. bbox is
+    [west, south, east, north] of the prepared geometry, area the area
+    of polygons in square meters, repairs counts every fix applied and
+    point_index maps every input point to its kept point.
+    """
+
+    def __init__(self, task_type, parts, bbox, area=0.0, pixel_size=None, tolerance=None,
+                 vertices=(0, 0), points=(0, 0), repairs=None, point_index=None, point_part=None):
+        self.task_type = task_type
+        self.parts = parts
+        self.bbox = bbox
+        self.area = area
+        self.pixel_size = pixel_size
+        self.tolerance = tolerance
+        self.vertices = vertices
+        self.points = points
+        self.repairs = repairs or {}
+        self.point_index = point_index
+        self.point_part = point_part
+
+    def __repr__(self):
+        return f"PreparedGeometry({self.task_type!r}, parts={len(self.parts)}, bbox={self.bbox})"
+
+    # estimated pixels per layer and date covered by the polygons
+    def pixels(self):
+        if not self.pixel_size:
+            return None
+        return int(math.ceil(self.area / self.pixel_size ** 2))
+
+    def summary(self):
+        summary = {
+            "type": self.task_type,
+            "tasks": len(self.parts),
+            "bbox": ", ".join(f"{value:.5f}" for value in self.bbox),
+        }
+        if self.task_type == "area":
+            summary["vertices"] = f"{self.vertices[0]} -> {self.vertices[1]}"
+            summary["area_km2"] = round(self.area / 1e6, 3)
+            if self.pixels() is not None:
+                summary["pixels"] = self.pixels()
+            if self.tolerance:
+                summary["tolerance_m"] = round(self.tolerance, 2)
+        else:
+            summary["points"] = f"{self.points[0]} -> {self.points[1]}"
+        for name, amount in sorted(self.repairs.items()):
+            summary[name] = amount
+        return summary
+
+    # GeoJSON of the prepared geometry of one part or of all parts
+    def to_geojson(self, part=None):
+        parts = self.parts if part is None else [self.parts[part]]
+        features = []
+        for task_type, params in parts:
+            if task_type == "area":
+                features.extend(params["geo"]["features"])
+                continue
+            for coordinate in params["coordinates"]:
+                features.append({
+                    "type": "Feature",
+                    "properties": {
+                        key: value for key, value in coordinate.items()
+                        if key in ["id", "category"]
+                    },
+                    "geometry": {
+                        "type": "Point",
+                        "coordinates": [coordinate["longitude"], coordinate["latitude"]],
+                    },
+                })
+        return {"type": "FeatureCollection", "features": features}
+
+
+def prepare(geometry, pixel_size=None, grid_cell=None, tolerance=None, simplify=True,
+            snap=True, limit=max_points):
+    """Run a geometry through the pipeline.
+
+    geometry is anything read_geometry accepts. Rings are simplified to
+    tolerance meters, by default half of pixel_size, and points are
+    snapped to a sinusoidal grid of grid_cell meters when given, or else
+    only exact duplicates are removed. Point sets are split into parts of
+    at most limit points.
+    """
+    require_numpy()
+    with paused_gc():
+        return prepare_geometry(read_geometry(geometry), pixel_size, grid_cell, tolerance,
+                                simplify, snap, limit)
+
+
+# points or polygons from read_geometry through the pipeline
+def prepare_geometry(data, pixel_size, grid_cell, tolerance, simplify, snap, limit):
+    np = require_numpy()
+    repairs = {}
+    if isinstance(data, Points):
+        finite = np.isfinite(data.lon) & np.isfinite(data.lat)
+        if not finite.all():
+            count(repairs, "missing coordinates dropped", int((~finite).sum()))
+            data = data.take(np.flatnonzero(finite))
+        if len(data) == 0:
+            raise ValueError("No points with coordinates found in geometry")
+        check_range(data.lon, data.lat)
+        if snap and grid_cell:
+            snapped, keys = snap_points(data, grid_cell)
+        else:
+            snapped, keys = data, np.column_stack((data.lon, data.lat))
+        first, point_index = dedupe(keys)
+        count(repairs, "duplicate points merged", len(data) - len(first))
+        kept = snapped.take(first)
+        parts = split_points(kept, limit or len(kept))
+        point_part = np.empty(len(kept), dtype="int64")
+        for p, index in enumerate(parts):
+            point_part[index] = p
+        bbox = [float(kept.lon.min()), float(kept.lat.min()),
+                float(kept.lon.max()), float(kept.lat.max())]
+        return PreparedGeometry(
+            "point",
+            [("point", point_params(kept.take(index))) for index in parts],
+            bbox,
+            pixel_size=pixel_size,
+            points=(len(data), len(kept)),
+            repairs=repairs,
+            point_index=point_index,
+            point_part=point_part[point_index],
+        )
+
+    if tolerance is None and simplify and pixel_size:
+        tolerance = pixel_size / 2
+    if not simplify:
+        tolerance = None
+    pixel_area = (pixel_size or 0) ** 2
+    polygons = []
+    area = 0.0
+    for polygon in data:
+        rings, polygon_area = prepare_polygon(polygon, tolerance, pixel_area, repairs)
+        if rings:
+            polygons.append(rings)
+            area = area + polygon_area
+    if not polygons:
+        raise ValueError("No valid polygons left in geometry after repair")
+    vertices = np.vstack([ring for polygon in polygons for ring in polygon])
+    return PreparedGeometry(
+        "area",
+        [("area", polygon_params(polygons))],
+        [float(value) for value in np.concatenate((vertices.min(axis=0), vertices.max(axis=0)))],
+        area=area,
+        pixel_size=pixel_size,
+        tolerance=tolerance,
+        vertices=(sum(len(ring) for polygon in data for ring in polygon), len(vertices)),
+        repairs=repairs,
+    )
+
+
+# cell size of the sinusoidal grid of MODIS and VIIRS tiled products,
+# None for products on other grids
+def product_grid(product, pixel_size):
+    platform = str(product.get("Platform", "")).upper()
+    if "MODIS" not in platform and "VIIRS" not in platform:
+        return None
+    if product.get("RasterType", "Tile") != "Tile" or pixel_size not in [250, 500, 1000]:
+        return None
+    return tile_width * pixel_size / 1200000
+
+
+def prepare_task(geometry, product, tolerance=None, simplify=True, snap=True,
+                 limit=max_points, offline=False):
+    """Run a geometry through the pipeline with the pixel size and grid of a product."""
+    catalog = {p["ProductAndVersion"]: p for p in product_list(offline=offline)}
+    if product not in catalog:
+        raise ValueError(f"Product {product} not found in product catalog")
+    pixel_size = resolution_meters(catalog[product].get("Resolution", ""))
+    return prepare(
+        geometry,
+        pixel_size=pixel_size,
+        grid_cell=product_grid(catalog[product], pixel_size),
+        tolerance=tolerance,
+        simplify=simplify,
+        snap=snap,
+        limit=limit,
+    )
+
+
+# print what the pipeline does to a geometry and optionally write the result
+def geometry_report(geometry, product, out=None, tolerance=None, simplify=True, snap=True,
+                    limit=max_points, offline=False):
+    from tabulate import tabulate
+
+    try:
+        prepared = prepare_task(geometry, product, tolerance=tolerance, simplify=simplify,
+                                snap=snap, limit=limit, offline=offline)
+    except (ImportError, ValueError) as e:
+        sys.exit(str(e))
+    print(tabulate(list(prepared.summary().items()), tablefmt="heavy_grid"))
+    if out is not None:
+        with open(out, "w") as outfile:
+            json.dump(prepared.to_geojson(), outfile)
+        print(f"Wrote prepared geometry to {out}")
+    return prepared
@@ -0,0 +1,380 @@
+"""Timing and metrics of every AppEEARS API request.
+
+Switched on with appeears --metrics or APPEEARS_METRICS, or by calling
+enable before the first client is created. Every request attempt is
+recorded with its endpoint, status code, retry attempt, bytes and the
+time spent in DNS lookup, TCP connect, TLS handshake, waiting for the
+first byte and transferring the body. Connection phases are zero when a
+pooled connection is reused.
+
+Attempts are appended to a JSONL trace file as they finish, summed per
+endpoint for a table printed at the end of the run and, for long running
+sync and watch jobs, periodically written to a Prometheus textfile which
+node_exporter's textfile collector can pick up.
+
+    from appeears import metrics
+
+    metrics.enable(trace="trace.jsonl", textfile="appeears.prom")
+    ...
+    metrics.finish()
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+# upper bounds in seconds of the request duration histogram
+buckets = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, float("inf")]
+
+# durations kept per endpoint for the percentiles of the summary
+recent_samples = 10000
+
+phases = ["dns", "connect", "tls", "ttfb", "transfer"]
+
+# recorder of this process, None while metrics are off
+recorder = None
+
+# connection phases of the request running in this thread
+connection_phases = threading.local()
+
+
+def reset_phases():
+    connection_phases.values = {"dns": 0.0, "connect": 0.0, "tls": 0.0}
+
+
+def add_phase(phase, seconds):
+    values = getattr(connection_phases, "values", None)
+    if values is not None:
+        values[phase] = values[phase] + seconds
+
+
+class MetricsRecorder:
+    """Collects request attempts into a trace and per endpoint totals.
+
+    The textfile is rewritten at most every textfile_interval seconds
+    while requests are recorded and once more by finish.
+    """
+
+    def __init__(self, trace=None, textfile=None, textfile_interval=15):
+        self.trace = open(trace, "a") if trace else None
+        self.trace_path = trace
+        self.textfile = textfile
+        self.textfile_interval = textfile_interval
+        self.textfile_written = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.statuses = {}
+
+    def totals(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = dict(
+                {"calls": 0, "retries": 0, "errors": 0, "bytes": 0, "seconds": 0.0, "max": 0.0,
+                 "buckets": [0] * len(buckets), "recent": deque(maxlen=recent_samples)},
+                **{phase: 0.0 for phase in phases},
+            )
+        return self.endpoints[endpoint]
+
+    # record one finished attempt, times are in seconds
+    def record(self, method, endpoint, url, attempt, status=None, error=None, nbytes=0, **timings):
+        total = sum(timings.get(phase, 0.0) for phase in phases)
+        event = {
+            "time": round(time.time(), 3),
+            "method": method.upper(),
+            "endpoint": endpoint,
+            "path": url.split("://", 1)[-1].split("/", 1)[-1].split("?")[0],
+            "status": status,
+            "attempt": attempt,
+            "bytes": nbytes,
+            "total_ms": round(total * 1000, 2),
+        }
+        for phase in phases:
+            event[f"{phase}_ms"] = round(timings.get(phase, 0.0) * 1000, 2)
+        if error is not None:
+            event["error"] = error
+        with self.lock:
+            totals = self.totals(endpoint)
+            totals["calls"] = totals["calls"] + 1
+            totals["retries"] = totals["retries"] + (attempt > 0)
+            totals["errors"] = totals["errors"] + (status is None or status >= 400)
+            totals["bytes"] = totals["bytes"] + nbytes
+            totals["seconds"] = totals["seconds"] + total
+            totals["max"] = max(totals["max"], total)
+            totals["recent"].append(total)
+            for phase in phases:
+                totals[phase] = totals[phase] + timings.get(phase, 0.0)
+            for i, bound in enumerate(buckets):
+                if total <= bound:
+                    totals["buckets"][i] = totals["buckets"][i] + 1
+                    break
+            key = (endpoint, method.upper(), str(status or error))
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            if self.trace is not None:
+                self.trace.write(json.dumps(event) + "\n")
+                self.trace.flush()
+            due = self.textfile and time.time() - self.textfile_written >= self.textfile_interval
+            if due:
+                self.textfile_written = time.time()
+        if due:
+            self.write_textfile()
+        return event
+
+    # clear the connection phases before an attempt in this thread
+    def start(self):
+        reset_phases()
+
+    # record an attempt which ended without a response
+    def failed(self, error, method, endpoint, url, attempt, started):
+        values = getattr(connection_phases, "values", None) or {}
+        waited = time.perf_counter() - started - sum(values.values())
+        return self.record(method, endpoint, url, attempt, error=type(error).__name__,
+                           ttfb=max(0.0, waited), **values)
+
+    # record an aiohttp attempt from the timings its trace config collected
+    def observe_async(self, timings, method, endpoint, url, attempt, started, headers_at,
+                      status=None, error=None, nbytes=0):
+        setup = timings.get("dns", 0.0) + timings.get("connect", 0.0)
+        if headers_at is None:
+            headers_at = time.perf_counter() - started
+            transfer = 0.0
+        else:
+            transfer = time.perf_counter() - started - headers_at
+        return self.record(method, endpoint, url, attempt, status, error, nbytes,
+                           dns=timings.get("dns", 0.0), connect=timings.get("connect", 0.0),
+                           ttfb=max(0.0, headers_at - setup), transfer=max(0.0, transfer))
+
+    # record a requests response, streamed responses are recorded when
+    # they are closed so the transfer of the body is included
+    def observe(self, response, method, endpoint, url, attempt, started, stream=False):
+        values = getattr(connection_phases, "values", None) or {}
+        headers = response.elapsed.total_seconds()
+        timings = dict(values, ttfb=max(0.0, headers - sum(values.values())))
+
+        def done():
+            nbytes = len(response.content) if not stream else (
+                response.raw.tell() if hasattr(response.raw, "tell") else 0)
+            timings["transfer"] = max(0.0, time.perf_counter() - started - headers)
+            self.record(method, endpoint, url, attempt, response.status_code, nbytes=nbytes, **timings)
+
+        if not stream:
+            done()
+            return response
+        close = response.close
+        closed = []
+
+        def close_and_record():
+            close()
+            if len(closed) == 0:
+                closed.append(True)
+                done()
+
+        response.close = close_and_record
+        return response
+
+    # per endpoint rows for the summary table
+    def summary(self):
+        from appeears.appeears import humansize
+
+        rows = []
+        with self.lock:
+            for endpoint in sorted(self.endpoints):
+                totals = self.endpoints[endpoint]
+                calls = totals["calls"]
+                row = {
+                    "endpoint": endpoint,
+                    "calls": calls,
+                    "retries": totals["retries"],
+                    "errors": totals["errors"],
+                    "bytes": humansize(totals["bytes"]),
+                    "mean_ms": round(totals["seconds"] / calls * 1000, 1),
+                    "p50_ms": quantile(totals["recent"], 0.5),
+                    "p95_ms": quantile(totals["recent"], 0.95),
+                    "max_ms": round(totals["max"] * 1000, 1),
+                }
+                for phase in phases:
+                    row[f"{phase}_ms"] = round(totals[phase] / calls * 1000, 1)
+                rows.append(row)
+        return rows
+
+    def exposition(self, openmetrics=False):
+        with self.lock:
+            lines = []
+
+            def family(name, kind, help_text):
+                family_name = name[:-len("_total")] if openmetrics and name.endswith("_total") else name
+                lines.append(f"# HELP {family_name} {help_text}")
+                lines.append(f"# TYPE {family_name} {kind}")
+
+            family("appeears_requests_total", "counter", "AppEEARS API request attempts by status code")
+            for (endpoint, method, status), count in sorted(self.statuses.items()):
+                lines.append(
+                    f'appeears_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+            family("appeears_retries_total", "counter", "AppEEARS API request attempts which were retries")
+            for endpoint, totals in sorted(self.endpoints.items()):
+                lines.append(f'appeears_retries_total{{endpoint="{endpoint}"}} {totals["retries"]}')
+            family("appeears_response_bytes_total", "counter", "Bytes received from the AppEEARS API")
+            for endpoint, totals in sorted(self.endpoints.items()):
+                lines.append(f'appeears_response_bytes_total{{endpoint="{endpoint}"}} {totals["bytes"]}')
+            family("appeears_request_phase_seconds_total", "counter",
+                   "Seconds spent in each phase of AppEEARS API requests")
+            for endpoint, totals in sorted(self.endpoints.items()):
+                for phase in phases:
+                    lines.append(
+                        f'appeears_request_phase_seconds_total{{endpoint="{endpoint}",phase="{phase}"}} '
+                        f'{totals[phase]:.6f}')
+            family("appeears_request_duration_seconds", "histogram", "Duration of AppEEARS API requests")
+            for endpoint, totals in sorted(self.endpoints.items()):
+                seen = 0
+                for bound, count in zip(buckets, totals["buckets"]):
+                    seen = seen + count
+                    le = "+Inf" if bound == float("inf") else bound
+                    lines.append(
+                        f'appeears_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{le}"}} {seen}')
+                lines.append(
+                    f'appeears_request_duration_seconds_sum{{endpoint="{endpoint}"}} {totals["seconds"]:.6f}')
+                lines.append(
+                    f'appeears_request_duration_seconds_count{{endpoint="{endpoint}"}} {totals["calls"]}')
+            family("appeears_run_start_time_seconds", "gauge", "Start of this appeears run as epoch seconds")
+            lines.append(f"appeears_run_start_time_seconds {self.started:.3f}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    # write the textfile atomically so the collector never sees half of it,
+    # OpenMetrics when the file name ends in .om
+    def write_textfile(self):
+        tmp_path = f"{self.textfile}.{os.getpid()}.{threading.get_ident()}.tmp"
+        text = self.exposition(openmetrics=self.textfile.endswith(".om"))
+        with open(tmp_path, "w") as outfile:
+            outfile.write(text)
+        os.replace(tmp_path, self.textfile)
+
+    def close(self):
+        if self.textfile:
+            self.write_textfile()
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+
+# nearest rank quantile of durations in seconds, in ms
+def quantile(values, q):
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+
+def enable(trace=None, textfile=None, textfile_interval=15):
+    global recorder
+    recorder = MetricsRecorder(trace, textfile, textfile_interval)
+    return recorder
+
+
+# print the summary table, write the textfile and turn metrics off
+def finish():
+    global recorder
+    if recorder is None:
+        return
+    from tabulate import tabulate
+
+    current = recorder
+    recorder = None
+    rows = current.summary()
+    current.close()
+    if len(rows) == 0:
+        return
+    print("\n" + "Request metrics" + "\n")
+    print(tabulate(rows, headers="keys", tablefmt="heavy_grid"))
+    if current.trace_path:
+        print(f"Request trace written to {current.trace_path}")
+    if current.textfile:
+        print(f"Metrics written to {current.textfile}")
+
+
+# resolve before connecting so the lookup is timed on its own, the
+# connection then goes to the resolved address
+def timed_new_conn(connection, new_conn):
+    start = time.perf_counter()
+    dns_host = getattr(connection, "_dns_host", None)
+    if dns_host is not None:
+        try:
+            address = socket.getaddrinfo(dns_host, connection.port, 0, socket.SOCK_STREAM)[0][4][0]
+        except OSError:
+            address = None
+        add_phase("dns", time.perf_counter() - start)
+        start = time.perf_counter()
+        if address is not None:
+            connection._dns_host = address
+    try:
+        return new_conn()
+    finally:
+        if dns_host is not None:
+            connection._dns_host = dns_host
+        add_phase("connect", time.perf_counter() - start)
+
+
+# requests adapter whose connections time their dns, connect and tls phases
+def timed_adapter(**kwargs):
+    import requests
+    from urllib3 import connection, connectionpool
+
+    class TimedHTTPConnection(connection.HTTPConnection):
+        def _new_conn(self):
+            return timed_new_conn(self, super()._new_conn)
+
+    class TimedHTTPSConnection(connection.HTTPSConnection):
+        def _new_conn(self):
+            return timed_new_conn(self, super()._new_conn)
+
+        def connect(self):
+            values = getattr(connection_phases, "values", None) or {}
+            before = values.get("dns", 0.0) + values.get("connect", 0.0)
+            start = time.perf_counter()
+            super().connect()
+            values = getattr(connection_phases, "values", None) or {}
+            after = values.get("dns", 0.0) + values.get("connect", 0.0)
+            add_phase("tls", max(0.0, time.perf_counter() - start - (after - before)))
+
+    class TimedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    class TimedAdapter(requests.adapters.HTTPAdapter):
+        def init_poolmanager(self, *args, **pool_kwargs):
+            super().init_poolmanager(*args, **pool_kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": TimedHTTPConnectionPool,
+                "https": TimedHTTPSConnectionPool,
+            }
+
+    return TimedAdapter(**kwargs)
+
+
+# aiohttp trace config timing dns and connection setup into the dict
+# passed as trace_request_ctx
+def aiohttp_trace(aiohttp):
+    async def dns_start(session, context, params):
+        context.trace_request_ctx["dns_start"] = time.perf_counter()
+
+    async def dns_end(session, context, params):
+        timings = context.trace_request_ctx
+        timings["dns"] = timings.get("dns", 0.0) + time.perf_counter() - timings.pop("dns_start")
+
+    async def connect_start(session, context, params):
+        context.trace_request_ctx["connect_start"] = time.perf_counter()
+
+    async def connect_end(session, context, params):
+        timings = context.trace_request_ctx
+        timings["connect"] = timings.get("connect", 0.0) + time.perf_counter() - timings.pop(
+            "connect_start") - timings.get("dns", 0.0)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_dns_resolvehost_start.append(dns_start)
+    trace.on_dns_resolvehost_end.append(dns_end)
+    trace.on_connection_create_start.append(connect_start)
+    trace.on_connection_create_end.append(connect_end)
+    return trace
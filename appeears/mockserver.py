@@ -0,0 +1,514 @@
+"""Local stand-in for the AppEEARS API.
+
+Serves the endpoints used by the appeears client from memory so that the
+client can be exercised without NASA's service. Faults can be injected:
+a share of requests fail with configurable status codes, and a server
+side rate limit answers 429 with Retry-After once it is exceeded. Every
+response can be delayed by a fixed latency and file transfers share a
+bandwidth limit, so benchmarks see something closer to a real link.
+
+    from appeears.mockserver import MockAppEEARS
+
+    server = MockAppEEARS(fail_rate=0.2, rate_limit=50).start()
+    client = AppEEARSClient(base_url=server.url)
+    ...
+    server.stop()
+
+MockS3 is a path style S3 stand-in for download destinations such as
+s3://bucket/prefix, see appeears.sinks.
+
+It can also run on its own and serve the CLI:
+
+    python -m appeears.mockserver --port 8080 --tasks 2 --files 50 --file-size 1MB
+    appeears --api-url http://127.0.0.1:8080/api download --tid ... --dest out
+"""
+
+import argparse
+import hashlib
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+
+class MockAppEEARS:
+    def __init__(self, host="127.0.0.1", port=0, fail_rate=0.0, fail_statuses=(500, 503),
+                 retry_after=None, rate_limit=None, seed=None, latency=0.0, bandwidth=None,
+                 drop_after=None, ignore_range=False):
+        self.host = host
+        self.port = port
+        self.fail_rate = fail_rate
+        self.fail_statuses = fail_statuses
+        self.retry_after = retry_after
+        self.rate_limit = rate_limit
+        self.latency = latency
+        self.bandwidth = bandwidth
+        # the first transfer of every file is cut after drop_after bytes,
+        # with ignore_range files are always sent from the start
+        self.drop_after = drop_after
+        self.ignore_range = ignore_range
+        self.dropped = set()
+        # tokens answered with 401 like expired ones
+        self.revoked = set()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.allowance = rate_limit or 0
+        self.checked = time.monotonic()
+        self.link_free = time.monotonic()
+        self.stats = {"requests": 0, "faults": 0, "throttled": 0, "bytes_sent": 0}
+        self.products = [
+            {
+                "ProductAndVersion": "MOD13Q1.061",
+                "Product": "MOD13Q1",
+                "Version": "061",
+                "Platform": "Terra MODIS",
+                "Description": "Vegetation Indices",
+                "RasterType": "Tile",
+                "Resolution": "250m",
+                "TemporalGranularity": "16 day",
+                "TemporalExtentStart": "2000-02-18",
+                "TemporalExtentEnd": "Present",
+            },
+        ]
+        self.layers = {
+            "MOD13Q1.061": {
+                "_250m_16_days_NDVI": {"Description": "16 day NDVI average", "DataType": "int16",
+                                       "FillValue": -3000, "ScaleFactor": 0.0001, "Units": "NDVI"},
+                "_250m_16_days_EVI": {"Description": "16 day EVI average", "DataType": "int16",
+                                      "FillValue": -3000, "ScaleFactor": 0.0001, "Units": "EVI"},
+            },
+        }
+        self.projections = [{"Name": "geographic", "Description": "Geographic",
+                             "Platforms": "", "Proj4": "+proj=longlat +datum=WGS84 +no_defs"}]
+        self.tasks = {}
+        self.bundles = {}
+        self.digests = {}
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/api"
+
+    # add a finished task with a bundle of files given as name -> bytes,
+    # params default to every layer of the mock
+    def add_task(self, files, task_name="mock task", status="done", task_type="area", task_id=None,
+                 params=None):
+        task_id = task_id or str(uuid.uuid4())
+        self.tasks[task_id] = {
+            "task_id": task_id,
+            "task_name": task_name,
+            "task_type": task_type,
+            "status": status,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": params or {"layers": [{"layer": layer, "product": product}
+                                            for product in self.layers
+                                            for layer in self.layers[product]]},
+        }
+        self.bundles[task_id] = {str(uuid.uuid4()): (name, data)
+                                 for name, data in files.items()}
+        for file_id, (name, data) in self.bundles[task_id].items():
+            self.digests[file_id] = hashlib.sha256(data).hexdigest()
+        return task_id
+
+    # add a finished task with files GeoTIFFs of file_size random bytes,
+    # the files share one payload so large bundles stay cheap to serve
+    def add_synthetic_task(self, files=10, file_size=1024 * 1024, task_name="synthetic task",
+                           task_id=None):
+        data = self.random.getrandbits(8 * file_size).to_bytes(file_size, "little") if file_size else b""
+        return self.add_task(
+            {f"MOD13Q1.061__250m_16_days_NDVI_doy{2000 + n // 23}{1 + n % 23 * 16:03d}_aid0001.tif": data
+             for n in range(files)},
+            task_name=task_name,
+            task_id=task_id,
+        )
+
+    # block until the shared link has room for size more bytes
+    def throttle(self, size):
+        if self.bandwidth is None:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.link_free = max(now, self.link_free) + size / self.bandwidth
+            wait = self.link_free - now
+        time.sleep(wait)
+
+    # decide whether this request is throttled or fails
+    def fault(self):
+        with self.lock:
+            self.stats["requests"] = self.stats["requests"] + 1
+            if self.rate_limit is not None:
+                now = time.monotonic()
+                self.allowance = min(
+                    self.rate_limit, self.allowance + (now - self.checked) * self.rate_limit)
+                self.checked = now
+                if self.allowance < 1:
+                    self.stats["throttled"] = self.stats["throttled"] + 1
+                    return 429
+                self.allowance = self.allowance - 1
+            if self.fail_rate > 0 and self.random.random() < self.fail_rate:
+                self.stats["faults"] = self.stats["faults"] + 1
+                return self.random.choice(self.fail_statuses)
+        return None
+
+    def start(self):
+        self.server = http.server.ThreadingHTTPServer(
+            (self.host, self.port), self.handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handler(self):
+        mock = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, data, headers=None):
+                body = b"" if data is None else json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def authorized(self):
+                header = self.headers.get("Authorization", "")
+                if not header.startswith("Bearer ") or header[len("Bearer "):] in mock.revoked:
+                    self.send_json(401, {"message": "Missing or invalid token"})
+                    return False
+                return True
+
+            def dispatch(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length > 0 else b""
+                if mock.latency > 0:
+                    time.sleep(mock.latency)
+                status = mock.fault()
+                if status is not None:
+                    headers = {}
+                    if status == 429 or mock.retry_after is not None:
+                        headers["Retry-After"] = str(mock.retry_after or 1)
+                    return self.send_json(status, {"message": "Injected fault"}, headers)
+                path = self.path.split("?")[0].rstrip("/")
+                if not path.startswith("/api/"):
+                    return self.send_json(404, {"message": "Not found"})
+                path = path[len("/api/"):]
+                if method == "POST" and path == "login":
+                    return self.send_json(200, {
+                        "token_type": "Bearer",
+                        "token": uuid.uuid4().hex,
+                        "expiration": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 48 * 3600)),
+                    })
+                if method == "GET" and path == "product":
+                    return self.send_json(200, mock.products, {"ETag": '"products-1"'})
+                match = re.match(r"product/(.+)$", path)
+                if method == "GET" and match:
+                    if match.group(1) not in mock.layers:
+                        return self.send_json(404, {"message": f"Product {match.group(1)} not found"})
+                    return self.send_json(200, mock.layers[match.group(1)])
+                if method == "GET" and path == "spatial/proj":
+                    return self.send_json(200, mock.projections)
+                if not self.authorized():
+                    return
+                if path == "task" and method == "GET":
+                    # newest first, paged with limit and offset and filtered by
+                    # any other query parameter like the real api
+                    query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+                    offset = int(query.pop("offset", 0))
+                    limit = query.pop("limit", None)
+                    query.pop("pretty", None)
+                    tasks = [
+                        task for task in reversed(list(mock.tasks.values()))
+                        if all(str(task.get(key)) == value for key, value in query.items())
+                    ][offset:]
+                    if limit is not None:
+                        tasks = tasks[:int(limit)]
+                    return self.send_json(200, tasks)
+                if path == "task" and method == "POST":
+                    payload = json.loads(body or b"{}")
+                    task_id = mock.add_task(
+                        {}, payload.get("task_name", ""), "pending", payload.get("task_type", "area"),
+                        params=payload.get("params"))
+                    return self.send_json(202, {"task_id": task_id, "status": "pending"})
+                match = re.match(r"(task|status)/([^/]+)$", path)
+                if match and match.group(2) not in mock.tasks:
+                    return self.send_json(404, {"message": f"Task {match.group(2)} not found"})
+                if match and match.group(1) == "task" and method == "GET":
+                    return self.send_json(200, mock.tasks[match.group(2)])
+                if match and match.group(1) == "task" and method == "DELETE":
+                    del mock.tasks[match.group(2)]
+                    return self.send_json(204, None)
+                if match and method == "GET":
+                    task = mock.tasks[match.group(2)]
+                    if task["status"] == "processing":
+                        return self.send_json(200, {"task_id": task["task_id"], "progress": {"summary": 50}})
+                    return self.send_json(200, {"task_id": task["task_id"], "status": task["status"]})
+                match = re.match(r"bundle/([^/]+)$", path)
+                if match and method == "GET":
+                    if match.group(1) not in mock.bundles:
+                        return self.send_json(404, {"message": f"Bundle {match.group(1)} not found"})
+                    files = [
+                        {"file_id": file_id, "file_name": name, "file_size": len(data),
+                         "file_type": name.rsplit(".", 1)[-1],
+                         "sha256": mock.digests[file_id]}
+                        for file_id, (name, data) in mock.bundles[match.group(1)].items()
+                    ]
+                    return self.send_json(200, {"task_id": match.group(1), "files": files})
+                match = re.match(r"bundle/([^/]+)/([^/]+)$", path)
+                if match and method == "GET":
+                    files = mock.bundles.get(match.group(1), {})
+                    if match.group(2) not in files:
+                        return self.send_json(404, {"message": "File not found"})
+                    return self.send_file(match.group(2), files[match.group(2)][1])
+                return self.send_json(404, {"message": "Not found"})
+
+            def send_file(self, file_id, data):
+                start = 0
+                match = re.match(r"bytes=(\d+)-",
+                                 self.headers.get("Range", ""))
+                if match is not None and not mock.ignore_range:
+                    start = int(match.group(1))
+                    if start >= len(data):
+                        return self.send_json(416, {"message": "Range not satisfiable"})
+                    self.send_response(206)
+                    self.send_header(
+                        "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data) - start))
+                self.end_headers()
+                end = len(data)
+                with mock.lock:
+                    if mock.drop_after is not None and file_id not in mock.dropped:
+                        mock.dropped.add(file_id)
+                        end = min(end, start + mock.drop_after)
+                        self.close_connection = True
+                view = memoryview(data)
+                for offset in range(start, end, 64 * 1024):
+                    chunk = view[offset:min(offset + 64 * 1024, end)]
+                    mock.throttle(len(chunk))
+                    self.wfile.write(chunk)
+                    with mock.lock:
+                        mock.stats["bytes_sent"] = mock.stats["bytes_sent"] + len(chunk)
+
+            def do_GET(self):
+                self.dispatch("GET")
+
+            def do_POST(self):
+                self.dispatch("POST")
+
+            def do_DELETE(self):
+                self.dispatch("DELETE")
+
+        return Handler
+
+
+class MockS3:
+    """Path style S3 stand-in for the object calls of appeears.sinks.
+
+    Buckets exist on first use and signatures are not checked. Objects
+    are kept in objects keyed by (bucket, key), multipart uploads in
+    uploads until they are completed or aborted.
+
+        with MockS3() as s3:
+            client = boto3.client("s3", endpoint_url=s3.url, ...)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.objects = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "puts": 0, "parts": 0, "bytes_received": 0}
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    start = MockAppEEARS.start
+    stop = MockAppEEARS.stop
+    __enter__ = MockAppEEARS.__enter__
+    __exit__ = MockAppEEARS.__exit__
+
+    def handler(self):
+        mock = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, status, body=b"", headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def send_error_xml(self, status, code):
+                self.send(status, f"<Error><Code>{code}</Code></Error>".encode(),
+                          {"Content-Type": "application/xml"})
+
+            # request body, decoding the aws-chunked framing newer
+            # clients use to append checksums
+            def body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                data = self.rfile.read(length) if length > 0 else b""
+                if "aws-chunked" not in self.headers.get("Content-Encoding", ""):
+                    return data
+                decoded = bytearray()
+                pos = 0
+                while pos < len(data):
+                    end = data.index(b"\r\n", pos)
+                    size = int(data[pos:end].split(b";")[0], 16)
+                    if size == 0:
+                        break
+                    decoded.extend(data[end + 2:end + 2 + size])
+                    pos = end + 2 + size + 2
+                return bytes(decoded)
+
+            def dispatch(self):
+                url = urllib.parse.urlsplit(self.path)
+                query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+                bucket, _, key = urllib.parse.unquote(url.path).lstrip("/").partition("/")
+                body = self.body()
+                with mock.lock:
+                    mock.stats["requests"] = mock.stats["requests"] + 1
+                    mock.stats["bytes_received"] = mock.stats["bytes_received"] + len(body)
+                if self.command == "POST" and "uploads" in query:
+                    upload_id = uuid.uuid4().hex
+                    mock.uploads[upload_id] = {}
+                    return self.send(200, (
+                        "<InitiateMultipartUploadResult><Bucket>{}</Bucket><Key>{}</Key>"
+                        "<UploadId>{}</UploadId></InitiateMultipartUploadResult>").format(
+                            bucket, key, upload_id).encode(), {"Content-Type": "application/xml"})
+                upload_id = query.get("uploadId", [None])[0]
+                if upload_id is not None and upload_id not in mock.uploads:
+                    return self.send_error_xml(404, "NoSuchUpload")
+                if self.command == "PUT" and upload_id is not None:
+                    number = int(query["partNumber"][0])
+                    mock.uploads[upload_id][number] = body
+                    with mock.lock:
+                        mock.stats["parts"] = mock.stats["parts"] + 1
+                    return self.send(200, headers={"ETag": '"%s"' % hashlib.md5(body).hexdigest()})
+                if self.command == "POST" and upload_id is not None:
+                    parts = mock.uploads.pop(upload_id)
+                    numbers = [int(number) for number in re.findall(rb"<PartNumber>(\d+)</PartNumber>", body)]
+                    mock.objects[(bucket, key)] = b"".join(parts[number] for number in numbers)
+                    return self.send(200, (
+                        "<CompleteMultipartUploadResult><Bucket>{}</Bucket><Key>{}</Key>"
+                        "<ETag>\"{}\"</ETag></CompleteMultipartUploadResult>").format(
+                            bucket, key, upload_id).encode(), {"Content-Type": "application/xml"})
+                if self.command == "DELETE" and upload_id is not None:
+                    mock.uploads.pop(upload_id)
+                    return self.send(204)
+                if self.command == "PUT":
+                    mock.objects[(bucket, key)] = body
+                    with mock.lock:
+                        mock.stats["puts"] = mock.stats["puts"] + 1
+                    return self.send(200, headers={"ETag": '"%s"' % hashlib.md5(body).hexdigest()})
+                if (bucket, key) not in mock.objects:
+                    return self.send_error_xml(404, "NoSuchKey")
+                if self.command == "DELETE":
+                    del mock.objects[(bucket, key)]
+                    return self.send(204)
+                data = mock.objects[(bucket, key)]
+                headers = {"ETag": '"%s"' % hashlib.md5(data).hexdigest(),
+                           "Content-Type": "application/octet-stream"}
+                if self.command == "HEAD":
+                    self.send_response(200)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    return
+                return self.send(200, data, headers)
+
+            def do_GET(self):
+                self.dispatch()
+
+            def do_HEAD(self):
+                self.dispatch()
+
+            def do_PUT(self):
+                self.dispatch()
+
+            def do_POST(self):
+                self.dispatch()
+
+            def do_DELETE(self):
+                self.dispatch()
+
+        return Handler
+
+
+def parse_bytes(value):
+    match = re.match(r"^\s*([0-9.]+)\s*([KMG]?)B?\s*$", value, re.IGNORECASE)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Invalid size {value}, use for example 512KB or 2MB")
+    return int(float(match.group(1)) * 1024 ** " KMG".index(match.group(2).upper() or " "))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock AppEEARS API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--tasks", type=int, default=1, help="Synthetic tasks to serve")
+    parser.add_argument("--files", type=int, default=10, help="Files in every synthetic bundle")
+    parser.add_argument("--file-size", type=parse_bytes, default=1024 * 1024, help="Size of every file, for example 1MB")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--bandwidth", type=parse_bytes, default=None, help="Bytes per second shared by all transfers, for example 10MB")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 500 or 503")
+    parser.add_argument("--rate-limit", type=float, default=None, help="Requests per second before answering 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockAppEEARS(host=args.host, port=args.port, fail_rate=args.fail_rate,
+                          rate_limit=args.rate_limit, seed=args.seed, latency=args.latency,
+                          bandwidth=args.bandwidth)
+    for n in range(args.tasks):
+        server.add_synthetic_task(args.files, args.file_size, task_name=f"synthetic task {n + 1}")
+    server.start()
+    print(f"Mock AppEEARS API on {server.url}, any username and password log in")
+    for tid in server.tasks:
+        print(f"  task {tid}: {args.files} files of {args.file_size} bytes")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
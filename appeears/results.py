@@ -0,0 +1,405 @@
+"""Load point task results into columnar arrays.
+
+Point tasks return one results csv per product with a row per point and
+date. The functions here read such a csv from disk or straight from the
+task bundle in chunks of rows, so memory stays bounded for files of any
+size, and return every chunk as a dict of typed NumPy arrays. Layer
+columns are decoded with the fill value and scale factor from the layer
+metadata of /api/product/{pid}. With pyarrow installed the csv is parsed
+by Arrow's streaming reader and chunks can be converted to Arrow tables
+or written to Parquet.
+
+    from appeears.results import read_points, write_parquet
+
+    columns = read_points("ndvi-MOD13Q1-061-results.csv")
+    write_parquet("ndvi-MOD13Q1-061-results.csv", "ndvi.parquet")
+
+NumPy is required, pip install appeears[results], and pyarrow for Arrow
+and Parquet output, pip install appeears[parquet].
+"""
+
+import csv
+import io
+import itertools
+import os
+import re
+import sys
+from contextlib import contextmanager
+
+from appeears.appeears import AppEEARSError, check_response, get_client, iter_bundle, product_layers
+
+# columns of every results csv next to the layer values
+fixed_columns = {
+    "ID": "str",
+    "Category": "str",
+    "Latitude": "float64",
+    "Longitude": "float64",
+    "Date": "datetime64[D]",
+    "MODIS_Tile": "str",
+}
+
+# layer columns are named product_version_layer, for example
+# MOD13Q1_061__250m_16_days_NDVI for layer _250m_16_days_NDVI
+layer_column = re.compile(r"^(?P<product>.+?)_(?P<version>[0-9]{3})_(?P<layer>.+)$")
+
+integer_types = ["int8", "uint8", "int16", "uint16", "int32", "uint32", "int64", "uint64"]
+
+
+def require_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "appeears.results requires numpy: pip install appeears[results]")
+    return numpy
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.csv  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            "Arrow and Parquet output requires pyarrow: pip install appeears[parquet]")
+    return pyarrow
+
+
+def have_pyarrow():
+    try:
+        require_pyarrow()
+    except ImportError:
+        return False
+    return True
+
+
+# point results csv files in a task bundle
+def results_files(tid, client=None):
+    return list(iter_bundle(tid, client, include=["*results.csv"], sort=True))
+
+
+# binary stream of a bundle file which is read as it arrives
+@contextmanager
+def open_result(tid, file, client=None):
+    client = client or get_client()
+    response = check_response(
+        client.request("get", client.file_url(tid, file.file_id), stream=True))
+    with response:
+        response.raw.decode_content = True
+        yield response.raw
+
+
+# layer metadata for every layer column of a results csv keyed by the
+# column name, columns of products whose metadata can not be fetched are
+# left out and stay undecoded
+def layer_metadata(names, offline=False):
+    products = {}
+    metadata = {}
+    for name in names:
+        match = layer_column.match(name)
+        if name in fixed_columns or match is None:
+            continue
+        pid = f"{match.group('product')}.{match.group('version')}"
+        if pid not in products:
+            try:
+                products[pid] = product_layers(pid, offline=offline) or {}
+            except (AppEEARSError, SystemExit):
+                products[pid] = {}
+        layer = products[pid].get(match.group("layer"))
+        if isinstance(layer, dict):
+            metadata[name] = layer
+    return metadata
+
+
+def number(value, default=None):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# typed array from a column of csv strings, empty cells are NaN or NaT
+def to_array(values, dtype):
+    np = require_numpy()
+    if dtype == "str":
+        return np.array(values, dtype=object)
+    try:
+        return np.array(values, dtype=dtype)
+    except ValueError:
+        missing = "NaT" if dtype == "datetime64[D]" else "nan"
+        return np.array([value or missing for value in values], dtype=dtype)
+
+
+# type of a column without metadata from a sample of rows, numbers are
+# always float64 since later rows may hold scaled values or empty cells
+# which an integer column can not take, and the type is kept for every
+# chunk of the file
+def infer_type(values):
+    try:
+        to_array(values, "float64")
+    except ValueError:
+        return "str"
+    return "float64"
+
+
+class LayerDecoder:
+    """Masks fill values and applies the scale factor of one layer.
+
+    Whether a column holds raw integers or values the service already
+    scaled is decided on the first chunk and kept for the whole file, so
+    every chunk of a column is decoded the same way. Fill values become
+    NaN in both cases.
+    """
+
+    def __init__(self, layer):
+        self.data_type = str(layer.get("DataType") or "").lower()
+        self.fill = number(layer.get("FillValue"))
+        self.scale = number(layer.get("ScaleFactor"), 1.0) or 1.0
+        self.offset = number(layer.get("AddOffset"), 0.0)
+        self.raw = None
+
+    def dtype(self):
+        if self.data_type in ["int8", "uint8", "int16", "uint16", "float32"]:
+            return "float32"
+        return "float64"
+
+    def __call__(self, values):
+        np = require_numpy()
+        values = values.astype("float64")
+        if self.raw is None:
+            finite = values[np.isfinite(values)]
+            self.raw = self.data_type in integer_types and bool(
+                np.all(finite == np.round(finite)))
+        if self.raw:
+            fill = values == self.fill if self.fill is not None else None
+            values = values * self.scale + self.offset
+        elif self.fill is not None:
+            fill = (values == self.fill) | np.isclose(
+                values, self.fill * self.scale + self.offset)
+        else:
+            fill = None
+        values = values.astype(self.dtype())
+        if fill is not None:
+            values[fill] = np.nan
+        return values
+
+
+# columns of csv lines as lists of strings, missing cells are empty
+def split_columns(lines, names):
+    rows = list(csv.reader(lines))
+    columns = list(zip(*rows))
+    return [columns[i] if i < len(columns) else [""] * len(rows) for i in range(len(names))]
+
+
+# split csv lines with the csv module and type every column on its own,
+# slower than np.loadtxt but copes with empty cells and any numpy
+def split_lines(lines, names, types):
+    chunk = {}
+    for name, values in zip(names, split_columns(lines, names)):
+        try:
+            chunk[name] = to_array(values, types[name])
+        except ValueError as e:
+            raise ValueError(f"Column {name} is {types[name]} but holds other values: {e}")
+    return chunk
+
+
+# fill in the type of every column without one from the sample lines
+def infer_types(lines, names, types):
+    for name, values in zip(names, split_columns(lines, names)):
+        if types.get(name) is None:
+            types[name] = infer_type(values)
+
+
+class PrefixedStream(io.RawIOBase):
+    """Binary stream which returns prefix before the rest of stream."""
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if len(self.prefix) > 0:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+loadtxt_types = {"str": "O", "float64": "f8", "int64": "i8", "datetime64[D]": "M8[D]"}
+
+
+def numpy_chunks(stream, names, types, chunk_rows):
+    np = require_numpy()
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    try:
+        while True:
+            lines = list(itertools.islice(text, chunk_rows))
+            if len(lines) == 0:
+                return
+            try:
+                table = np.loadtxt(
+                    lines,
+                    delimiter=",",
+                    quotechar='"',
+                    ndmin=1,
+                    dtype=[(f"f{i}", loadtxt_types[types[name]])
+                           for i, name in enumerate(names)],
+                )
+            except (TypeError, ValueError):
+                # empty cells, ragged rows or numpy before 1.23
+                yield split_lines(lines, names, types)
+                continue
+            yield {
+                name: np.ascontiguousarray(table[f"f{i}"]) for i, name in enumerate(names)
+            }
+    finally:
+        # leave the stream open for the caller
+        text.detach()
+
+
+def arrow_chunks(stream, names, types, chunk_rows):
+    pa = require_pyarrow()
+    arrow_types = {
+        "str": pa.string(),
+        "float64": pa.float64(),
+        "int64": pa.int64(),
+        "datetime64[D]": pa.date32(),
+    }
+    reader = pa.csv.open_csv(
+        stream,
+        read_options=pa.csv.ReadOptions(
+            column_names=names,
+            block_size=max(1 << 20, chunk_rows * len(names) * 12),
+        ),
+        convert_options=pa.csv.ConvertOptions(
+            column_types={name: arrow_types[dtype] for name, dtype in types.items()},
+            strings_can_be_null=False,
+        ),
+    )
+    for batch in reader:
+        yield {
+            name: batch.column(i).to_numpy(zero_copy_only=False)
+            for i, name in enumerate(names)
+        }
+
+
+def iter_points(source, chunk_rows=65536, decode=True, metadata=None, engine="auto",
+                offline=False):
+    """Yield a point results csv as dicts of NumPy arrays per chunk.
+
+    source is a path or a binary file object. Layer columns are decoded
+    with metadata, a dict of layer metadata keyed by column name which
+    is fetched from the product endpoint when not given. Pass
+    decode=False to keep raw values. engine is numpy, arrow or auto which
+    uses Arrow when pyarrow is installed.
+    """
+    require_numpy()
+    if engine == "auto":
+        engine = "arrow" if have_pyarrow() else "numpy"
+    if engine not in ["numpy", "arrow"]:
+        raise ValueError(f"Unknown engine {engine}: use numpy, arrow or auto")
+    stream = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        header = stream.readline().decode("utf-8-sig").strip("\r\n")
+        names = next(csv.reader([header]))
+        if metadata is None:
+            metadata = layer_metadata(names, offline) if decode else {}
+        decoders = {
+            name: LayerDecoder(layer) for name, layer in metadata.items() if name in names
+        } if decode else {}
+        types = {name: fixed_columns.get(name) for name in names}
+        for name in decoders:
+            types[name] = "float64"
+        # type the remaining columns once from a sample of rows and hand
+        # the sample back to the reader, so every chunk has the same types
+        sample = [stream.readline() for _ in range(min(chunk_rows, 1000))]
+        infer_types([line.decode("utf-8") for line in sample if line], names, types)
+        chunks = numpy_chunks if engine == "numpy" else arrow_chunks
+        prefixed = io.BufferedReader(PrefixedStream(b"".join(sample), stream))
+        for chunk in chunks(prefixed, names, types, chunk_rows):
+            for name, decoder in decoders.items():
+                chunk[name] = decoder(chunk[name])
+            yield chunk
+    finally:
+        if stream is not source:
+            stream.close()
+
+
+# whole results csv as one dict of arrays
+def read_points(source, **kwargs):
+    np = require_numpy()
+    chunks = list(iter_points(source, **kwargs))
+    if len(chunks) == 0:
+        return {}
+    return {
+        name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]
+    }
+
+
+# arrow table from a dict of arrays, NaN and NaT become nulls
+def to_arrow(columns):
+    pa = require_pyarrow()
+    return pa.table({
+        name: pa.array(values, from_pandas=True) for name, values in columns.items()
+    })
+
+
+# stream a results csv into a parquet file chunk by chunk, returns rows
+def write_parquet(source, path, compression="zstd", **kwargs):
+    pa = require_pyarrow()
+    writer = None
+    rows = 0
+    try:
+        for chunk in iter_points(source, **kwargs):
+            table = to_arrow(chunk)
+            if writer is None:
+                writer = pa.parquet.ParquetWriter(
+                    path, table.schema, compression=compression)
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            rows = rows + table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+# write a results csv to .parquet, or to .npz with plain NumPy, returns rows
+def export_points(source, path, **kwargs):
+    np = require_numpy()
+    if path.lower().endswith(".parquet"):
+        return write_parquet(source, path, **kwargs)
+    columns = read_points(source, **kwargs)
+    np.savez_compressed(path, **{
+        name: values.astype(str) if values.dtype == object else values
+        for name, values in columns.items()
+    })
+    return len(next(iter(columns.values()), []))
+
+
+# export every point results csv of a task or one local csv into dest
+def results(dest_dir, tid=None, filepath=None, file_format="parquet", decode=True, offline=False):
+    os.makedirs(dest_dir, exist_ok=True)
+    if file_format == "parquet" and not have_pyarrow():
+        sys.exit("Parquet output requires pyarrow: pip install appeears[parquet]")
+    if filepath is not None:
+        sources = [(os.path.basename(filepath), None)]
+    else:
+        sources = [(os.path.basename(file.file_name), file) for file in results_files(tid)]
+        if len(sources) == 0:
+            sys.exit(f"No point results csv found in the bundle of task {tid}")
+    for name, file in sources:
+        path = os.path.join(dest_dir, os.path.splitext(name)[0] + "." + file_format)
+        if file is None:
+            rows = export_points(filepath, path, decode=decode, offline=offline)
+        else:
+            with open_result(tid, file) as stream:
+                rows = export_points(stream, path, decode=decode, offline=offline)
+        print(f"Wrote {rows} rows to {path}")
@@ -0,0 +1,521 @@
+"""Destinations for downloaded files other than a local folder.
+
+download_task writes into a local folder by default. Given one of these
+destinations instead it streams every file of the bundle straight from
+the response into a sink, without a copy on local disk:
+
+    s3://bucket/prefix         objects in S3 or an S3 compatible store
+                               such as MinIO, larger files are sent as
+                               multipart uploads of part_size bytes
+    archive.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz
+                               members of a tar archive
+    archive.zip                members of a zip archive
+
+Interrupted transfers continue with a range request from the last byte
+the sink received and every file is checked against its size and the
+bundle checksum before the sink commits it. Objects stored in S3 are
+recorded in a manifest under ~/.appeears/sinks so reruns skip them.
+Archives are written to a .part file and only renamed into place when
+every file arrived, a failed run leaves no partial archive behind.
+Members of compressed tar archives are spooled to a temporary file
+first, since a compressed stream can not be rewound when a server
+ignores the range request and the file has to start over.
+
+    from appeears.appeears import download_task
+    from appeears.sinks import MemorySink
+
+    sink = MemorySink()
+    download_task(tid, sink)
+    print(sorted(sink.objects))
+
+S3 needs boto3, pip install appeears[s3], and reads its endpoint from
+AWS_ENDPOINT_URL or APPEEARS_S3_ENDPOINT and its credentials the usual
+boto3 way.
+"""
+
+import hashlib
+import io
+import os
+import posixpath
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from functools import partial
+
+from appeears.appeears import (AppEEARSError, IntegrityError, check_response, chunk_size_for,
+                               open_manifest, state_dir)
+
+# suffixes of destinations written as archives
+tar_suffixes = {".tar": "w", ".tar.gz": "w:gz", ".tgz": "w:gz", ".tar.bz2": "w:bz2", ".tar.xz": "w:xz"}
+zip_suffixes = [".zip"]
+
+# file types stored as they are in zip archives, they are compressed already
+stored_types = [".tif", ".tiff", ".nc", ".nc4", ".h5", ".he5", ".hdf", ".zip", ".gz"]
+
+sinks_dir = os.path.join(state_dir, "sinks")
+
+
+class SinkError(AppEEARSError):
+    def __init__(self, message):
+        super().__init__(None, message)
+
+    def __str__(self):
+        return self.message
+
+
+class Writer:
+    """One file on its way into a sink.
+
+    write is called with every chunk as it arrives, commit once all of
+    them arrived and were verified, abort when the transfer failed.
+    restart drops what was written so far for sinks that can.
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.written = 0
+
+    def write(self, data):
+        self.written = self.written + len(data)
+
+    def restart(self):
+        raise SinkError(f"{self.name} can not be restarted in this sink")
+
+    def commit(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class Sink:
+    """Destination of the files of a download.
+
+    concurrent sinks take files from several workers at once, others get
+    them one after the other. manifest_path is where the manifest of
+    stored files is kept, an in memory database forgets them when the
+    download ends.
+    """
+
+    concurrent = True
+    manifest_path = ":memory:"
+
+    def open(self, name, size):
+        raise NotImplementedError
+
+    # whether a file recorded in the manifest is still in the sink
+    def exists(self, name, size):
+        return True
+
+    def manifest(self):
+        return open_manifest(None, self.manifest_path)
+
+    def close(self, ok=True):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.close(ok=exc_type is None)
+
+
+class MemoryWriter(Writer):
+    def __init__(self, sink, name, size):
+        super().__init__(name, size)
+        self.sink = sink
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        self.buffer.write(data)
+        super().write(data)
+
+    def restart(self):
+        self.buffer = io.BytesIO()
+        self.written = 0
+
+    def commit(self):
+        with self.sink.lock:
+            self.sink.objects[self.name] = self.buffer.getvalue()
+
+
+class MemorySink(Sink):
+    """Keeps files as bytes in objects, keyed by name, for tests."""
+
+    def __init__(self):
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def open(self, name, size):
+        return MemoryWriter(self, name, size)
+
+    def exists(self, name, size):
+        return len(self.objects.get(name, b"")) == size
+
+
+# raise boto errors as SinkError so a failed upload fails its file like
+# a failed download instead of ending the run
+@contextmanager
+def s3_errors(action, key):
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    try:
+        yield
+    except (BotoCoreError, ClientError) as e:
+        raise SinkError(f"{action} {key} failed: {e}")
+
+
+class S3Writer(Writer):
+    def __init__(self, sink, name, size):
+        super().__init__(name, size)
+        self.sink = sink
+        self.key = posixpath.join(sink.prefix, name) if sink.prefix else name
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data):
+        self.buffer.extend(data)
+        super().write(data)
+        if len(self.buffer) >= self.sink.part_size:
+            self.upload_part()
+
+    # send the buffer as the next part, starting the multipart upload
+    # with the first one
+    def upload_part(self):
+        client = self.sink.client
+        with s3_errors("Upload of", self.key):
+            if self.upload_id is None:
+                self.upload_id = client.create_multipart_upload(
+                    Bucket=self.sink.bucket, Key=self.key)["UploadId"]
+            number = len(self.parts) + 1
+            response = client.upload_part(
+                Bucket=self.sink.bucket, Key=self.key, UploadId=self.upload_id,
+                PartNumber=number, Body=bytes(self.buffer))
+        self.parts.append({"PartNumber": number, "ETag": response["ETag"]})
+        self.buffer = bytearray()
+
+    def restart(self):
+        self.abort()
+        self.buffer = bytearray()
+        self.parts = []
+        self.written = 0
+
+    def commit(self):
+        client = self.sink.client
+        if self.upload_id is None:
+            with s3_errors("Upload of", self.key):
+                client.put_object(Bucket=self.sink.bucket, Key=self.key, Body=bytes(self.buffer))
+            return
+        if self.buffer:
+            self.upload_part()
+        with s3_errors("Upload of", self.key):
+            client.complete_multipart_upload(
+                Bucket=self.sink.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={"Parts": self.parts})
+
+    def abort(self):
+        if self.upload_id is not None:
+            upload_id, self.upload_id = self.upload_id, None
+            with s3_errors("Abort of the upload of", self.key):
+                self.sink.client.abort_multipart_upload(
+                    Bucket=self.sink.bucket, Key=self.key, UploadId=upload_id)
+
+
+class S3Sink(Sink):
+    """Objects under s3://bucket/prefix.
+
+    Files up to part_size bytes are stored with one put, larger ones are
+    sent as multipart uploads while they download, so at most part_size
+    bytes per worker are held in memory. client is a boto3 S3 client,
+    created from endpoint_url when not given.
+    """
+
+    def __init__(self, uri, client=None, endpoint_url=None, part_size=8 * 1024 * 1024):
+        if not uri.startswith("s3://"):
+            raise ValueError(f"{uri} is not an s3:// URI")
+        self.uri = uri.rstrip("/")
+        self.bucket, _, self.prefix = uri[len("s3://"):].partition("/")
+        self.prefix = self.prefix.strip("/")
+        # every part but the last must be at least 5 MiB
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImportError("S3 destinations require boto3: pip install appeears[s3]")
+            endpoint_url = endpoint_url or os.environ.get("APPEEARS_S3_ENDPOINT") or os.environ.get(
+                "AWS_ENDPOINT_URL")
+            from botocore.exceptions import BotoCoreError
+
+            try:
+                client = boto3.client("s3", endpoint_url=endpoint_url)
+            except BotoCoreError as e:
+                raise ValueError(f"Could not create an S3 client for {uri}: {e}")
+        self.client = client
+        slug = hashlib.sha256(self.uri.encode()).hexdigest()[:16]
+        self.manifest_path = os.path.join(sinks_dir, slug + ".sqlite")
+        os.makedirs(sinks_dir, exist_ok=True)
+
+    def open(self, name, size):
+        return S3Writer(self, name, size)
+
+    def exists(self, name, size):
+        key = posixpath.join(self.prefix, name) if self.prefix else name
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except Exception:
+            return False
+        return response.get("ContentLength") == size
+
+
+class ArchiveSink(Sink):
+    """Base of tar and zip sinks, written to path.part and renamed on success.
+
+    Members are written one after the other. A member that fails half
+    way leaves the archive unusable, so every later file is refused and
+    the part file is removed when the sink closes.
+    """
+
+    concurrent = False
+
+    def __init__(self, path):
+        self.path = path
+        self.partpath = path + ".part"
+        self.broken = None
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def open(self, name, size):
+        if self.broken is not None:
+            raise SinkError(f"{self.path} is incomplete after {self.broken} failed")
+        return self.member(name, size)
+
+    def member(self, name, size):
+        raise NotImplementedError
+
+    def finish(self):
+        raise NotImplementedError
+
+    def close(self, ok=True):
+        self.finish()
+        if ok and self.broken is None:
+            os.replace(self.partpath, self.path)
+        elif os.path.exists(self.partpath):
+            os.remove(self.partpath)
+
+
+class TarWriter(Writer):
+    """Member of a tar archive.
+
+    Members of an uncompressed archive are written straight into the
+    part file and a restart truncates it back to the end of the header.
+    A compressed stream can not be rewound, so members of compressed
+    archives are spooled to a temporary file and added on commit.
+    """
+
+    def __init__(self, sink, name, size):
+        super().__init__(name, size)
+        self.sink = sink
+        tar = sink.tar
+        self.info = tarfile.TarInfo(name)
+        self.info.size = size
+        self.info.mtime = int(time.time())
+        self.spool = None
+        if sink.compressed:
+            self.spool = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(sink.path)))
+            return
+        # the header has to carry the size, which the bundle listing gives
+        header = self.info.tobuf(tar.format, tar.encoding, tar.errors)
+        tar.fileobj.write(header)
+        tar.offset = tar.offset + len(header)
+        self.start = tar.fileobj.tell()
+
+    def write(self, data):
+        if self.written + len(data) > self.size:
+            raise IntegrityError(self.name, f"received more than {self.size} bytes")
+        (self.spool or self.sink.tar.fileobj).write(data)
+        super().write(data)
+
+    def restart(self):
+        fileobj = self.spool or self.sink.tar.fileobj
+        fileobj.seek(0 if self.spool else self.start)
+        fileobj.truncate()
+        self.written = 0
+
+    def commit(self):
+        tar = self.sink.tar
+        if self.spool is not None:
+            self.spool.seek(0)
+            tar.addfile(self.info, self.spool)
+            self.spool.close()
+            return
+        blocks, remainder = divmod(self.size, tarfile.BLOCKSIZE)
+        if remainder > 0:
+            tar.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            blocks = blocks + 1
+        tar.offset = tar.offset + blocks * tarfile.BLOCKSIZE
+        tar.members.append(self.info)
+
+    def abort(self):
+        self.sink.broken = self.name
+        if self.spool is not None:
+            self.spool.close()
+
+
+class TarSink(ArchiveSink):
+    def __init__(self, path, mode="w"):
+        super().__init__(path)
+        self.compressed = mode != "w"
+        self.tar = tarfile.open(self.partpath, mode)
+
+    def member(self, name, size):
+        return TarWriter(self, name, size)
+
+    def finish(self):
+        self.tar.close()
+
+
+class ZipWriter(Writer):
+    def __init__(self, sink, name, size):
+        super().__init__(name, size)
+        self.sink = sink
+        self.stream = self.open_member()
+
+    def open_member(self):
+        info = zipfile.ZipInfo(self.name, time.localtime()[:6])
+        if os.path.splitext(self.name)[1].lower() not in stored_types:
+            info.compress_type = zipfile.ZIP_DEFLATED
+        return self.sink.zip.open(info, "w", force_zip64=self.size >= zipfile.ZIP64_LIMIT)
+
+    def write(self, data):
+        self.stream.write(data)
+        super().write(data)
+
+    # close the member, drop it from the archive and truncate the part
+    # file back to its local header before writing it again
+    def restart(self):
+        archive = self.sink.zip
+        self.stream.close()
+        info = archive.filelist.pop()
+        del archive.NameToInfo[info.filename]
+        archive.fp.seek(info.header_offset)
+        archive.fp.truncate()
+        archive.start_dir = info.header_offset
+        self.stream = self.open_member()
+        self.written = 0
+
+    def commit(self):
+        self.stream.close()
+
+    def abort(self):
+        self.sink.broken = self.name
+        self.stream.close()
+
+
+class ZipSink(ArchiveSink):
+    def __init__(self, path):
+        super().__init__(path)
+        self.zip = zipfile.ZipFile(self.partpath, "w")
+
+    def member(self, name, size):
+        return ZipWriter(self, name, size)
+
+    def finish(self):
+        self.zip.close()
+
+
+# sink for a destination, None for a local folder
+def open_sink(dest, **options):
+    if isinstance(dest, Sink):
+        return dest
+    lowered = str(dest).lower()
+    if lowered.startswith("s3://"):
+        return S3Sink(dest, **options)
+    for suffix, mode in tar_suffixes.items():
+        if lowered.endswith(suffix):
+            return TarSink(dest, mode)
+    if lowered.endswith(tuple(zip_suffixes)):
+        return ZipSink(dest)
+    if "://" in lowered:
+        raise ValueError(f"Unsupported destination {dest}: use a folder, s3://, .tar or .zip")
+    return None
+
+
+def stream_file(client, tid, file, writer, progress=None, throttle=None):
+    """Stream a bundle file into writer and return its SHA-256.
+
+    A dropped connection continues with a range request from the bytes
+    the writer already has, a token rejected mid-run is refreshed once.
+    """
+    import requests
+
+    url = client.file_url(tid, file.file_id)
+    policy = client.governor.policy
+    token = client.auth_token()
+    digest = hashlib.sha256()
+    refreshed = False
+    attempt = 0
+    while True:
+        headers = {"Authorization": f"Bearer {token}"}
+        if writer.written > 0:
+            headers["Range"] = f"bytes={writer.written}-"
+        try:
+            response = client.get(url, headers=headers, allow_redirects=True, stream=True,
+                                  timeout=client.timeout)
+            with response:
+                check_response(response)
+                if writer.written > 0 and response.status_code != 206:
+                    # server ignored the range header, start the file over
+                    if progress is not None:
+                        progress.update(-writer.written)
+                    writer.restart()
+                    digest = hashlib.sha256()
+                for data in response.iter_content(chunk_size=chunk_size_for(file.file_size)):
+                    writer.write(data)
+                    digest.update(data)
+                    if progress is not None:
+                        progress.update(len(data))
+                    if throttle is not None:
+                        throttle(len(data))
+            break
+        except IntegrityError:
+            raise
+        except AppEEARSError as e:
+            if e.status_code != 401 or refreshed:
+                raise
+            token = client.auth_token(stale=token)
+            refreshed = True
+        except requests.RequestException:
+            if not policy.retry_error("get", attempt):
+                raise
+            time.sleep(policy.delay(attempt))
+            attempt = attempt + 1
+    if writer.written != file.file_size:
+        raise IntegrityError(file.file_name, f"expected {file.file_size} bytes, received {writer.written}")
+    sha256 = digest.hexdigest()
+    if file.sha256 and sha256 != file.sha256.lower():
+        raise IntegrityError(file.file_name, "SHA-256 does not match the bundle")
+    return sha256
+
+
+# download one bundle file into a sink, returns bytes and SHA-256 like
+# fetch_file
+def sink_file(client, tid, file, sink, progress=None, scheduler=None):
+    writer = sink.open(os.path.basename(file.file_name), file.file_size)
+    throttle = partial(scheduler.throttle, tid) if scheduler is not None else None
+    try:
+        sha256 = stream_file(client, tid, file, writer, progress, throttle)
+        writer.commit()
+    except BaseException:
+        try:
+            writer.abort()
+        except SinkError:
+            # report why the file failed rather than the cleanup
+            pass
+        raise
+    return writer.written, sha256
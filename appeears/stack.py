@@ -0,0 +1,357 @@
+"""Stack downloaded area task GeoTIFFs into (time, y, x) cubes.
+
+Area tasks deliver one GeoTIFF per layer and date, named like
+MOD13Q1.061__250m_16_days_NDVI_doy2018161_aid0001.tif. open_stack
+indexes a download folder by layer, feature and acquisition date and
+returns a LayerStack per layer and feature which reads lazily: indexing a stack only reads the
+requested window of the requested dates, never whole files. A stack can
+be consolidated into a memory-mapped .npy cube, or into a chunked Zarr
+store or NetCDF file for time series work.
+
+    from appeears.stack import open_stack
+
+    stacks = open_stack("downloads/ndvi")
+    ndvi = stacks["MOD13Q1.061__250m_16_days_NDVI"]
+    series = ndvi[:, 120, 340]
+    cube = ndvi.memmap()
+
+Reading needs numpy and rasterio, pip install appeears[stack], Zarr
+output needs zarr, pip install appeears[zarr], and NetCDF output
+netCDF4, pip install appeears[netcdf].
+"""
+
+import os
+import sys
+from collections import OrderedDict
+from fnmatch import fnmatch
+
+from appeears.appeears import bundle_name, parse_bundle_name
+
+
+def require_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "appeears.stack requires numpy: pip install appeears[stack]")
+    return numpy
+
+
+def require_rasterio():
+    try:
+        import rasterio
+    except ImportError:
+        raise ImportError(
+            "appeears.stack requires rasterio: pip install appeears[stack]")
+    return rasterio
+
+
+class LayerStack:
+    """Lazily read (time, y, x) cube of one layer.
+
+    Index it like a NumPy array, stack[t, rows, cols] with integers or
+    slices, to read windows of the files. Up to max_open files are kept
+    open between reads.
+    """
+
+    def __init__(self, name, dates, paths, max_open=256):
+        np = require_numpy()
+        rasterio = require_rasterio()
+        self.name = name
+        self.dates = np.array(dates, dtype="datetime64[D]")
+        self.paths = list(paths)
+        self.max_open = max_open
+        self.datasets = OrderedDict()
+        with rasterio.open(self.paths[0]) as src:
+            self.height = src.height
+            self.width = src.width
+            self.dtype = np.dtype(src.dtypes[0])
+            self.nodata = src.nodata
+            self.transform = src.transform
+            self.crs = src.crs
+        self.shape = (len(self.paths), self.height, self.width)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __repr__(self):
+        return f"LayerStack({self.name!r}, shape={self.shape}, dtype={self.dtype})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for dataset in self.datasets.values():
+            dataset.close()
+        self.datasets.clear()
+
+    # open dataset of time step t, closing the least recently used one
+    def dataset(self, t):
+        rasterio = require_rasterio()
+        if t in self.datasets:
+            self.datasets.move_to_end(t)
+            return self.datasets[t]
+        dataset = rasterio.open(self.paths[t])
+        if (dataset.height, dataset.width) != (self.height, self.width):
+            dataset.close()
+            raise ValueError(
+                f"{os.path.basename(self.paths[t])} is {dataset.height}x{dataset.width}, "
+                f"expected {self.height}x{self.width}")
+        self.datasets[t] = dataset
+        while len(self.datasets) > self.max_open:
+            self.datasets.popitem(last=False)[1].close()
+        return dataset
+
+    # read rows and cols, pairs of start and stop, for a list of time steps
+    def read(self, times, rows, cols):
+        np = require_numpy()
+        from rasterio.windows import Window
+
+        window = Window(cols[0], rows[0], cols[1] - cols[0], rows[1] - rows[0])
+        out = np.empty((len(times), rows[1] - rows[0], cols[1] - cols[0]), dtype=self.dtype)
+        for i, t in enumerate(times):
+            out[i] = self.dataset(t).read(1, window=window)
+        return out
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        squeeze = []
+        bounds = []
+        for axis, (item, size) in enumerate(zip(key, self.shape)):
+            if isinstance(item, slice):
+                start, stop, step = item.indices(size)
+                if axis > 0 and step != 1:
+                    raise IndexError("Only unit steps are supported along y and x")
+                bounds.append((start, stop, step))
+                continue
+            index = int(item)
+            if index < 0:
+                index = index + size
+            if not 0 <= index < size:
+                raise IndexError(f"Index {item} is out of bounds for axis {axis} with size {size}")
+            bounds.append((index, index + 1, 1))
+            squeeze.append(axis)
+        times = list(range(*bounds[0]))
+        rows = (bounds[1][0], max(bounds[1][0], bounds[1][1]))
+        cols = (bounds[2][0], max(bounds[2][0], bounds[2][1]))
+        data = self.read(times, rows, cols)
+        if squeeze:
+            data = data.squeeze(axis=tuple(squeeze))
+        return data
+
+    # spatial blocks of at most chunk by chunk pixels
+    def blocks(self, chunk):
+        for row in range(0, self.height, chunk):
+            for col in range(0, self.width, chunk):
+                yield (row, min(row + chunk, self.height)), (col, min(col + chunk, self.width))
+
+    def memmap(self, path=None):
+        """Consolidate the stack into a .npy file and memory-map it.
+
+        The cube is written once, one date at a time, to path, by default
+        .appeears-stack/<layer>.npy next to the GeoTIFFs, and reused while
+        it is newer than every GeoTIFF of the stack.
+        """
+        np = require_numpy()
+        if path is None:
+            path = os.path.join(
+                os.path.dirname(self.paths[0]), ".appeears-stack", self.name + ".npy")
+        if os.path.exists(path):
+            cube = np.load(path, mmap_mode="r")
+            newest = max(os.path.getmtime(filepath) for filepath in self.paths)
+            if cube.shape == self.shape and cube.dtype == self.dtype and os.path.getmtime(path) >= newest:
+                return cube
+            del cube
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        partpath = path + ".part"
+        cube = np.lib.format.open_memmap(
+            partpath, mode="w+", dtype=self.dtype, shape=self.shape)
+        for t in range(len(self)):
+            cube[t] = self.dataset(t).read(1)
+        cube.flush()
+        del cube
+        os.replace(partpath, path)
+        return np.load(path, mmap_mode="r")
+
+    # x and y coordinates of pixel centres
+    def coordinates(self):
+        np = require_numpy()
+        x = self.transform.c + (np.arange(self.width) + 0.5) * self.transform.a
+        y = self.transform.f + (np.arange(self.height) + 0.5) * self.transform.e
+        return y, x
+
+
+# layer stacks of the GeoTIFFs in a folder keyed by product and layer,
+# for example MOD13Q1.061__250m_16_days_NDVI, optionally only layers
+# matching one of the glob patterns; tasks with several features get a
+# stack per feature, for example MOD13Q1.061__250m_16_days_NDVI_aid0002
+def open_stack(directory, layers=None):
+    files = {}
+    for entry in os.scandir(directory):
+        if not entry.is_file() or not entry.name.lower().endswith((".tif", ".tiff")):
+            continue
+        parsed = parse_bundle_name(entry.name)
+        if parsed is None:
+            continue
+        product, layer, date = parsed
+        name = f"{product}_{layer}"
+        if layers and not any(fnmatch(name, pattern) for pattern in layers):
+            continue
+        aid = bundle_name.match(entry.name).group("aid")
+        dates = files.setdefault(name, {}).setdefault(aid, {})
+        if date in dates:
+            raise ValueError(
+                f"{entry.name} and {os.path.basename(dates[date])} are both {name} on {date}")
+        dates[date] = entry.path
+    stacks = OrderedDict()
+    for name in sorted(files):
+        for aid in sorted(files[name], key=lambda aid: aid or ""):
+            key = name if len(files[name]) == 1 or aid is None else f"{name}_aid{aid}"
+            dates = sorted(files[name][aid])
+            stacks[key] = LayerStack(key, dates, [files[name][aid][date] for date in dates])
+    return stacks
+
+
+# variable names safe for netcdf and zarr
+def variable_name(name):
+    return name.replace(".", "_").strip("_")
+
+
+def stack_attributes(stack):
+    return {
+        "layer": stack.name,
+        "dates": [str(date) for date in stack.dates],
+        "crs_wkt": stack.crs.to_wkt() if stack.crs is not None else "",
+        "transform": list(stack.transform)[:6],
+        "nodata": stack.nodata if stack.nodata is not None else "",
+    }
+
+
+def to_zarr(stacks, path, chunk=256, time_chunk=64):
+    """Write layer stacks to a Zarr store with one array per layer.
+
+    Arrays are chunked time_chunk dates by chunk by chunk pixels and
+    every chunk is written once, reading the window of each date from
+    the GeoTIFFs.
+    """
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError("Zarr output requires zarr: pip install appeears[zarr]")
+    group = zarr.open_group(path, mode="w")
+    create = getattr(group, "create_array", None) or group.create_dataset
+    for stack in stacks.values():
+        array = create(
+            variable_name(stack.name),
+            shape=stack.shape,
+            chunks=(min(time_chunk, len(stack)), min(chunk, stack.height), min(chunk, stack.width)),
+            dtype=stack.dtype,
+            fill_value=stack.nodata,
+        )
+        array.attrs.update(stack_attributes(stack))
+        for start in range(0, len(stack), time_chunk):
+            times = list(range(start, min(start + time_chunk, len(stack))))
+            for rows, cols in stack.blocks(chunk):
+                array[times[0]:times[-1] + 1, rows[0]:rows[1], cols[0]:cols[1]] = stack.read(
+                    times, rows, cols)
+        stack.close()
+    return group
+
+
+def to_netcdf(stacks, path, chunk=256, time_chunk=64):
+    """Write layer stacks to a compressed NetCDF4 file.
+
+    Layers share the y and x coordinates of the first layer and get
+    their own time dimension since products can differ in their dates.
+    """
+    try:
+        import netCDF4
+    except ImportError:
+        raise ImportError("NetCDF output requires netCDF4: pip install appeears[netcdf]")
+    first = next(iter(stacks.values()))
+    for stack in stacks.values():
+        if (stack.height, stack.width) != (first.height, first.width):
+            raise ValueError(
+                f"{stack.name} is on a different grid than {first.name}, write them to separate files")
+    with netCDF4.Dataset(path, "w") as dataset:
+        dataset.createDimension("y", first.height)
+        dataset.createDimension("x", first.width)
+        y, x = first.coordinates()
+        dataset.createVariable("y", "f8", ("y",))[:] = y
+        dataset.createVariable("x", "f8", ("x",))[:] = x
+        crs = dataset.createVariable("crs", "i4")
+        crs.crs_wkt = first.crs.to_wkt() if first.crs is not None else ""
+        crs.GeoTransform = " ".join(str(value) for value in first.transform.to_gdal())
+        for stack in stacks.values():
+            name = variable_name(stack.name)
+            dataset.createDimension(f"time_{name}", len(stack))
+            time = dataset.createVariable(f"time_{name}", "i4", (f"time_{name}",))
+            time.units = "days since 1970-01-01"
+            time.calendar = "standard"
+            time[:] = stack.dates.astype("int64")
+            variable = dataset.createVariable(
+                name,
+                stack.dtype,
+                (f"time_{name}", "y", "x"),
+                zlib=True,
+                chunksizes=(min(time_chunk, len(stack)), min(chunk, stack.height),
+                            min(chunk, stack.width)),
+                fill_value=stack.nodata,
+            )
+            variable.grid_mapping = "crs"
+            variable.long_name = stack.name
+            for start in range(0, len(stack), time_chunk):
+                times = list(range(start, min(start + time_chunk, len(stack))))
+                for rows, cols in stack.blocks(chunk):
+                    variable[times[0]:times[-1] + 1, rows[0]:rows[1], cols[0]:cols[1]] = stack.read(
+                        times, rows, cols)
+            stack.close()
+    return path
+
+
+# print the stacks of a folder or write them to a zarr, netcdf or npy output
+def stack(directory, layers=None, out=None, file_format="zarr", chunk=256, time_chunk=64):
+    from tabulate import tabulate
+
+    try:
+        stacks = open_stack(directory, layers)
+    except ValueError as e:
+        sys.exit(f"Could not stack {directory}: {e}")
+    if len(stacks) == 0:
+        sys.exit(f"No AppEEARS GeoTIFFs found in {directory}")
+    print(tabulate(
+        [
+            {
+                "layer": stack.name,
+                "dates": len(stack),
+                "first_date": stack.dates[0],
+                "last_date": stack.dates[-1],
+                "height": stack.height,
+                "width": stack.width,
+                "dtype": stack.dtype,
+            }
+            for stack in stacks.values()
+        ],
+        headers="keys",
+        tablefmt="heavy_grid",
+    ))
+    if out is None:
+        return stacks
+    try:
+        if file_format == "zarr":
+            to_zarr(stacks, out, chunk, time_chunk)
+        elif file_format == "netcdf":
+            to_netcdf(stacks, out, chunk, time_chunk)
+        else:
+            for stack in stacks.values():
+                stack.memmap(os.path.join(out, stack.name + ".npy"))
+                stack.close()
+    except ImportError as e:
+        sys.exit(str(e))
+    print(f"Wrote {len(stacks)} layers to {out}")
+    return stacks
@@ -0,0 +1,74 @@
+"""Exercise the client governor against injected faults.
+
+Starts the local mock API with a share of failing requests and a server
+side rate limit, then fans out status polls and bundle downloads from a
+thread pool through one AppEEARSClient. Prints the client and server
+counters and exits with an error if any call or download failed.
+
+    python benchmarks/faults.py --fail-rate 0.2 --rate-limit 50
+"""
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from appeears import appeears  # noqa: E402
+from appeears.mockserver import MockAppEEARS  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="appeears fault injection harness")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--file-size", type=int, default=256 * 1024)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--fail-rate", type=float, default=0.2)
+    parser.add_argument("--rate-limit", type=float, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with MockAppEEARS(fail_rate=args.fail_rate, fail_statuses=(500, 502, 503, 504),
+                      rate_limit=args.rate_limit, seed=args.seed) as server:
+        tid = server.add_task({
+            f"file_{n:04d}.tif": os.urandom(args.file_size) for n in range(args.files)
+        })
+        policy = appeears.RetryPolicy(retries=8, backoff=0.05, max_backoff=2)
+        governor = appeears.RequestGovernor(
+            policy=policy, rate=args.rate_limit * 2, burst=args.workers, threshold=1000)
+        client = appeears.AppEEARSClient(base_url=server.url, governor=governor)
+        client.token = "mock"
+
+        start = time.perf_counter()
+        failed = 0
+        with concurrent.futures.ThreadPoolExecutor(args.workers) as pool:
+            futures = [pool.submit(client.status, tid) for _ in range(args.calls)]
+            for future in concurrent.futures.as_completed(futures):
+                if future.exception() is not None:
+                    failed = failed + 1
+        elapsed = time.perf_counter() - start
+        print(f"{args.calls - failed}/{args.calls} status calls in {elapsed:.2f}s "
+              f"({args.calls / elapsed:.1f}/s, server limit {args.rate_limit}/s)")
+
+        with tempfile.TemporaryDirectory() as dest:
+            appeears.download_task(tid, dest, workers=args.workers, client=client)
+            downloaded = [
+                name for name, data in server.bundles[tid].values()
+                if os.path.isfile(os.path.join(dest, name))
+                and open(os.path.join(dest, name), "rb").read() == data
+            ]
+        print(f"{len(downloaded)}/{args.files} files downloaded")
+        print(f"client: {governor.stats}")
+        print(f"server: {server.stats}")
+
+    if failed or len(downloaded) != args.files:
+        sys.exit("Fault injection run failed")
+
+
+if __name__ == "__main__":
+    main()
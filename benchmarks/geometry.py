@@ -0,0 +1,91 @@
+"""Time the geometry pipeline on large point sets and dense polygons.
+
+Writes synthetic point files as csv and GeoJSON and a polygon ring with
+many vertices and runs them through appeears.geometry.prepare with the
+250 m MODIS sinusoidal grid, no network access is needed.
+
+    python benchmarks/geometry.py --points 100000 --vertices 200000
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from appeears import geometry  # noqa: E402
+
+PIXEL_SIZE = 250
+
+
+def synthetic_points(tmp, count, seed=1):
+    rng = random.Random(seed)
+    points = [(rng.uniform(-105, -100), rng.uniform(38, 41)) for _ in range(count)]
+    csv_path = os.path.join(tmp, "points.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["ID", "Category", "Latitude", "Longitude"])
+        for i, (lon, lat) in enumerate(points):
+            writer.writerow([i, "field", f"{lat:.6f}", f"{lon:.6f}"])
+    geojson_path = os.path.join(tmp, "points.geojson")
+    with open(geojson_path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {"id": i},
+             "geometry": {"type": "Point", "coordinates": [lon, lat]}}
+            for i, (lon, lat) in enumerate(points)
+        ]}, f)
+    return csv_path, geojson_path
+
+
+# wiggly ring of about 100 km across, like a traced boundary
+def synthetic_polygon(tmp, vertices, seed=1):
+    rng = random.Random(seed)
+    ring = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        radius = 0.5 + 0.01 * math.sin(angle * 50) + rng.gauss(0, 0.0005)
+        ring.append([-104 + radius * math.cos(angle), 40 + radius * math.sin(angle)])
+    ring.append(ring[0])
+    path = os.path.join(tmp, "polygon.geojson")
+    with open(path, "w") as f:
+        json.dump({"type": "Feature", "properties": {},
+                   "geometry": {"type": "Polygon", "coordinates": [ring]}}, f)
+    return path
+
+
+def measure(label, path, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        prepared = geometry.prepare(
+            path, pixel_size=PIXEL_SIZE, grid_cell=geometry.tile_width * PIXEL_SIZE / 1200000)
+        timings.append(time.perf_counter() - start)
+    summary = prepared.summary()
+    detail = summary.get("points") or summary.get("vertices")
+    print(f"{label:<16} {min(timings):8.3f} s  {detail} in {summary['tasks']} tasks")
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="appeears geometry pipeline benchmark")
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--vertices", type=int, default=200000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path, geojson_path = synthetic_points(tmp, args.points)
+        measure("points csv", csv_path, args.runs)
+        measure("points geojson", geojson_path, args.runs)
+        measure("polygon", synthetic_polygon(tmp, args.vertices), args.runs)
+
+
+if __name__ == "__main__":
+    main()
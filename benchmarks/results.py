@@ -0,0 +1,114 @@
+"""Compare point results csv loading against naive csv parsing.
+
+Writes a synthetic MOD13Q1 point results csv and reads it back with the
+csv module into lists of Python values, the way ad hoc scripts do, and
+with appeears.results using the NumPy and, when pyarrow is installed,
+the Arrow engine. Layer values are decoded with fixed metadata so no
+network access is needed.
+
+    python benchmarks/results.py --rows 1000000
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from appeears import results  # noqa: E402
+
+METADATA = {
+    "MOD13Q1_061__250m_16_days_NDVI": {"DataType": "int16", "FillValue": -3000, "ScaleFactor": 0.0001},
+    "MOD13Q1_061__250m_16_days_EVI": {"DataType": "int16", "FillValue": -3000, "ScaleFactor": 0.0001},
+    "MOD13Q1_061__250m_16_days_VI_Quality": {"DataType": "uint16", "FillValue": 65535, "ScaleFactor": None},
+}
+
+HEADER = [
+    "ID", "Latitude", "Longitude", "Date", "MODIS_Tile",
+    "MOD13Q1_061_Line_Y_250m", "MOD13Q1_061_Sample_X_250m",
+    "MOD13Q1_061__250m_16_days_EVI", "MOD13Q1_061__250m_16_days_NDVI",
+    "MOD13Q1_061__250m_16_days_VI_Quality", "MOD13Q1_061__250m_16_days_VI_Quality_MODLAND",
+]
+
+
+def synthetic_csv(path, rows, seed=1):
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for i in range(rows):
+            fill = rng.random() < 0.02
+            writer.writerow([
+                f"point-{i % 1000}", f"{rng.uniform(-60, 60):.6f}", f"{rng.uniform(-180, 180):.6f}",
+                f"2018-{1 + i % 12:02d}-{1 + i % 28:02d}", "h08v05", rng.randint(0, 4799), rng.randint(0, 4799),
+                -3000 if fill else rng.randint(-2000, 10000), -3000 if fill else rng.randint(-2000, 10000),
+                rng.randint(0, 65534), "0b00",
+            ])
+
+
+# what ad hoc scripts do, a list of python values per column
+def naive(path):
+    columns = {name: [] for name in HEADER}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            for name in HEADER:
+                value = row[name]
+                if name in METADATA:
+                    value = int(value)
+                    value = None if value == METADATA[name]["FillValue"] else value * (
+                        METADATA[name]["ScaleFactor"] or 1)
+                elif name in ["Latitude", "Longitude"]:
+                    value = float(value)
+                columns[name].append(value)
+    return columns
+
+
+def measure(label, func, path, rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(path)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<28} {elapsed:8.2f} s  {rows / elapsed / 1e6:6.2f} M rows/s  peak {peak / 2 ** 20:8.1f} MiB")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="appeears results loading benchmark")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--chunk-rows", type=int, default=65536)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench-MOD13Q1-061-results.csv")
+        synthetic_csv(path, args.rows)
+        print(f"{args.rows} rows, {os.path.getsize(path) / 2 ** 20:.1f} MiB csv")
+
+        def streamed(engine):
+            def run(path):
+                for _ in results.iter_points(path, chunk_rows=args.chunk_rows,
+                                             metadata=METADATA, engine=engine):
+                    pass
+            return run
+
+        baseline = measure("csv.DictReader", naive, path, args.rows)
+        engines = ["numpy"] + (["arrow"] if results.have_pyarrow() else [])
+        for engine in engines:
+            elapsed = measure(f"iter_points {engine}", streamed(engine), path, args.rows)
+            print(f"{'':<28} {baseline / elapsed:8.1f} x faster")
+        if results.have_pyarrow():
+            out = os.path.join(tmp, "bench.parquet")
+            measure("write_parquet", lambda path: results.write_parquet(
+                path, out, metadata=METADATA), path, args.rows)
+            print(f"{'':<28} {os.path.getsize(out) / 2 ** 20:8.1f} MiB parquet")
+
+
+if __name__ == "__main__":
+    main()
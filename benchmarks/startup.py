@@ -0,0 +1,66 @@
+"""Measure appeears CLI startup time.
+
+Runs the CLI in fresh interpreters for commands which do not touch the
+network and prints the median wall clock time for each. Pass --max-ms to
+exit with an error when any median goes above the budget, for use in CI.
+
+    python benchmarks/startup.py --runs 20 --max-ms 100
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = [
+    ["--help"],
+    ["products", "--help"],
+    ["task-submit", "--help"],
+    ["download", "--help"],
+]
+
+
+def run_once(argv):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "appeears.appeears", "--no-version-check"] + argv,
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def baseline():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="appeears startup benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    interpreter = statistics.median(baseline() for _ in range(args.runs))
+    print(f"{'python -c pass':<32} {interpreter:8.1f} ms")
+    slow = []
+    for argv in COMMANDS:
+        run_once(argv)
+        median = statistics.median(run_once(argv) for _ in range(args.runs))
+        label = "appeears " + " ".join(argv)
+        print(f"{label:<32} {median:8.1f} ms  (+{median - interpreter:.1f} ms)")
+        if args.max_ms is not None and median > args.max_ms:
+            slow.append(label)
+    if slow:
+        sys.exit(f"Startup budget of {args.max_ms} ms exceeded: {', '.join(slow)}")
+
+
+if __name__ == "__main__":
+    main()
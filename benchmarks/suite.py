@@ -0,0 +1,171 @@
+"""End to end benchmarks against the local mock API.
+
+Starts appeears.mockserver with a fixed latency and bandwidth and
+measures, without network access:
+
+    startup     median wall clock time of appeears --help in a fresh interpreter
+    metadata    median latency of a product layer lookup that revalidates the cache
+    submit      tasks per second through tasksubmit, one after the other
+    submit_x    tasks per second of manifest rows submitted from a thread pool
+    download    MB per second of download_task for a synthetic bundle
+    resume      seconds for download_task to skip an already downloaded bundle
+
+Results can be written to a json file and compared against a previous
+run, exiting with an error when any metric got worse by more than the
+allowed share, so CI can catch regressions in download_task and
+tasksubmit.
+
+    python benchmarks/suite.py --output bench.json
+    python benchmarks/suite.py --compare bench.json --max-regression 0.25
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# keep tokens and cached metadata of the run out of the real home folder
+HOME = tempfile.mkdtemp(prefix="appeears-bench-")
+os.environ["HOME"] = HOME
+os.environ["USERPROFILE"] = HOME
+
+from appeears import appeears  # noqa: E402
+from appeears.mockserver import MockAppEEARS  # noqa: E402
+from startup import baseline, run_once  # noqa: E402
+
+# higher is better for these metrics, lower for the rest
+THROUGHPUT = ["submit", "submit_x", "download"]
+
+GEOMETRY = {
+    "type": "FeatureCollection",
+    "features": [{
+        "type": "Feature",
+        "properties": {},
+        "geometry": {"type": "Polygon", "coordinates": [[
+            [-104.1, 40.1], [-103.9, 40.1], [-103.9, 39.9], [-104.1, 39.9], [-104.1, 40.1]]]},
+    }],
+}
+
+
+def bench_startup(runs):
+    interpreter = statistics.median(baseline() for _ in range(runs))
+    run_once(["--help"])
+    return statistics.median(run_once(["--help"]) for _ in range(runs)) - interpreter
+
+
+def bench_metadata(calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        appeears.cached_metadata("product/MOD13Q1.061", refresh=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def bench_submit(tasks):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for n in range(tasks):
+            appeears.tasksubmit(name=f"bench {n}", product="MOD13Q1.061", input=GEOMETRY,
+                                start="2018-01-01", end="2018-12-31")
+    return tasks / (time.perf_counter() - start)
+
+
+def bench_submit_concurrent(tasks, workers):
+    row = {"name": "bench", "product": "MOD13Q1.061", "geometry": GEOMETRY,
+           "start": "2018-01-01", "end": "2018-12-31"}
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        list(pool.map(lambda n: appeears.submit_manifest_row(dict(row, name=f"bench {n}")), range(tasks)))
+    return tasks / (time.perf_counter() - start)
+
+
+def bench_download(tid, size, workers):
+    with tempfile.TemporaryDirectory() as dest:
+        start = time.perf_counter()
+        appeears.download_task(tid, dest, workers=workers)
+        download = size / 2 ** 20 / (time.perf_counter() - start)
+        start = time.perf_counter()
+        appeears.download_task(tid, dest, workers=workers)
+        resume = time.perf_counter() - start
+    return download, resume
+
+
+def compare(results, previous, max_regression):
+    worse = []
+    for name, value in results.items():
+        if name not in previous or not previous[name]:
+            continue
+        if name in THROUGHPUT:
+            change = (previous[name] - value) / previous[name]
+        else:
+            change = (value - previous[name]) / previous[name]
+        print(f"{name:<10} {previous[name]:10.2f} -> {value:10.2f}  {-change:+.0%}")
+        if change > max_regression:
+            worse.append(name)
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="appeears end to end benchmarks")
+    parser.add_argument("--runs", type=int, default=5, help="CLI starts to time")
+    parser.add_argument("--calls", type=int, default=50, help="Metadata lookups to time")
+    parser.add_argument("--tasks", type=int, default=50, help="Tasks to submit")
+    parser.add_argument("--files", type=int, default=40, help="Files in the synthetic bundle")
+    parser.add_argument("--file-size", type=int, default=2 * 2 ** 20, help="Bytes per file")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds added to every response")
+    parser.add_argument("--bandwidth", type=float, default=None, help="Bytes per second shared by all transfers")
+    parser.add_argument("--output", default=None, help="Write the results to this json file")
+    parser.add_argument("--compare", default=None, help="Json file of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.5,
+                        help="Allowed share a metric may get worse before failing, default 0.5")
+    args = parser.parse_args()
+
+    with open(os.path.join(HOME, "appeears.json"), "w") as outfile:
+        json.dump({"username": "bench", "password": "bench"}, outfile)
+    with MockAppEEARS(latency=args.latency, bandwidth=args.bandwidth, seed=1) as server:
+        appeears.set_api_url(server.url)
+        # measure the client, not the politeness limit kept towards NASA
+        appeears.shared_client = appeears.AppEEARSClient(
+            governor=appeears.RequestGovernor(rate=1e6, burst=1e6))
+        tid = server.add_synthetic_task(args.files, args.file_size)
+        results = {"startup": bench_startup(args.runs)}
+        print(f"{'startup':<10} {results['startup']:10.2f} ms over python -c pass")
+        results["metadata"] = bench_metadata(args.calls)
+        print(f"{'metadata':<10} {results['metadata']:10.2f} ms per product layer lookup")
+        results["submit"] = bench_submit(args.tasks)
+        print(f"{'submit':<10} {results['submit']:10.2f} tasks/s with tasksubmit")
+        results["submit_x"] = bench_submit_concurrent(args.tasks, args.workers)
+        print(f"{'submit_x':<10} {results['submit_x']:10.2f} tasks/s from {args.workers} threads")
+        results["download"], results["resume"] = bench_download(
+            tid, args.files * args.file_size, args.workers)
+        print(f"{'download':<10} {results['download']:10.2f} MB/s for {args.files} files")
+        print(f"{'resume':<10} {results['resume']:10.2f} s to skip the downloaded bundle")
+        print(f"server: {server.stats}")
+
+    if args.output is not None:
+        with open(args.output, "w") as outfile:
+            json.dump(results, outfile, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as json_file:
+            worse = compare(results, json.load(json_file), args.max_regression)
+        if worse:
+            sys.exit(f"Regressed by more than {args.max_regression:.0%}: {', '.join(worse)}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(HOME, ignore_errors=True)
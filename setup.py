@@ -16,10 +16,19 @@ setuptools.setup(
         "tqdm >= 4.56.0",
         "requests >= 2.28.1",
         "natsort >= 8.1.0",
-        "beautifulsoup4>=4.11.1",
         "tabulate >= 0.8.9",
         "PyGeoj==1.0.0"
     ],
+    extras_require={
+        "async": ["aiohttp >= 3.8.0"],
+        "results": ["numpy >= 1.17.0"],
+        "parquet": ["numpy >= 1.17.0", "pyarrow >= 4.0.0"],
+        "stack": ["numpy >= 1.17.0", "rasterio >= 1.2.0"],
+        "zarr": ["numpy >= 1.17.0", "rasterio >= 1.2.0", "zarr >= 2.10.0"],
+        "netcdf": ["numpy >= 1.17.0", "rasterio >= 1.2.0", "netCDF4 >= 1.5.0"],
+        "geometry": ["numpy >= 1.17.0"],
+        "s3": ["boto3 >= 1.20.0"],
+    },
     license="Apache 2.0",
     long_description=open("README.md").read(),
     long_description_content_type="text/markdown",
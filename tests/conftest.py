@@ -0,0 +1,34 @@
+import itertools
+
+import pytest
+
+from appeears import appeears
+from appeears.appeears import AppEEARSClient, RequestGovernor, RetryPolicy
+from appeears.mockserver import MockAppEEARS
+
+
+# keep tokens, caches and state of a test under its tmp_path, tokens are
+# handed out as token1, token2, ... without asking for credentials
+@pytest.fixture
+def isolated(tmp_path, monkeypatch):
+    for name in ["api_url", "token_cache", "cache_dir", "product_index_file", "shared_client"]:
+        monkeypatch.setattr(appeears, name, getattr(appeears, name))
+    monkeypatch.setattr(appeears, "state_dir", str(tmp_path / "state"))
+    tokens = (f"token{n}" for n in itertools.count(1))
+    monkeypatch.setattr(appeears, "tokenizer", lambda stale=None: next(tokens))
+    return tmp_path
+
+
+@pytest.fixture
+def server(isolated):
+    with MockAppEEARS() as mock:
+        appeears.set_api_url(mock.url)
+        yield mock
+
+
+# client retrying quickly so fault tests stay fast
+@pytest.fixture
+def client(server):
+    client = AppEEARSClient(governor=RequestGovernor(RetryPolicy(retries=3, backoff=0.01)))
+    appeears.shared_client = client
+    return client
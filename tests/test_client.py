@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from appeears.appeears import (AppEEARSClient, AppEEARSError, AsyncAppEEARSClient,
+                               CircuitOpenError, RequestGovernor, RetryPolicy)
+from appeears.mockserver import MockAppEEARS
+
+
+def test_expired_token_is_refreshed_once(server, client):
+    server.add_task({}, task_name="field")
+    server.revoked.add("token1")
+    assert [task["task_name"] for task in client.tasks()] == ["field"]
+    assert client.token == "token2"
+
+
+def test_second_rejected_token_is_an_error(server, client):
+    server.revoked.update(["token1", "token2"])
+    with pytest.raises(AppEEARSError) as error:
+        client.tasks()
+    assert error.value.status_code == 401
+
+
+def test_unavailable_responses_are_retried(isolated):
+    with MockAppEEARS(fail_rate=0.5, fail_statuses=(503,), seed=3) as server:
+        client = AppEEARSClient(
+            server.url, governor=RequestGovernor(RetryPolicy(retries=20, backoff=0.001)))
+        for _ in range(10):
+            assert client.products() == server.products
+    assert server.stats["faults"] > 0
+    assert client.governor.stats["retries"] == server.stats["faults"]
+
+
+def test_retries_stop_at_the_policy_limit(isolated):
+    with MockAppEEARS(fail_rate=1.0, fail_statuses=(503,)) as server:
+        client = AppEEARSClient(
+            server.url, governor=RequestGovernor(RetryPolicy(retries=2, backoff=0.001)))
+        with pytest.raises(AppEEARSError) as error:
+            client.products()
+    assert error.value.status_code == 503
+    assert server.stats["requests"] == 3
+
+
+def test_post_is_not_retried_on_server_error(isolated):
+    with MockAppEEARS(fail_rate=1.0, fail_statuses=(500,)) as server:
+        client = AppEEARSClient(
+            server.url, governor=RequestGovernor(RetryPolicy(retries=2, backoff=0.001)))
+        with pytest.raises(AppEEARSError):
+            client.submit({"task_type": "area", "task_name": "field", "params": {}})
+    assert server.stats["requests"] == 1
+
+
+def test_breaker_opens_per_endpoint(isolated):
+    with MockAppEEARS(fail_rate=1.0, fail_statuses=(500,)) as server:
+        governor = RequestGovernor(RetryPolicy(retries=0), threshold=3, cooldown=60)
+        client = AppEEARSClient(server.url, governor=governor)
+        for _ in range(3):
+            with pytest.raises(AppEEARSError):
+                client.products()
+        with pytest.raises(CircuitOpenError):
+            client.products()
+        assert server.stats["requests"] == 3
+        # other endpoints keep their own breaker
+        with pytest.raises(AppEEARSError) as error:
+            client.projections()
+        assert not isinstance(error.value, CircuitOpenError)
+    assert server.stats["requests"] == 4
+    assert governor.stats["circuit_open"] == 1
+
+
+def test_async_client_refreshes_token_and_retries(isolated):
+    pytest.importorskip("aiohttp")
+
+    async def tasks(url):
+        governor = RequestGovernor(RetryPolicy(retries=20, backoff=0.001))
+        async with AsyncAppEEARSClient(url, governor=governor) as client:
+            names = [task["task_name"] for task in await client.tasks()]
+            return names, client.token
+
+    with MockAppEEARS(fail_rate=0.3, fail_statuses=(503,), seed=1) as server:
+        server.add_task({}, task_name="field")
+        server.revoked.add("token1")
+        names, token = asyncio.run(tasks(server.url))
+    assert names == ["field"]
+    assert token == "token2"
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from appeears.appeears import task_payload
+from appeears.daemon import Daemon, JobQueue
+
+geometry = {
+    "type": "FeatureCollection",
+    "features": [{"type": "Feature", "properties": {},
+                  "geometry": {"type": "Polygon",
+                               "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}}],
+}
+
+row = {"name": "field", "product": "MOD13Q1.061", "geometry": geometry,
+       "start": "2020-01-01", "end": "2020-06-30"}
+
+
+@pytest.fixture
+def daemon(client, tmp_path):
+    queue = JobQueue(str(tmp_path / "daemon.sqlite"))
+    daemon = Daemon(queue, str(tmp_path / "out"), client=client, min_interval=0.05,
+                    max_interval=0.2)
+    yield daemon
+    daemon.close()
+    queue.close()
+
+
+# a job whose submission was posted before the daemon stopped
+def interrupted_job(daemon, server):
+    job_id = daemon.enqueue([row])[0]
+    job = daemon.queue.claim("queued", "submitting")[0]
+    daemon.queue.move(job_id, "submitting", submitted=time.time())
+    server.add_task({}, "field", "pending", params=job["payload"]["params"])
+    return job_id
+
+
+def test_recover_hands_held_jobs_back(daemon):
+    ids = daemon.queue.add([{"name": "a", "payload": {}}, {"name": "b", "task_id": "t1"},
+                            {"name": "c", "task_id": "t2"}])
+    daemon.queue.claim("queued", "submitting")
+    daemon.queue.move(ids[1], "processing", state="downloading")
+    daemon.queue.move(ids[2], "processing", state="verifying")
+    pending = daemon.queue.recover()
+    assert [job["job_id"] for job in pending] == [ids[0]]
+    assert [daemon.queue.get(job_id)["state"] for job_id in ids] == ["queued", "ready", "downloaded"]
+
+
+def test_interrupted_submission_is_adopted(daemon, server):
+    job_id = interrupted_job(daemon, server)
+    tid = next(iter(server.tasks))
+    daemon.queue.recover()
+    job = daemon.queue.claim("queued", "submitting")[0]
+    assert daemon.submit(job)["task_id"] == tid
+    assert len(server.tasks) == 1
+    assert daemon.queue.get(job_id)["state"] == "submitting"
+
+
+def test_task_with_other_dates_is_not_adopted(daemon, server):
+    job_id = daemon.enqueue([row])[0]
+    job = daemon.queue.claim("queued", "submitting")[0]
+    daemon.queue.move(job_id, "submitting", submitted=time.time())
+    other = task_payload("field", "MOD13Q1.061", geometry, "2021-01-01", "2021-06-30")
+    other_tid = server.add_task({}, "field", "pending", params=other["params"])
+    job = daemon.queue.get(job_id, payload=True)
+    assert daemon.submitted_task(job) is None
+    assert daemon.submit(job)["task_id"] != other_tid
+    assert len(server.tasks) == 2
+
+
+def test_ambiguous_submission_is_not_adopted(daemon, server):
+    job_id = interrupted_job(daemon, server)
+    job = daemon.queue.get(job_id, payload=True)
+    server.add_task({}, "field", "pending", params=job["payload"]["params"])
+    assert daemon.submitted_task(job) is None
+
+
+def test_restarted_daemon_completes_jobs(daemon, server, tmp_path):
+    interrupted_job(daemon, server)
+    tid = next(iter(server.tasks))
+    server.add_task({"MOD13Q1-061-Statistics.csv": b"File Name,Mean\n"}, "field", task_id=tid,
+                    params=server.tasks[tid]["params"])
+    thread = threading.Thread(target=daemon.run, kwargs={"tick": 0.05})
+    thread.start()
+    try:
+        deadline = time.time() + 20
+        while daemon.queue.counts() != {"complete": 1} and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        daemon.stop()
+        thread.join()
+    assert daemon.queue.counts() == {"complete": 1}
+    assert len(server.tasks) == 1
+    with open(str(tmp_path / "out" / tid / "MOD13Q1-061-Statistics.csv"), "rb") as f:
+        assert f.read() == b"File Name,Mean\n"
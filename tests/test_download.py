@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from appeears.appeears import (AsyncAppEEARSClient, IntegrityError, download_task,
+                               manifest_files, open_manifest)
+
+
+def bundle(server, size=300000):
+    data = os.urandom(size)
+    tid = server.add_task({"MOD13Q1.061__250m_16_days_NDVI_doy2020001_aid0001.tif": data})
+    return tid, next(iter(server.bundles[tid])), data
+
+
+def test_dropped_transfer_resumes_with_range(server, client, tmp_path):
+    server.drop_after = 100000
+    tid, file_id, data = bundle(server)
+    dest = tmp_path / "out"
+    download_task(tid, str(dest), client=client)
+    path = dest / "MOD13Q1.061__250m_16_days_NDVI_doy2020001_aid0001.tif"
+    assert path.read_bytes() == data
+    assert not os.path.exists(str(path) + ".part")
+    # the second request only asked for the bytes the first did not deliver
+    assert server.stats["bytes_sent"] < 100000 + len(data)
+
+
+def test_corrupt_part_file_is_removed(server, client, tmp_path):
+    tid, file_id, data = bundle(server)
+    dest = tmp_path / "out"
+    dest.mkdir()
+    path = dest / "MOD13Q1.061__250m_16_days_NDVI_doy2020001_aid0001.tif"
+    (dest / (path.name + ".part")).write_bytes(b"x" * 1000)
+    with pytest.raises(SystemExit):
+        download_task(tid, str(dest), client=client)
+    assert not (dest / (path.name + ".part")).exists()
+    assert not path.exists()
+    download_task(tid, str(dest), client=client)
+    assert path.read_bytes() == data
+
+
+def test_existing_files_are_adopted_into_the_manifest(server, client, tmp_path):
+    tid, file_id, data = bundle(server)
+    dest = tmp_path / "out"
+    dest.mkdir()
+    (dest / "MOD13Q1.061__250m_16_days_NDVI_doy2020001_aid0001.tif").write_bytes(data)
+    download_task(tid, str(dest), client=client)
+    assert server.stats["bytes_sent"] == 0
+    manifest = open_manifest(str(dest))
+    recorded = manifest_files(manifest, tid)
+    manifest.close()
+    assert recorded[file_id]["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_async_download_resumes_and_cleans_up(server, tmp_path):
+    pytest.importorskip("aiohttp")
+    tid, file_id, data = bundle(server)
+    filepath = str(tmp_path / "file.tif")
+
+    async def download(**kwargs):
+        async with AsyncAppEEARSClient(server.url) as client:
+            return await client.download(tid, file_id, filepath, **kwargs)
+
+    with open(filepath + ".part", "wb") as f:
+        f.write(data[:100000])
+    written, sha256 = asyncio.run(download(checksum=hashlib.sha256(data).hexdigest()))
+    assert written == len(data) - 100000
+    assert sha256 == hashlib.sha256(data).hexdigest()
+    with open(filepath, "rb") as f:
+        assert f.read() == data
+
+    with open(filepath + ".part", "wb") as f:
+        f.write(b"x" * 1000)
+    with pytest.raises(IntegrityError):
+        asyncio.run(download(checksum=hashlib.sha256(data).hexdigest()))
+    assert not os.path.exists(filepath + ".part")
+
+    # a part file longer than the file starts over
+    with open(filepath + ".part", "wb") as f:
+        f.write(os.urandom(len(data) + 10))
+    written, sha256 = asyncio.run(download())
+    assert written == len(data)
+    assert sha256 == hashlib.sha256(data).hexdigest()
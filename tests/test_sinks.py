@@ -0,0 +1,74 @@
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from appeears.appeears import download_task
+from appeears.mockserver import MockS3
+from appeears.sinks import MemorySink, SinkError, open_sink
+
+files = {
+    "MOD13Q1.061__250m_16_days_NDVI_doy2020001_aid0001.tif": os.urandom(200000),
+    "MOD13Q1.061__250m_16_days_NDVI_doy2020017_aid0001.tif": os.urandom(150000),
+    "MOD13Q1-061-Statistics.csv": b"File Name,Mean\n" * 100,
+}
+
+
+def archive_members(path):
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            assert archive.testzip() is None
+            return {name: archive.read(name) for name in archive.namelist()}
+    with tarfile.open(path) as archive:
+        return {member.name: archive.extractfile(member).read() for member in archive}
+
+
+# the server cuts every file once and then ignores the range request, so
+# every sink has to drop what it got and take the file from the start
+@pytest.mark.parametrize("name", ["out.tar", "out.tar.gz", "out.zip"])
+def test_archive_members_restart(server, client, tmp_path, name):
+    server.drop_after = 100000
+    server.ignore_range = True
+    tid = server.add_task(files)
+    path = str(tmp_path / name)
+    download_task(tid, path, client=client)
+    assert server.stats["bytes_sent"] > sum(len(data) for data in files.values())
+    assert archive_members(path) == files
+    # no part or spool files are left next to the archive
+    assert [entry for entry in os.listdir(str(tmp_path)) if entry != "state"] == [name]
+
+
+def test_memory_sink_restarts(server, client):
+    server.drop_after = 100000
+    server.ignore_range = True
+    tid = server.add_task(files)
+    sink = MemorySink()
+    download_task(tid, sink, client=client)
+    assert server.stats["bytes_sent"] > sum(len(data) for data in files.values())
+    assert sink.objects == files
+
+
+def test_s3_sink_restarts(server, client):
+    boto3 = pytest.importorskip("boto3")
+    server.drop_after = 100000
+    server.ignore_range = True
+    tid = server.add_task(files)
+    with MockS3() as s3:
+        s3_client = boto3.client("s3", endpoint_url=s3.url, aws_access_key_id="key",
+                                 aws_secret_access_key="secret", region_name="us-east-1")
+        download_task(tid, open_sink("s3://bucket/prefix", client=s3_client), client=client)
+        objects = {key: data for (bucket, key), data in s3.objects.items()}
+    assert objects == {f"prefix/{name}": data for name, data in files.items()}
+
+
+def test_failed_member_discards_the_archive(tmp_path):
+    path = str(tmp_path / "out.zip")
+    sink = open_sink(path)
+    writer = sink.open("a.csv", 10)
+    writer.write(b"12345")
+    writer.abort()
+    with pytest.raises(SinkError):
+        sink.open("b.csv", 10)
+    sink.close(ok=False)
+    assert os.listdir(str(tmp_path)) == []